@@ -0,0 +1,170 @@
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from time import perf_counter
+
+import sql_scripts as sql
+from db_conn import init_db_conn, init_db_pool
+from fraud_detecter import FraudDetecter
+from metrics import METRICS
+from psycopg2.pool import ThreadedConnectionPool
+from report_rules import REPORT_RULES
+from settings import (
+    BACKFILL_WORKERS,
+    CODE,
+    METRICS_JSONL,
+    METRICS_TEXTFILE,
+    REPORT_ENGINE,
+    SCHEMA,
+    SOURSE_SCHEMA,
+)
+from watcher import parse_date
+
+
+def day_range(start: str, end: str) -> list:
+    """
+    Функция для получения дней диапазона включительно
+
+    Args:
+        start (str) - первый день в формате DDMMYYYY\n
+        end (str) - последний день в формате DDMMYYYY\n
+
+    Returns:
+        list - дни в формате DDMMYYYY
+    """
+    first, last = parse_date(start), parse_date(end)
+    if last < first:
+        raise ValueError(f"Последний день {end} раньше первого {start}")
+    return [
+        (first + timedelta(days=i)).strftime("%d%m%Y")
+        for i in range((last - first).days + 1)
+    ]
+
+
+def backfill_day(pool: ThreadedConnectionPool, load_date: str, rules: list) -> float:
+    """
+    Функция для пересчета отчета за один день в отдельном подключении из пула.
+    Строки признаков за день заменяются одной транзакцией. Операции до начала дня,
+    нужные признакам, берутся из таблицы фактов, поэтому дни не зависят друг от друга
+
+    Args:
+        pool (ThreadedConnectionPool) - пул подключений\n
+        load_date (str) - день в формате DDMMYYYY\n
+        rules (list) - пересчитываемые признаки\n
+
+    Returns:
+        float - время пересчета в секундах
+    """
+    start = perf_counter()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as curs:
+            worker = FraudDetecter(
+                conn, curs, CODE, SCHEMA, SOURSE_SCHEMA, init_tables=False
+            )
+            worker.load_date = load_date
+            with METRICS.stage("backfill_day", "rep_fraud", load_date):
+                worker.insert_rep_fraud(rules, stream_reported=False)
+                worker.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+    return perf_counter() - start
+
+
+def backfill(fd: FraudDetecter, days: list, rules: list, workers: int) -> list:
+    """
+    Функция для пересчета отчета за дни параллельно в workers потоках.
+    Данные клиентов по всем картам, секции и индексы отчета готовятся заранее в основном подключении,
+    чтобы потоки не создавали их одновременно
+
+    Args:
+        fd (FraudDetecter) - объект с основным подключением\n
+        days (list) - дни в формате DDMMYYYY\n
+        rules (list) - пересчитываемые признаки\n
+        workers (int) - количество потоков\n
+
+    Returns:
+        list - дни, пересчет которых завершился ошибкой
+    """
+    # история пересчитывается по всем картам банка, в том числе удаленным с прошлого обновления
+    fd.refresh_card_clients(full=True)
+    fd.init_rep_fraud(
+        f"(select generate_series({sql.day_start(days[0])}, {sql.day_start(days[-1])}, "
+        "interval '1 day') as event_dt) as days"
+    )
+    fd.commit()
+
+    failed = []
+    pool = init_db_pool(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(backfill_day, pool, load_date, rules): load_date
+                for load_date in days
+            }
+            for future in as_completed(futures):
+                load_date = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as exc:
+                    # остальные дни пересчитываются, день с ошибкой можно запустить заново
+                    failed.append(load_date)
+                    print(f"День {load_date} не пересчитан: {exc}")
+                    continue
+                print(f"День {load_date} пересчитан за {seconds:.3f} с")
+    finally:
+        pool.closeall()
+
+    sql.analyze(fd.curs, f"{fd.full_code}_rep_fraud")
+    fd.commit()
+    return sorted(failed, key=parse_date)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Пересчет отчета мошенников за диапазон дней. Строки признаков за каждый день "
+        "заменяются целиком, повторный запуск не создает дублей"
+    )
+    parser.add_argument("start", help="первый день в формате DDMMYYYY")
+    parser.add_argument("end", help="последний день в формате DDMMYYYY")
+    parser.add_argument(
+        "--rules",
+        nargs="+",
+        choices=list(REPORT_RULES),
+        help="пересчитать только эти признаки, по умолчанию все",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BACKFILL_WORKERS,
+        help="количество потоков, каждый со своим подключением",
+    )
+    args = parser.parse_args()
+    if args.rules and REPORT_ENGINE == "separate":
+        parser.error("признаки можно выбрать только при REPORT_ENGINE = 'fused'")
+    rules = [REPORT_RULES[name] for name in args.rules or REPORT_RULES]
+
+    try:
+        days = day_range(args.start, args.end)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    start = perf_counter()
+    conn, curs = init_db_conn()
+    with FraudDetecter(
+        conn, curs, CODE, SCHEMA, SOURSE_SCHEMA, init_tables=False
+    ) as fd:
+        failed = backfill(fd, days, rules, max(args.workers, 1))
+    METRICS.flush(METRICS_JSONL, METRICS_TEXTFILE)
+
+    print(
+        f"Пересчитано дней: {len(days) - len(failed)} из {len(days)} "
+        f"за {perf_counter() - start:.3f} с"
+    )
+    if failed:
+        print(f"Дни с ошибкой: {' '.join(failed)}")
+        sys.exit(1)
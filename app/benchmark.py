@@ -0,0 +1,307 @@
+import json
+import os
+import tempfile
+from contextlib import nullcontext
+from datetime import datetime
+from time import perf_counter
+
+import settings
+from db_conn import init_db_conn
+from fraud_detecter import FraudDetecter
+from generate_data import FRAUD_TYPES, build_parser, generator_from_args, write_bank
+from metrics import METRICS
+from plans import PLANS
+from psycopg2.extensions import cursor
+from settings import (
+    CODE,
+    EXPLAIN_PLANS,
+    METRICS_JSONL,
+    METRICS_TEXTFILE,
+    PLANS_BASELINE,
+    PLANS_DIR,
+    SCHEMA,
+    BENCHMARK_SOURSE_SCHEMA,
+    UNIT_OF_WORK,
+)
+
+# настройки подключения не попадают в результаты
+PRIVATE_SETTINGS = ("DATABASE", "HOST", "USER", "PASSWORD", "PORT")
+
+
+def code_relations(curs: cursor) -> list:
+    """
+    Функция для получения таблиц и представлений с личным кодом в схеме загрузки
+
+    Args:
+        curs (cursor) - объект курсора базы данных
+
+    Returns:
+        list - пары из полного названия и вида: r или p для таблиц, v для представлений
+    """
+    curs.execute(
+        """
+        select n.nspname || '.' || c.relname, c.relkind
+        from pg_class c
+        inner join pg_namespace n on n.oid = c.relnamespace
+        where n.nspname = %s
+            and c.relname like %s
+            and c.relkind in ('r', 'p', 'v')
+            and not c.relispartition
+        """,
+        (SCHEMA, f"{CODE.lower()}\\_%"),
+    )
+    return curs.fetchall()
+
+
+def reset_tables(curs: cursor) -> None:
+    """Функция для удаления таблиц и представлений с личным кодом перед запуском"""
+    # представления удаляются вместе с таблицами, поэтому сначала удаляем их сами
+    for relation, relkind in sorted(code_relations(curs), key=lambda r: r[1] != "v"):
+        kind = "view" if relkind == "v" else "table"
+        curs.execute(f"drop {kind} if exists {relation} cascade")
+
+
+def report_rows(curs: cursor, full_code: str) -> int:
+    """Функция для подсчета строк в таблице отчетов. До первого отчета таблицы еще нет"""
+    curs.execute("select to_regclass(%s)", (f"{full_code}_rep_fraud",))
+    if curs.fetchone()[0] is None:
+        return 0
+    curs.execute(f"select count(*) from {full_code}_rep_fraud")
+    return curs.fetchone()[0]
+
+
+def run_days(fd: FraudDetecter, files: dict) -> list:
+    """
+    Функция для загрузки всех сгенерированных дней с замером каждого шага.
+    Файлы дня загружаются последовательно, чтобы время каждого типа файлов было отдельным
+
+    Args:
+        fd (FraudDetecter) - объект для загрузки данных и составления отчета\n
+        files (dict) - количество строк по названиям файлов\n
+
+    Returns:
+        list - замеры по дням: время и количество строк каждого шага
+    """
+    days = {}
+    for file_name in files:
+        fdate = file_name.rsplit("_", 1)[1].split(".")[0]
+        days.setdefault(fdate, []).append((file_name, fdate))
+
+    results = []
+    for fdate, date_group in sorted(
+        days.items(), key=lambda item: datetime.strptime(item[0], "%d%m%Y")
+    ):
+        stages = {}
+        day_start = perf_counter()
+        start = perf_counter()
+        parsed = fd.parse_data(date_group)
+        stages["parse"] = {
+            "seconds": perf_counter() - start,
+            "rows": sum(len(df) for df in parsed.values()),
+        }
+        with fd.unit_of_work() if UNIT_OF_WORK else nullcontext():
+            for file_name, _ in date_group:
+                start = perf_counter()
+                fd.load_file(file_name, fdate, parsed.get(file_name))
+                stages[f"load_{file_name.rsplit('_', 1)[0]}"] = {
+                    "seconds": perf_counter() - start,
+                    "rows": files[file_name],
+                }
+            before = report_rows(fd.curs, fd.full_code)
+            start = perf_counter()
+            fd.rep_fraud()
+            stages["rep_fraud"] = {
+                "seconds": perf_counter() - start,
+                "rows": report_rows(fd.curs, fd.full_code) - before,
+            }
+        results.append(
+            {"date": fdate, "seconds": perf_counter() - day_start, "stages": stages}
+        )
+    return results
+
+
+def summarize(days: list) -> dict:
+    """
+    Функция для сведения замеров дней по шагам: суммарное время, строки в секунду
+    и задержка шага за день
+
+    Args:
+        days (list) - замеры по дням
+
+    Returns:
+        dict - показатели по шагам и по дню целиком
+    """
+    summary = {}
+    for day in days:
+        for stage, values in {
+            **day["stages"],
+            "day": {"seconds": day["seconds"], "rows": None},
+        }.items():
+            item = summary.setdefault(stage, {"seconds": 0.0, "rows": 0, "latency": []})
+            item["seconds"] += values["seconds"]
+            item["rows"] = (
+                None if values["rows"] is None else item["rows"] + values["rows"]
+            )
+            item["latency"].append(values["seconds"])
+    for item in summary.values():
+        latency = sorted(item.pop("latency"))
+        item["rows_per_s"] = (
+            item["rows"] / item["seconds"] if item["rows"] and item["seconds"] else None
+        )
+        item["latency_avg"] = sum(latency) / len(latency)
+        item["latency_max"] = latency[-1]
+    return summary
+
+
+def recall(curs: cursor, full_code: str, planted: list) -> dict:
+    """
+    Функция для проверки, какие заложенные мошеннические операции попали в отчет
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        planted (list) - заложенные операции\n
+
+    Returns:
+        dict - по каждому признаку: заложено, найдено, полнота и лишние срабатывания
+    """
+    curs.execute(
+        f"""
+        select distinct
+            to_char(event_dt, 'YYYY-MM-DD HH24:MI:SS'),
+            trim(passport),
+            event_type
+        from {full_code}_rep_fraud
+        """
+    )
+    reported = set(curs.fetchall())
+    expected = {(p["event_dt"], p["passport"], p["event_type"]) for p in planted}
+    result = {}
+    for fraud_type, event_type in FRAUD_TYPES.items():
+        type_expected = {e for e in expected if e[2] == event_type}
+        type_reported = {e for e in reported if e[2] == event_type}
+        found = len(type_expected & type_reported)
+        result[fraud_type] = {
+            "planted": len(type_expected),
+            "found": found,
+            "recall": found / len(type_expected) if type_expected else None,
+            "extra": len(type_reported - type_expected),
+        }
+    return result
+
+
+def print_report(result: dict, previous: dict = None) -> None:
+    """
+    Функция для вывода результатов запуска и сравнения с предыдущим запуском с теми же параметрами
+
+    Args:
+        result (dict) - результаты запуска\n
+        previous (dict = None) (optional) - результаты предыдущего запуска\n
+
+    Returns:
+        None
+    """
+    print(
+        f"{'шаг':<28}{'время, с':>10}{'строк/с':>12}{'макс. за день, с':>18}{'изм.':>9}"
+    )
+    for stage, item in result["stages"].items():
+        rate = f"{item['rows_per_s']:.0f}" if item["rows_per_s"] else "-"
+        change = ""
+        if previous and stage in previous["stages"]:
+            before = previous["stages"][stage]["seconds"]
+            change = f"{(item['seconds'] - before) / before:+.0%}" if before else ""
+        print(
+            f"{stage:<28}{item['seconds']:>10.3f}{rate:>12}"
+            f"{item['latency_max']:>18.3f}{change:>9}"
+        )
+    for fraud_type, item in result["recall"].items():
+        recall_str = f"{item['recall']:.0%}" if item["recall"] is not None else "-"
+        print(
+            f"{FRAUD_TYPES[fraud_type]}: найдено {item['found']} из {item['planted']} "
+            f"({recall_str}), лишних {item['extra']}"
+        )
+
+
+def load_previous(results_path: str, params: dict) -> dict:
+    """Функция для поиска последнего сохраненного запуска с теми же параметрами"""
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            result = json.loads(line)
+            if result["params"] == params:
+                previous = result
+    return previous
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    parser.description = (
+        "Сквозной бенчмарк загрузки и отчета на сгенерированных данных. "
+        f"Пересоздает схему {BENCHMARK_SOURSE_SCHEMA} и таблицы с личным кодом, запускать только на локальной базе"
+    )
+    parser.add_argument(
+        "--results",
+        default=os.path.abspath("benchmark_results.jsonl"),
+        help="файл для накопления результатов запусков",
+    )
+    parser.add_argument(
+        "--workdir", default=None, help="папка для сгенерированных файлов"
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="удалить существующие таблицы с личным кодом перед запуском",
+    )
+    args = parser.parse_args()
+    params = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("results", "workdir", "reset")
+    }
+    results_path = os.path.abspath(args.results)
+
+    conn, curs = init_db_conn()
+    if code_relations(curs) and not args.reset:
+        raise SystemExit(
+            f"В схеме {SCHEMA} уже есть таблицы {CODE}, запустите с --reset на локальной базе"
+        )
+    reset_tables(curs)
+    curs.execute(f"create schema if not exists {SCHEMA}")
+
+    # файлы генерируются в папку data внутри рабочей папки, как их ищет загрузка
+    workdir = args.workdir or tempfile.mkdtemp(prefix="fraud_bench_")
+    start = perf_counter()
+    dataset = generator_from_args(args).generate(os.path.join(workdir, "data"))
+    # клиенты банка пишутся в отдельную схему, таблицы SOURSE_SCHEMA не изменяются
+    write_bank(curs, BENCHMARK_SOURSE_SCHEMA, dataset)
+    conn.commit()
+    generate_seconds = perf_counter() - start
+    print(f"Данные сгенерированы в {workdir} за {generate_seconds:.3f} с")
+
+    os.chdir(workdir)
+    with FraudDetecter(conn, curs, CODE, SCHEMA, BENCHMARK_SOURSE_SCHEMA) as fd:
+        days = run_days(fd, dataset.files)
+        result = {
+            "started_at": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+            "params": params,
+            "settings": {
+                key: getattr(settings, key)
+                for key in dir(settings)
+                if key.isupper() and key not in PRIVATE_SETTINGS
+            },
+            "generate_seconds": generate_seconds,
+            "stages": summarize(days),
+            "days": days,
+            "recall": recall(curs, fd.full_code, dataset.planted),
+        }
+
+    METRICS.flush(METRICS_JSONL, METRICS_TEXTFILE)
+    if EXPLAIN_PLANS:
+        PLANS.flush(PLANS_DIR, PLANS_BASELINE)
+    previous = load_previous(results_path, params)
+    print_report(result, previous)
+    with open(results_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+    print(f"Результаты добавлены в {results_path}")
@@ -1,6 +1,12 @@
 import psycopg2
 from psycopg2.extensions import connection, cursor
-from settings import DATABASE, HOST, PASSWORD, PORT, USER
+from metrics import InstrumentedCursor
+from plans import ExplainCursor
+from psycopg2.pool import ThreadedConnectionPool
+from settings import DATABASE, EXPLAIN_PLANS, HOST, PASSWORD, PORT, USER
+
+# курсоры замеряют каждый запрос, в режиме диагностики еще и сохраняют планы
+CURSOR_FACTORY = ExplainCursor if EXPLAIN_PLANS else InstrumentedCursor
 
 
 def init_db_conn() -> tuple[connection, cursor]:
@@ -11,10 +17,39 @@ def init_db_conn() -> tuple[connection, cursor]:
         tuple[connection, cursor] - кортеж с подключением и курсором к базе данных
     """
     conn = psycopg2.connect(
-        database=DATABASE, host=HOST, user=USER, password=PASSWORD, port=PORT
+        database=DATABASE,
+        host=HOST,
+        user=USER,
+        password=PASSWORD,
+        port=PORT,
+        cursor_factory=CURSOR_FACTORY,
     )
     # Отключение автокоммита
     conn.autocommit = False
     cursor = conn.cursor()
 
     return conn, cursor
+
+
+def init_db_pool(maxconn: int) -> ThreadedConnectionPool:
+    """
+    Функция для иницилизации пула подключений к базе данных используя параметры из файла настроек.
+    Пул можно использовать из нескольких потоков, каждый поток берет свое подключение
+
+    Args:
+        maxconn (int) - максимальное количество подключений в пуле
+
+    Returns:
+        ThreadedConnectionPool - пул подключений к базе данных
+    """
+    # подключения из пула создаются с отключенным автокоммитом
+    return ThreadedConnectionPool(
+        1,
+        maxconn,
+        database=DATABASE,
+        host=HOST,
+        user=USER,
+        password=PASSWORD,
+        port=PORT,
+        cursor_factory=CURSOR_FACTORY,
+    )
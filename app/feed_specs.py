@@ -0,0 +1,314 @@
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+import pandas as pd
+from openpyxl import load_workbook
+from settings import DIM_PREFIX, FACT_PREFIX, XLSX_READER
+
+
+@dataclass(frozen=True)
+class FeedSpec:
+    """
+    Описание типа загружаемых файлов.
+
+    Args:
+        name (str) - название типа файлов и таблицы, например terminals\n
+        fields_dtype (dict) - словарь с полями и типами данных в порядке столбцов файла\n
+        pk (str) - первичный ключ в таблице\n
+        prefix (str) - префикс таргет таблицы\n
+        mode (str) - способ загрузки в таргет таблицу: scd, append или cumulative\n
+        file_format (str) - расширение файла: txt или xlsx\n
+        delimiter (str) - разделитель столбцов в txt файле\n
+        decimal_sep (str) - разделитель дробной части в decimal полях\n
+        timestamp_format (str) - формат timestamp полей в файле\n
+        trim_fields (tuple) - поля, у которых нужно обрезать пробелы по краям\n
+        indexes (tuple) - дополнительные индексы таргет таблицы, каждый - кортеж полей или выражений\n
+        partition_by (str) - поле для секционирования таргет таблицы по диапазонам дат\n
+        watermark (str) - поле даты записи для накопительных файлов, дозаписываются только записи
+            не старше последнего загруженного значения\n
+    """
+
+    name: str
+    fields_dtype: dict
+    pk: str
+    prefix: str
+    mode: str
+    file_format: str
+    delimiter: str = ";"
+    decimal_sep: str = ","
+    timestamp_format: str = "%Y-%m-%d %H:%M:%S"
+    trim_fields: tuple = field(default_factory=tuple)
+    indexes: tuple = field(default_factory=tuple)
+    partition_by: str = None
+    watermark: str = None
+
+    @property
+    def fields(self) -> list:
+        """Список полей в порядке столбцов файла"""
+        return list(self.fields_dtype)
+
+    @property
+    def target_indexes(self) -> tuple:
+        """Индексы таргет таблицы. Для scd и накопительных таблиц всегда есть индекс по ключу и effective_to"""
+        if self.mode in ("scd", "cumulative"):
+            return ((self.pk, "effective_to"),) + self.indexes
+        return self.indexes
+
+    def converters(self) -> dict:
+        """
+        Функция для создания преобразователей столбцов по типам данных полей
+
+        Returns:
+            dict - словарь с полями и функциями, преобразующими столбец целиком
+        """
+        converters = {}
+        for field_name, dtype in self.fields_dtype.items():
+            if dtype.startswith("decimal"):
+                converters[field_name] = decimal_converter(self.decimal_sep)
+            elif dtype.startswith("timestamp"):
+                converters[field_name] = timestamp_converter(self.timestamp_format)
+            elif dtype == "date":
+                converters[field_name] = date_converter
+            elif field_name in self.trim_fields:
+                converters[field_name] = trim_converter
+        return converters
+
+    def convert(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Функция для приведения столбцов датафрейма к типам полей
+
+        Args:
+            df (pd.DataFrame) - датафрейм со столбцами, названными по полям
+
+        Returns:
+            pd.DataFrame - тот же датафрейм с преобразованными столбцами
+        """
+        for field_name, converter in self.converters().items():
+            df[field_name] = converter(df[field_name])
+        return df
+
+    def read_dtypes(self) -> dict:
+        """Словарь типов для чтения файла. Текстовые и decimal поля читаются строками"""
+        return {
+            field_name: str
+            for field_name, dtype in self.fields_dtype.items()
+            if dtype.startswith(("varchar", "char", "text", "decimal"))
+        }
+
+    def read(self, file_path: str) -> pd.DataFrame:
+        """
+        Функция для чтения файла целиком в датафрейм с типизированными столбцами
+
+        Args:
+            file_path (str) - путь к файлу
+
+        Returns:
+            pd.DataFrame - датафрейм со столбцами, названными по полям
+        """
+        if self.file_format == "xlsx" and XLSX_READER == "openpyxl":
+            df = self.read_xlsx(file_path)
+        elif self.file_format == "xlsx":
+            df = pd.read_excel(
+                file_path, header=0, names=self.fields, dtype=self.read_dtypes()
+            )
+        elif self.file_format == "txt":
+            df = pd.read_csv(
+                file_path,
+                delimiter=self.delimiter,
+                header=0,
+                names=self.fields,
+                dtype=self.read_dtypes(),
+            )
+        else:
+            raise ValueError(f"Тип файлов {self.file_format} не поддерживается")
+        return self.convert(df)
+
+    def read_xlsx(self, file_path: str) -> pd.DataFrame:
+        """
+        Функция для чтения первого листа xlsx файла построчно в режиме только для чтения.
+        Значения собираются сразу по столбцам, без промежуточной таблицы ячеек
+
+        Args:
+            file_path (str) - путь к файлу
+
+        Returns:
+            pd.DataFrame - датафрейм со столбцами, названными по полям, до преобразования типов
+        """
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(
+                min_row=2, max_col=len(self.fields), values_only=True
+            )
+            # пустые строки в конце листа пропускаются, как в pd.read_excel
+            columns = list(
+                zip(*(row for row in rows if any(v is not None for v in row)))
+            )
+        finally:
+            workbook.close()
+        if not columns:
+            columns = [()] * len(self.fields)
+
+        text_fields = self.read_dtypes()
+        data = {}
+        for field_name, values in zip(self.fields, columns):
+            if field_name in text_fields:
+                data[field_name] = pd.Series(
+                    [xlsx_text(value) for value in values], dtype=str
+                )
+            else:
+                data[field_name] = pd.Series(values)
+        return pd.DataFrame(data)
+
+    def read_chunks(self, file_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Функция для чтения txt файла частями с типизированными столбцами
+
+        Args:
+            file_path (str) - путь к файлу\n
+            chunk_size (int) - количество строк в одной части\n
+
+        Returns:
+            Iterator[pd.DataFrame] - генератор датафреймов
+        """
+        if self.file_format != "txt":
+            raise ValueError(f"Потоковое чтение {self.file_format} не поддерживается")
+        chunks = pd.read_csv(
+            file_path,
+            delimiter=self.delimiter,
+            header=0,
+            names=self.fields,
+            dtype=self.read_dtypes(),
+            chunksize=chunk_size,
+        )
+        with chunks:
+            for df in chunks:
+                yield self.convert(df)
+
+
+def xlsx_text(value):
+    """Преобразователь значения ячейки в строку. Целые числа записываются без дробной части"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def decimal_converter(decimal_sep: str) -> Callable[[pd.Series], pd.Series]:
+    """Преобразователь decimal столбца с заданным разделителем дробной части"""
+
+    def convert(column: pd.Series) -> pd.Series:
+        if decimal_sep != ".":
+            column = column.str.replace(decimal_sep, ".", regex=False)
+        return pd.to_numeric(column)
+
+    return convert
+
+
+def timestamp_converter(timestamp_format: str) -> Callable[[pd.Series], pd.Series]:
+    """Преобразователь timestamp столбца с заданным форматом"""
+
+    def convert(column: pd.Series) -> pd.Series:
+        return pd.to_datetime(column, format=timestamp_format)
+
+    return convert
+
+
+def date_converter(column: pd.Series) -> pd.Series:
+    """Преобразователь date столбца"""
+    return pd.to_datetime(column).dt.normalize()
+
+
+def trim_converter(column: pd.Series) -> pd.Series:
+    """Преобразователь текстового столбца с обрезкой пробелов по краям"""
+    return column.str.strip()
+
+
+# реестр типов загружаемых файлов
+FEED_SPECS = {
+    spec.name: spec
+    for spec in (
+        FeedSpec(
+            name="terminals",
+            fields_dtype={
+                "terminal_id": "varchar(100)",
+                "terminal_type": "varchar(100)",
+                "terminal_city": "varchar(100)",
+                "terminal_address": "varchar(100)",
+            },
+            pk="terminal_id",
+            prefix=DIM_PREFIX,
+            mode="scd",
+            file_format="xlsx",
+            # поиск версии терминала на день операции
+            indexes=(("terminal_id", "effective_from"),),
+        ),
+        FeedSpec(
+            name="transactions",
+            fields_dtype={
+                "trans_id": "varchar(200)",
+                "trans_date": "timestamp",
+                "amt": "decimal(8, 3)",
+                "card_num": "varchar(200)",
+                "oper_type": "varchar(200)",
+                "oper_result": "varchar(200)",
+                "terminal": "varchar(200)",
+            },
+            pk="trans_id",
+            prefix=FACT_PREFIX,
+            mode="append",
+            file_format="txt",
+            trim_fields=("card_num",),
+            # окна по карте для признаков мошенничества и выборка операций за день
+            indexes=(("card_num", "trans_date"), ("trans_date",), ("trans_id",)),
+            partition_by="trans_date",
+        ),
+        FeedSpec(
+            name="passport_blacklist",
+            fields_dtype={"entry_dt": "date", "passport_num": "varchar(200)"},
+            pk="passport_num",
+            prefix=FACT_PREFIX,
+            # файл накапливается с начала месяца, дозаписываются только новые записи
+            mode="cumulative",
+            file_format="xlsx",
+            # поиск паспорта клиента в черном списке и водяной знак последней загрузки
+            indexes=(("trim(passport_num)",), ("entry_dt",)),
+            watermark="entry_dt",
+        ),
+    )
+}
+
+
+def get_feed_spec(table_name: str) -> FeedSpec:
+    """
+    Функция для получения описания типа файлов по названию таблицы
+
+    Args:
+        table_name (str) - название таблицы из имени файла
+
+    Returns:
+        FeedSpec - описание типа файлов
+    """
+    try:
+        return FEED_SPECS[table_name]
+    except KeyError:
+        raise ValueError(f"Тип файлов {table_name} не поддерживается") from None
+
+
+def get_file_spec(file_name: str) -> FeedSpec:
+    """
+    Функция для получения описания типа файлов по названию файла вида table_DDMMYYYY.ext
+
+    Args:
+        file_name (str) - название файла
+
+    Returns:
+        FeedSpec - описание типа файлов
+    """
+    # получаем название таблицы и расширение файла
+    table_name, date_ext = file_name.rsplit("_", 1)
+    f_ext = date_ext.rsplit(".", 1)[1]
+    spec = get_feed_spec(table_name)
+    if f_ext != spec.file_format:
+        raise ValueError(f"Тип файлов {f_ext} не поддерживается для {table_name}")
+    return spec
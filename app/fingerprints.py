@@ -0,0 +1,66 @@
+import hashlib
+
+import pandas as pd
+
+# разделитель значений полей при расчете хэша строки
+FIELD_SEPARATOR = "\x1f"
+# значение пропуска при расчете хэша строки. не совпадает со строками nan, None и NaT
+MISSING_VALUE = "\x00"
+
+
+def file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    Функция для расчета хэша содержимого файла
+
+    Args:
+        file_path (str) - путь к файлу\n
+        block_size (int = 1024 * 1024) (optional) - размер блока чтения в байтах\n
+
+    Returns:
+        str - md5 хэш файла
+    """
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def row_hashes(df: pd.DataFrame, fields: list) -> pd.Series:
+    """
+    Функция для расчета хэша каждой строки датафрейма по значениям полей
+
+    Args:
+        df (pd.DataFrame) - датафрейм с типизированными данными из файла\n
+        fields (list) - список полей для хэша\n
+
+    Returns:
+        pd.Series - md5 хэши строк с индексом датафрейма
+    """
+    values = df[fields]
+    # пропуски None, NaN и NaT хэшируются одним значением в любой версии pandas
+    rows = (
+        values.astype(str)
+        .mask(values.isna(), MISSING_VALUE)
+        .agg(FIELD_SEPARATOR.join, axis=1)
+    )
+    return rows.map(lambda row: hashlib.md5(row.encode()).hexdigest())
+
+
+def diff(df: pd.DataFrame, pk: str, hashes: pd.Series, previous: dict) -> tuple:
+    """
+    Функция для поиска отличий снимка от предыдущего по хэшам строк
+
+    Args:
+        df (pd.DataFrame) - датафрейм с типизированными данными из файла\n
+        pk (str) - первичный ключ в таблице\n
+        hashes (pd.Series) - хэши строк датафрейма\n
+        previous (dict) - хэши строк предыдущего снимка по ключу\n
+
+    Returns:
+        tuple - датафрейм с новыми и измененными строками и список ключей удаленных строк
+    """
+    keys = df[pk].astype(str)
+    changed = keys.map(previous).ne(hashes)
+    deleted = list(previous.keys() - set(keys))
+    return df[changed].copy(), deleted
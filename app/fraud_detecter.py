@@ -1,13 +1,52 @@
-import pandas as pd
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import perf_counter
+
+import fingerprints as fp
+import parse_cache
 import sql_scripts as sql
+import pandas as pd
+from feed_specs import FeedSpec, get_file_spec
+from loaders import load_stg_source
+from report_rules import REPORT_RULES
+from metrics import METRICS, timed
+import psycopg2
 from psycopg2.extensions import connection, cursor
 from psycopg2.extras import execute_values
-from settings import DIM_PREFIX, FACT_PREFIX
+from psycopg2.pool import ThreadedConnectionPool
+from settings import (
+    AMOUNT_GUESS_MODE,
+    DIM_PREFIX,
+    FINGERPRINT_FEEDS,
+    PARSE_CACHE_DIR,
+    PARTITION_INTERVAL,
+    REP_FRAUD_PARTITIONED,
+    REPORT_ENGINE,
+    SCD_ENGINE,
+    STAGE_RETRIES,
+    STAGING_TABLE_KIND,
+    STG_LOADERS,
+    STREAM_CHUNK_SIZE,
+    STREAM_DETECTION,
+)
+from staging import StagingArea
+
+# индексы таблицы с отчетами. по времени и типу операции удаляется отчет за день
+# при пересчете и ищутся операции, уже найденные потоковой проверкой
+REP_FRAUD_INDEXES = (("report_dt",), ("event_dt", "event_type"))
 
 
 class FraudDetecter:
     def __init__(
-        self, conn: connection, curs: cursor, code: str, schema: str, sourse_schema: str
+        self,
+        conn: connection,
+        curs: cursor,
+        code: str,
+        schema: str,
+        sourse_schema: str,
+        pool: ThreadedConnectionPool = None,
+        init_tables: bool = True,
     ) -> None:
         """
         Класс для составления отчета мошеннических операций.
@@ -18,6 +57,8 @@ class FraudDetecter:
             code (str) - личный четырехбуквенный код\n
             schema (str) - название схемы для загрузки таблиц\n
             sourse_schema (str) - название схемы хранящей таблицы для отчетов\n
+            pool (ThreadedConnectionPool = None) (optional) - пул подключений для параллельной загрузки файлов\n
+            init_tables (bool = True) (optional) - флаг создания служебных таблиц\n
 
         Returns:
             None
@@ -27,123 +68,525 @@ class FraudDetecter:
         self.code = code
         self.schema = schema
         self.sourse_schema = sourse_schema
+        self.pool = pool
         self.load_date = None
+        # тип файлов, который загружается сейчас, для подписи замеров
+        self.feed = None
+        # флаг загрузки дня одной транзакцией, коммиты отдельных шагов не выполняются
+        self.in_unit = False
+        # время чтения файлов в секундах по названиям файлов
+        self.parse_seconds = {}
+        # режим продолжения прерванной загрузки и выполненные шаги по датам загрузки
+        self.resume = False
+        self.checkpoints = {}
         # формируем полный код для таблиц
         self.full_code = f"{self.schema}.{self.code}"
-        # создаем мета таблицу
-        sql.init_meta(self.curs, self.full_code)
-        self.conn.commit()
+        # временные таблицы создаются один раз и переиспользуются
+        self.staging = StagingArea(
+            self.curs, self.schema, self.code, STAGING_TABLE_KIND
+        )
+        self.stg_code = self.staging.stg_code
+        if init_tables:
+            # создаем мета таблицу
+            sql.init_meta(self.curs, self.full_code)
+            self.commit()
+
+    def commit(self) -> None:
+        """Функция для фиксации изменений. Внутри единицы работы фиксация откладывается до конца дня"""
+        if not self.in_unit:
+            with METRICS.stage("commit", self.feed, self.load_date, kind="commit"):
+                self.conn.commit()
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Контекстный менеджер для загрузки дня одной транзакцией.
+        Все файлы, мета таблица и отчет фиксируются одним коммитом или откатываются целиком
+        """
+        self.in_unit = True
+        try:
+            yield self
+            with METRICS.stage("commit", "day", self.load_date, kind="commit"):
+                self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            # откаченные временные таблицы нужно проверить заново
+            self.staging.reset()
+            raise
+        finally:
+            self.in_unit = False
+
+    def load_checkpoints(self) -> None:
+        """
+        Функция для включения режима продолжения прерванной загрузки. Выполненные шаги
+        читаются из мета таблицы и пропускаются, загрузка продолжается с первого невыполненного шага
+        """
+        self.checkpoints = sql.select_checkpoints(self.curs, self.full_code)
+        self.resume = True
+        self.commit()
+
+    def reset_checkpoints(self, load_date: str) -> None:
+        """Функция для удаления отметок шагов дня перед загрузкой дня заново. В режиме продолжения отметки сохраняются"""
+        if self.resume:
+            return
+        sql.delete_checkpoints(self.curs, self.full_code, load_date)
+        self.commit()
+
+    def done(self, stage: str, feed: str = None, load_date: str = None) -> bool:
+        """
+        Функция для проверки, что шаг загрузки выполнен в прерванной загрузке
+
+        Args:
+            stage (str) - шаг загрузки\n
+            feed (str = None) (optional) - тип файлов, по умолчанию загружаемый сейчас\n
+            load_date (str = None) (optional) - дата загрузки, по умолчанию текущая\n
 
-    def load_data(self, date_group: list) -> None:
+        Returns:
+            bool - True только в режиме продолжения для отмеченного шага
+        """
+        if not self.resume:
+            return False
+        checkpoints = self.checkpoints.get(load_date or self.load_date, ())
+        return (feed or self.feed, stage) in checkpoints
+
+    def checkpoint(self, stage: str, feed: str = None) -> None:
+        """
+        Функция для отметки выполненного шага загрузки. Отметка фиксируется тем же коммитом,
+        что и результат шага, поэтому отмеченный шаг не может оказаться выполненным наполовину
+
+        Args:
+            stage (str) - шаг загрузки\n
+            feed (str = None) (optional) - тип файлов, по умолчанию загружаемый сейчас\n
+
+        Returns:
+            None
+        """
+        sql.save_checkpoint(
+            self.curs, self.full_code, self.load_date, feed or self.feed, stage
+        )
+
+    def staged_reusable(self, table_name: str) -> bool:
+        """
+        Функция для проверки, что временная таблица с исходными данными пережила прерванную
+        загрузку: temp таблицы живут только в сессии, unlogged очищаются при сбое сервера
+        """
+        return sql.has_rows(self.curs, self.staging.table_name("source", table_name))
+
+    def run_stage(self, name: str, func, *args, **kwargs):
+        """
+        Функция для выполнения шага загрузки. Внутри единицы работы шаг выполняется
+        в точке сохранения и при временной ошибке базы откатывается только он и повторяется
+
+        Args:
+            name (str) - название шага, используется как имя точки сохранения\n
+            func - функция шага\n
+            *args, **kwargs - аргументы функции шага\n
+
+        Returns:
+            результат функции шага
+        """
+        if not self.in_unit:
+            return func(*args, **kwargs)
+
+        for attempt in range(STAGE_RETRIES + 1):
+            self.curs.execute(f"savepoint {name}")
+            try:
+                result = func(*args, **kwargs)
+            except psycopg2.OperationalError as exc:
+                self.curs.execute(f"rollback to savepoint {name}")
+                self.staging.reset()
+                if attempt == STAGE_RETRIES:
+                    raise
+                print(f"Шаг {name} завершился ошибкой, повтор {attempt + 1}: {exc}")
+            else:
+                self.curs.execute(f"release savepoint {name}")
+                return result
+
+    def load_data(self, date_group: list, parsed: dict = None) -> None:
         """
         Функция для загрузки данных из файлов в базу данных.
+        При наличии пула подключений файлы загружаются параллельно
 
         Args:
-            date_group (list) - список с названиями файлов и датой загрузки
+            date_group (list) - список с названиями файлов и датой загрузки\n
+            parsed (dict = None) (optional) - заранее прочитанные датафреймы по названиям файлов\n
 
         Returns:
             None
         """
+        parsed = parsed or {}
+        # подключения пула не видят незафиксированную транзакцию дня
+        if self.pool is not None and not self.in_unit:
+            self.load_data_parallel(date_group, parsed)
+            return
+
         for i in range(len(date_group)):
             # распаковываем название файла и дату загрузки
             file_name, fdate = date_group[i]
-            # переопределяем дату загрузки
+            with METRICS.stage("load_file", get_file_spec(file_name).name, fdate):
+                self.load_file(file_name, fdate, parsed.get(file_name))
+
+    def parse_data(self, date_group: list) -> dict:
+        """
+        Функция для чтения файлов без обращения к базе данных.
+        Может выполняться в отдельном потоке, пока загружается предыдущий день
+
+        Args:
+            date_group (list) - список с названиями файлов и датой загрузки
+
+        Returns:
+            dict - прочитанные датафреймы по названиям файлов. потоковые файлы не читаются заранее
+        """
+        parsed = {}
+        for file_name, fdate in date_group:
+            spec = get_file_spec(file_name)
+            if self.done("merged", spec.name, fdate):
+                # файл уже загружен в прерванной загрузке
+                continue
+            with METRICS.stage("parse_data", spec.name, fdate):
+                df = self.parse_file(file_name, spec)
+            if df is not None:
+                parsed[file_name] = df
+        return parsed
+
+    def load_data_parallel(self, date_group: list, parsed: dict) -> None:
+        """
+        Функция для параллельной загрузки файлов. Каждый файл загружается в отдельном потоке
+        со своим подключением из пула, потоков не больше размера пула. Функция возвращается только после загрузки всех файлов
+
+        Args:
+            date_group (list) - список с названиями файлов и датой загрузки\n
+            parsed (dict) - заранее прочитанные датафреймы по названиям файлов\n
+
+        Returns:
+            None
+        """
+        # потоков не больше подключений пула: при исчерпании пула getconn падает с PoolError,
+        # а не ждет освобождения подключения
+        workers = min(len(date_group), self.pool.maxconn)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self.load_file_worker, file_name, fdate, parsed.get(file_name)
+                )
+                for file_name, fdate in date_group
+            ]
+            # ждем завершения всех потоков. ошибка любого потока пробрасывается дальше
+            for future in futures:
+                future.result()
+        # переопределяем дату загрузки для составления отчета
+        for _, fdate in date_group:
             self.load_date = fdate
-            # получаем название таблицы и расширение файла
-            table_name, date_ext = file_name.rsplit("_", 1)
-            f_ext = date_ext.rsplit(".", 1)[1]
-            # удаляем временные таблицы
-            self.delete_stg_tables(table_name)
-            if "terminals" in file_name:
-                # формируем типы данных для полей
-                fields_dtype = {
-                    "terminal_id": "varchar(100)",
-                    "terminal_type": "varchar(100)",
-                    "terminal_city": "varchar(100)",
-                    "terminal_address": "varchar(100)",
-                }
-                # определяем префис
-                prefix = DIM_PREFIX
-                # получаем имя таргет таблицы
-                trg_name = self.init_target_name(prefix, table_name)
-                # получаем имя таргет таблицы без указания схемы и заполняем мета таблицу
-                tg_name = trg_name.split(".", 1)[1]
-                sql.insert_meta(self.curs, tg_name, self.full_code, self.schema)
-                self.conn.commit()
-                # загружаем файл в таличный вид
-                self.pfiles2sql(file_name, table_name, f_ext, fields_dtype)
-                # создаем таргет таблицу
-                self.init_target_table_hist(
-                    table_name,
-                    trg_name,
-                    pk="terminal_id",
-                    fields_dtype=fields_dtype,
+
+    def load_file_worker(
+        self, file_name: str, fdate: str, df: pd.DataFrame = None
+    ) -> None:
+        """
+        Функция для загрузки одного файла в отдельном подключении из пула
+
+        Args:
+            file_name (str) - название файла\n
+            fdate (str) - дата загрузки\n
+            df (pd.DataFrame = None) (optional) - заранее прочитанный датафрейм\n
+
+        Returns:
+            None
+        """
+        conn = self.pool.getconn()
+        stage = METRICS.stage("load_file", get_file_spec(file_name).name, fdate)
+        try:
+            with conn.cursor() as curs:
+                worker = FraudDetecter(
+                    conn,
+                    curs,
+                    self.code,
+                    self.schema,
+                    self.sourse_schema,
+                    init_tables=False,
                 )
-            elif "transactions" in file_name:
-                # формируем типы данных для полей
-                fields_dtype = {
-                    "trans_id": "varchar(200)",
-                    "trans_date": "timestamp",
-                    "amt": "decimal(8, 3)",
-                    "card_num": "varchar(200)",
-                    "oper_type": "varchar(200)",
-                    "oper_result": "varchar(200)",
-                    "terminal": "varchar(200)",
-                }
-                # определяем префис
-                prefix = FACT_PREFIX
-                # получаем имя таргет таблицы
-                trg_name = self.init_target_name(prefix, table_name)
-                # получаем имя таргет таблицы без указания схемы и заполняем мета таблицу
-                tg_name = trg_name.split(".", 1)[1]
-                sql.insert_meta(self.curs, tg_name, self.full_code, self.schema)
-                self.conn.commit()
-                # загружаем файл в таличный вид
-                self.pfiles2sql(file_name, table_name, f_ext, fields_dtype)
-                # создаем таргет таблицу
-                self.init_target_table_hist(
-                    table_name,
-                    trg_name,
-                    pk="trans_id",
-                    fields_dtype=fields_dtype,
-                    tr=True,
+                # время чтения файла собирается в общий словарь
+                worker.parse_seconds = self.parse_seconds
+                worker.resume = self.resume
+                worker.checkpoints = self.checkpoints
+                with stage:
+                    worker.load_file(file_name, fdate, df)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def load_file(self, file_name: str, fdate: str, df: pd.DataFrame = None) -> None:
+        """
+        Функция для загрузки одного файла в базу данных
+
+        Args:
+            file_name (str) - название файла\n
+            fdate (str) - дата загрузки\n
+            df (pd.DataFrame = None) (optional) - заранее прочитанный датафрейм\n
+
+        Returns:
+            None
+        """
+        start = perf_counter()
+        # заранее прочитанный файл читался вне времени загрузки
+        prefetched = df is not None
+        # переопределяем дату загрузки
+        self.load_date = fdate
+        # получаем описание типа файлов из реестра
+        spec = get_file_spec(file_name)
+        table_name = spec.name
+        self.feed = table_name
+        if self.done("meta_updated"):
+            print(f"Файл {file_name} уже загружен в прерванной загрузке, пропущен")
+            return
+        # удаляем временные таблицы
+        self.delete_stg_tables(table_name)
+        # получаем имя таргет таблицы
+        trg_name = self.init_target_name(spec.prefix, table_name)
+        # получаем имя таргет таблицы без указания схемы и заполняем мета таблицу
+        tg_name = trg_name.split(".", 1)[1]
+        sql.insert_meta(self.curs, tg_name, self.full_code, self.schema)
+        self.commit()
+        if self.use_fingerprint(spec):
+            # загружаем только изменения снимка относительно предыдущего дня
+            self.run_stage(
+                f"fp_{table_name}", self.load_snapshot, file_name, spec, trg_name, df
+            )
+            self.print_parse_share(file_name, perf_counter() - start, prefetched)
+            return
+        merged = self.done("merged")
+        if (merged or self.done("staged")) and self.staged_reusable(table_name):
+            print(f"Файл {file_name} уже во временной таблице, чтение пропущено")
+        else:
+            if spec.mode == "cumulative":
+                # из накопительного файла загружаем только записи после водяного знака
+                df = self.cumulative_delta(file_name, spec, tg_name, df)
+            # загружаем файл в таличный вид
+            self.run_stage(f"stg_{table_name}", self.pfiles2sql, file_name, spec, df)
+        if merged:
+            # таргет таблица уже обновлена, остается мета таблица. повторная вставка
+            # операций создала бы дубли
+            self.run_stage(
+                f"meta_{table_name}",
+                self.update_target_meta,
+                table_name,
+                trg_name,
+                spec.watermark,
+                checkpoint=True,
+            )
+        else:
+            # создаем таргет таблицу
+            self.run_stage(
+                f"trg_{table_name}",
+                self.init_target_table_hist,
+                table_name,
+                trg_name,
+                pk=spec.pk,
+                fields_dtype=spec.fields_dtype,
+                tr=spec.mode == "append",
+                indexes=spec.target_indexes,
+                partition_by=spec.partition_by,
+                watermark=spec.watermark,
+                checkpoint=True,
+            )
+        self.print_parse_share(file_name, perf_counter() - start, prefetched)
+
+    def print_parse_share(
+        self, file_name: str, load_seconds: float, prefetched: bool = False
+    ) -> None:
+        """
+        Функция для вывода доли чтения файла во времени его загрузки.
+        Если файл прочитан заранее в фоновом потоке, время чтения добавляется к загрузке
+
+        Args:
+            file_name (str) - название файла\n
+            load_seconds (float) - время загрузки файла в базу в секундах\n
+            prefetched (bool = False) (optional) - флаг чтения файла до начала загрузки\n
+
+        Returns:
+            None
+        """
+        parse_seconds = self.parse_seconds.pop(file_name, None)
+        if parse_seconds is None:
+            return
+        if prefetched:
+            load_seconds += parse_seconds
+        share = parse_seconds / load_seconds if load_seconds else 0.0
+        print(
+            f"Файл {file_name}: чтение {parse_seconds:.3f} с "
+            f"из {load_seconds:.3f} с загрузки ({share:.0%})"
+        )
+
+    def use_fingerprint(self, spec: FeedSpec) -> bool:
+        """
+        Функция для проверки, загружается ли тип файлов по хэшам содержимого
+
+        Args:
+            spec (FeedSpec) - описание типа файлов
+
+        Returns:
+            bool - True для полных снимков из FINGERPRINT_FEEDS при обновлении по хэшам строк
+        """
+        return (
+            spec.name in FINGERPRINT_FEEDS
+            and spec.mode == "scd"
+            and SCD_ENGINE == "hash_diff"
+        )
+
+    @timed("load_snapshot")
+    def load_snapshot(
+        self, file_name: str, spec: FeedSpec, trg_name: str, df: pd.DataFrame = None
+    ) -> None:
+        """
+        Функция для загрузки полного снимка по хэшам содержимого. Неизмененный файл не читается
+        и не загружается, у измененного в таргет таблицу отправляются только отличающиеся строки
+
+        Args:
+            file_name (str) - название файла\n
+            spec (FeedSpec) - описание типа файлов\n
+            trg_name (str) - название таргет таблицы\n
+            df (pd.DataFrame = None) (optional) - заранее прочитанный датафрейм\n
+
+        Returns:
+            None
+        """
+        table_name = spec.name
+        tg_name = trg_name.split(".", 1)[1]
+        load_date = f"to_date('{self.load_date}', 'DDMMYYYY') + current_time"
+        file_hash = fp.file_hash("data/" + file_name)
+        # хэш есть в мета таблице только если хэши строк соответствуют таргет таблице
+        prev_hash = sql.meta_file_hash(self.curs, tg_name, self.full_code, self.schema)
+        if file_hash == prev_hash:
+            print(f"Файл {file_name} не изменился, загрузка пропущена")
+        else:
+            if df is None:
+                df = self.parse_file(file_name, spec)
+            hashes = fp.row_hashes(df, spec.fields)
+            keys = df[spec.pk].astype(str)
+            if prev_hash is None:
+                # хэшей строк еще нет - загружаем снимок целиком и сохраняем хэши всех строк
+                self.load_target(file_name, spec, trg_name, df)
+                sql.delete_fingerprints(self.curs, self.full_code, table_name)
+                sql.save_fingerprints(
+                    self.curs, self.full_code, table_name, zip(keys, hashes)
                 )
-            elif "passport_blacklist" in file_name:
-                # формируем типы данных для полей
-                fields_dtype = {"entry_dt": "date", "passport_num": "varchar(200)"}
-                # определяем префис
-                prefix = FACT_PREFIX
-                # получаем имя таргет таблицы
-                trg_name = self.init_target_name(prefix, table_name)
-                # получаем имя таргет таблицы без указания схемы и заполняем мета таблицу
-                tg_name = trg_name.split(".", 1)[1]
-                sql.insert_meta(self.curs, tg_name, self.full_code, self.schema)
-                self.conn.commit()
-                # загружаем файл в таличный вид
-                self.pfiles2sql(file_name, table_name, f_ext, fields_dtype)
-                # создаем таргет таблицу
-                self.init_target_table_hist(
-                    table_name,
-                    trg_name,
-                    pk="passport_num",
-                    fields_dtype=fields_dtype,
+            else:
+                previous = sql.select_fingerprints(
+                    self.curs, self.full_code, table_name
                 )
+                delta, deleted = fp.diff(df, spec.pk, hashes, previous)
+                print(
+                    f"Файл {file_name}: новых и измененных строк {len(delta)}, "
+                    f"удаленных строк {len(deleted)}"
+                )
+                if len(delta) or deleted:
+                    deleted_name = self.staging.prepare(
+                        "deleted", table_name, {spec.pk: spec.fields_dtype[spec.pk]}
+                    )
+                    execute_values(
+                        self.curs,
+                        f"insert into {deleted_name} values %s",
+                        [(pk,) for pk in deleted],
+                    )
+                    self.load_target(file_name, spec, trg_name, delta, deleted_name)
+                    changed = keys[delta.index]
+                    sql.save_fingerprints(
+                        self.curs,
+                        self.full_code,
+                        table_name,
+                        zip(changed, hashes[delta.index]),
+                    )
+                    sql.delete_fingerprints(
+                        self.curs, self.full_code, table_name, deleted
+                    )
+        # представление обновляется на день загрузки и при пропуске файла
+        fields_str = ",\n\t".join(spec.fields)
+        view_name = f"{self.full_code}_v_{table_name}"
+        sql.view(self.curs, view_name, fields_str, trg_name, load_date)
+        sql.update_meta_fingerprint(
+            self.curs, tg_name, self.full_code, self.schema, file_hash, load_date
+        )
+        # снимок, его хэши и мета таблица фиксируются одним коммитом
+        self.checkpoint("merged")
+        self.checkpoint("meta_updated")
+        self.commit()
+
+    @timed("cumulative_delta")
+    def cumulative_delta(
+        self, file_name: str, spec: FeedSpec, tg_name: str, df: pd.DataFrame = None
+    ) -> pd.DataFrame:
+        """
+        Функция для отбора записей накопительного файла, не старше водяного знака в мета таблице.
+        Запись с датой, равной водяному знаку, могла появиться позже и отбирается повторно,
+        уже загруженные записи отсекаются при дозаписи. В начале месяца файл начинается заново
+        и все его записи новее водяного знака прошлого месяца
+
+        Args:
+            file_name (str) - название файла\n
+            spec (FeedSpec) - описание типа файлов\n
+            tg_name (str) - название таргет таблицы без схемы\n
+            df (pd.DataFrame = None) (optional) - заранее прочитанный датафрейм\n
+
+        Returns:
+            pd.DataFrame - записи файла для загрузки
+        """
+        if df is None:
+            df = self.parse_file(file_name, spec)
+        watermark = sql.meta_watermark(self.curs, tg_name, self.full_code, self.schema)
+        if watermark is not None:
+            df = df[df[spec.watermark] >= watermark].copy()
+            print(
+                f"Файл {file_name}: записей начиная с {watermark:%Y-%m-%d} - {len(df)}"
+            )
+        return df
+
+    def load_target(
+        self,
+        file_name: str,
+        spec: FeedSpec,
+        trg_name: str,
+        df: pd.DataFrame,
+        deleted_name: str = None,
+    ) -> None:
+        """
+        Функция для загрузки датафрейма во временную таблицу и обновления таргет таблицы
+
+        Args:
+            file_name (str) - название файла\n
+            spec (FeedSpec) - описание типа файлов\n
+            trg_name (str) - название таргет таблицы\n
+            df (pd.DataFrame) - датафрейм со всеми строками снимка или только с изменениями\n
+            deleted_name (str = None) (optional) - таблица с ключами удаленных строк для загрузки изменений\n
+
+        Returns:
+            None
+        """
+        self.pfiles2sql(file_name, spec, df)
+        self.init_target_table_hist(
+            spec.name,
+            trg_name,
+            pk=spec.pk,
+            fields_dtype=spec.fields_dtype,
+            indexes=spec.target_indexes,
+            deleted_name=deleted_name,
+        )
 
     def delete_stg_tables(self, table_name: str) -> None:
         """
-        Функция для удаления временных таблиц
+        Функция для удаления временных таблиц с изменениями старого способа обновления.
+        Таблица с исходными данными не удаляется, а очищается при подготовке
 
         Args:
             table_name (str) - название таблицы
         """
-        self.curs.execute(f"drop table if exists {self.full_code}_stg_{table_name}")
-        self.curs.execute(
-            f"drop table if exists {self.full_code}_stg_source_{table_name}"
-        )
-        self.curs.execute(f"drop table if exists {self.full_code}_stg_new_{table_name}")
-        self.curs.execute(f"drop table if exists {self.full_code}_stg_upd_{table_name}")
-        self.curs.execute(f"drop table if exists {self.full_code}_stg_del_{table_name}")
-        self.conn.commit()
+        if SCD_ENGINE != "tables":
+            return
+        for name in ("new", "upd", "del"):
+            self.curs.execute(
+                f"drop table if exists {self.staging.table_name(name, table_name)}"
+            )
+        self.commit()
 
     def init_target_name(self, prefix: str, table_name: str) -> str:
         """
@@ -159,70 +602,92 @@ class FraudDetecter:
         target_name += "_hist" if prefix == DIM_PREFIX else ""
         return target_name
 
+    def stg_loader(self, spec: FeedSpec) -> str:
+        """
+        Функция для выбора способа загрузки во временную таблицу. Потоково читаются только txt файлы
+
+        Args:
+            spec (FeedSpec) - описание типа файлов
+
+        Returns:
+            str - способ загрузки: values, copy или stream
+        """
+        loader = STG_LOADERS.get(spec.name, "values")
+        if loader == "stream" and spec.file_format != "txt":
+            loader = "copy"
+        return loader
+
+    def parse_file(self, file_path: str, spec: FeedSpec) -> pd.DataFrame:
+        """
+        Функция для чтения файла в типизированный датафрейм
+
+        Args:
+            file_path (str) - название файла\n
+            spec (FeedSpec) - описание типа файлов\n
+
+        Returns:
+            pd.DataFrame - датафрейм с данными или None, если файл читается потоково при загрузке
+        """
+        if self.stg_loader(spec) == "stream":
+            return None
+        start = perf_counter()
+        with METRICS.stage("parse_file", spec.name):
+            METRICS.add(bytes=os.path.getsize("data/" + file_path))
+            if PARSE_CACHE_DIR:
+                df, cached = parse_cache.read(
+                    spec, "data/" + file_path, PARSE_CACHE_DIR
+                )
+            else:
+                df, cached = spec.read("data/" + file_path), False
+        self.parse_seconds[file_path] = perf_counter() - start
+        source = "кэш" if cached else spec.file_format
+        print(
+            f"Файл {file_path} прочитан ({source}) "
+            f"за {self.parse_seconds[file_path]:.3f} с: {len(df)} строк"
+        )
+        return df
+
+    @timed("pfiles2sql")
     def pfiles2sql(
-        self, file_path: str, table_name: str, file_ext: str, fields_dtype: dict
+        self, file_path: str, spec: FeedSpec, df: pd.DataFrame = None
     ) -> None:
         """
         Функция для загрузки данных из файлов в табличный вид
 
         Args:
             file_path (str) - название файла\n
-            table_name (str) - название таблицы\n
-            file_ext (str) - расширение файла\n
-            fields_dtype (dict) - словарь с полями и типами данных\n
+            spec (FeedSpec) - описание типа файлов\n
+            df (pd.DataFrame = None) (optional) - заранее прочитанный датафрейм\n
 
         Returns:
             None
         """
-        # открываем файл и преобразуем данные из него в датафрейм
-        file_path = "data/" + file_path
-        if file_ext == "xlsx":
-            df = pd.read_excel(file_path, index_col=0)
-        elif file_ext == "txt":
-            df = pd.read_csv(file_path, delimiter=";", index_col=0)
+        loader = self.stg_loader(spec)
+        # открываем файл и преобразуем данные из него в типизированный датафрейм
+        if loader == "stream":
+            METRICS.add(bytes=os.path.getsize("data/" + file_path))
+            data = spec.read_chunks("data/" + file_path, STREAM_CHUNK_SIZE)
+        elif df is not None:
+            data = df
         else:
-            raise ValueError(f"Тип файлов {file_ext} не поддерживается")
-        # создаем название для таблицы с исходными данными
-        table_name = f"{self.full_code}_stg_source_{table_name}"
-
-        # соединяем поля с их типом данных и находим decimal значения
-        fields_dts = []
-        decimal_indx = []
-        for i, field_dtype in enumerate(fields_dtype.items()):
-            field, dtype = field_dtype
-            fields_dts.append(f"{field} {dtype}")
-            if "decimal" in dtype:
-                decimal_indx.append(i)
-
-        # соединяем поля с типами данных в одну строку и создаем sql скрипт
-        fields_str = ",\n\t".join(fields_dts)
-        create_table_query = (
-            f"create table {table_name} ({fields_str}, update_dt timestamp);"
+            data = self.parse_file(file_path, spec)
+        # подготавливаем пустую таблицу с исходными данными
+        table_name = self.staging.prepare(
+            "source", spec.name, {**spec.fields_dtype, "update_dt": "timestamp"}
         )
-        self.curs.execute(create_table_query)
         self.curs.execute(
             f"select to_date('{self.load_date}', 'DDMMYYYY') + current_time"
         )
-        load_date = self.curs.fetchone()
-
-        # в каждой строке меняем decimal значения. добавляем строки для заполнения в values
-        values = []
-        for i, row in enumerate(df.itertuples(index=True, name=None)):
-            row = list(row)
-            if decimal_indx:
-                for di in decimal_indx:
-                    row[di] = float(row[di].replace(",", "."))
-            row.append(load_date)
-            values.append(row)
-
-        # создаем и выполняем запрос на заполнение данных в таблицу с исходными данными
-        insert_query = f"""
-        insert into {table_name}
-        values %s
-        """
-        execute_values(self.curs, insert_query, values)
-        self.conn.commit()
+        load_date = self.curs.fetchone()[0]
+
+        # загружаем данные выбранным способом и сразу собираем статистику для запросов SCD2
+        load_stg_source(self.curs, loader, table_name, data, load_date)
+        sql.analyze(self.curs, table_name)
+        self.checkpoint("parsed")
+        self.checkpoint("staged")
+        self.commit()
 
+    @timed("init_target_table_hist")
     def init_target_table_hist(
         self,
         table_name: str,
@@ -230,6 +695,11 @@ class FraudDetecter:
         pk: str,
         fields_dtype: dict,
         tr: bool = False,
+        indexes: tuple = (),
+        partition_by: str = None,
+        deleted_name: str = None,
+        watermark: str = None,
+        checkpoint: bool = False,
     ) -> None:
         """
         Функция для инициализации и заполнения таргет таблиц.
@@ -240,6 +710,11 @@ class FraudDetecter:
             pk (str) - первичный ключ в таблице\n
             fields_dtype (dict) - словарь с поляи и типами данных\n
             tr (bool = False) (optional) - флаг обозначающий загрузку транзакций\n
+            indexes (tuple = ()) (optional) - индексы таргет таблицы\n
+            partition_by (str = None) (optional) - поле для секционирования таргет таблицы\n
+            deleted_name (str = None) (optional) - таблица с ключами удаленных строк, если загружены только изменения\n
+            watermark (str = None) (optional) - поле водяного знака для дозаписи накопительного файла\n
+            checkpoint (bool = False) (optional) - отмечать шаги merged и meta_updated\n
 
         Rerurns:
             None
@@ -256,11 +731,20 @@ class FraudDetecter:
         # скрипт для преобразования даты загрузки в тип данных date
         load_date = f"to_date('{self.load_date}', 'DDMMYYYY') + current_time"
         # создаем таргет таблицу
-        sql.target_hist(self.curs, target_name, fields_dts_str, load_date)
+        sql.target_hist(self.curs, target_name, fields_dts_str, load_date, partition_by)
+        partitions = []
+        if partition_by:
+            # создаем секции для всех периодов, которые встречаются в загруженном файле
+            partitions = self.init_partitions(
+                target_name,
+                partition_by,
+                self.staging.table_name("source", table_name),
+            )
+        self.init_indexes(target_name, indexes)
         # создаем представление хранящее актуальные данные
         view_name = f"{self.full_code}_v_{table_name}"
         sql.view(self.curs, view_name, fields_str, target_name, load_date)
-        self.conn.commit()
+        self.commit()
 
         if tr:
             # заполняем таблицу с транзакциями
@@ -271,18 +755,124 @@ class FraudDetecter:
                 self.full_code,
                 table_name,
                 load_date,
+                self.stg_code,
+            )
+            # у новых секций еще нет статистики, а отчет строится сразу после загрузки
+            for partition_name in partitions:
+                sql.analyze(self.curs, partition_name)
+        elif watermark:
+            # дозаписываем новые записи накопительного файла без сравнения с таргет таблицей
+            sql.init_row_hash(self.curs, target_name, fields)
+            rows = sql.insert_cumulative(
+                self.curs,
+                target_name,
+                fields,
+                pk,
+                watermark,
+                self.full_code,
+                table_name,
+                load_date,
+                self.stg_code,
+            )
+            print(f"Таблица {target_name} дополнена: {rows} строк")
+        elif SCD_ENGINE == "hash_diff":
+            # обновляем таргет таблицу одним запросом по хэшам строк
+            sql.init_row_hash(self.curs, target_name, fields)
+            sql.scd_merge(
+                self.curs,
+                target_name,
+                fields,
+                pk,
+                self.full_code,
+                table_name,
+                load_date,
+                self.stg_code,
+                deleted_name,
             )
         else:
             # создаем временные таблицы и обновляем данные в таргет таблице
             self.create_change_tables(table_name, fields, pk)
             self.update_table_hist(table_name, target_name, fields_str, pk, load_date)
             # self.print_results(table_name)
-        self.conn.commit()
+        if checkpoint:
+            self.checkpoint("merged")
+        self.commit()
+        self.update_target_meta(table_name, target_name, watermark, checkpoint)
+
+    def update_target_meta(
+        self,
+        table_name: str,
+        target_name: str,
+        watermark: str = None,
+        checkpoint: bool = False,
+    ) -> None:
+        """
+        Функция для обновления мета таблицы по временной таблице с исходными данными
+
+        Args:
+            table_name (str) - название таблицы\n
+            target_name (str) - название таргет таблицы\n
+            watermark (str = None) (optional) - поле водяного знака накопительного файла\n
+            checkpoint (bool = False) (optional) - отмечать шаг meta_updated\n
+
+        Returns:
+            None
+        """
         # получаем название таргет таблицы без схемы и обновляем мета таблицу
         trg_name = target_name.split(".", 1)[1]
-        sql.update_meta(self.curs, trg_name, self.full_code, self.schema, table_name)
-        self.conn.commit()
+        sql.update_meta(
+            self.curs, trg_name, self.full_code, self.schema, table_name, self.stg_code
+        )
+        if watermark:
+            sql.update_meta_watermark(
+                self.curs, trg_name, self.full_code, self.schema, target_name, watermark
+            )
+        if checkpoint:
+            self.checkpoint("meta_updated")
+        self.commit()
+
+    def init_partitions(self, table_name: str, column: str, source_name: str) -> list:
+        """
+        Функция для создания секций таблицы под данные из source_name.
+        Если таблица создана ранее без секционирования - переносит ее в секционированную
+
+        Args:
+            table_name (str) - название секционированной таблицы\n
+            column (str) - поле секционирования\n
+            source_name (str) - таблица с данными, для которых нужны секции\n
+
+        Returns:
+            list - названия секций под данные из source_name
+        """
+        if sql.table_kind(self.curs, table_name) == "r":
+            sql.migrate_to_partitioned(
+                self.curs, table_name, column, PARTITION_INTERVAL
+            )
+        periods = sql.partition_periods(
+            self.curs, source_name, column, PARTITION_INTERVAL
+        )
+        return [
+            sql.create_partition(
+                self.curs, table_name, period_start, PARTITION_INTERVAL
+            )
+            for period_start in periods
+        ]
+
+    def init_indexes(self, table_name: str, indexes: tuple) -> None:
+        """
+        Функция для создания недостающих индексов таблицы
 
+        Args:
+            table_name (str) - название таблицы\n
+            indexes (tuple) - индексы, каждый - кортеж полей или выражений\n
+
+        Returns:
+            None
+        """
+        for columns in indexes:
+            sql.create_index(self.curs, table_name, columns)
+
+    @timed("create_change_tables")
     def create_change_tables(self, table_name: str, fields: list, pk: str) -> None:
         """
         Функция для создания и временных таблиц с данными об изменениях в таргет таблице
@@ -298,17 +888,26 @@ class FraudDetecter:
         # создаем строку со всеми полями с указателем stg
         all_fields = ",\n\t".join([f"stg.{f}" for f in fields])
         # создаем временную таблицу с новыми данными в таргет таблице
-        sql.scd_new(self.curs, all_fields, self.full_code, table_name, pk)
+        sql.scd_new(
+            self.curs, all_fields, self.full_code, table_name, pk, self.stg_code
+        )
         # создаем строку с выражением неравенства всех полей stg и trg
         fields_ne_cond = "\n\t".join([f"or stg.{f} != trg.{f}" for f in fields])
         # создаем временную таблицу с измененными данными в таргет таблице
         sql.scd_upd(
-            self.curs, all_fields, self.full_code, table_name, pk, fields_ne_cond
+            self.curs,
+            all_fields,
+            self.full_code,
+            table_name,
+            pk,
+            fields_ne_cond,
+            self.stg_code,
         )
         # создаем временную таблицу с удаленными данными в таргет таблице
-        sql.scd_del(self.curs, table_name, self.full_code, pk)
-        self.conn.commit()
+        sql.scd_del(self.curs, table_name, self.full_code, pk, self.stg_code)
+        self.commit()
 
+    @timed("update_table_hist")
     def update_table_hist(
         self, table_name: str, target_name: str, fields_str: list, pk: str, load_date
     ) -> None:
@@ -326,7 +925,13 @@ class FraudDetecter:
             None
         """
         sql.target_update_new(
-            self.curs, table_name, target_name, fields_str, load_date, self.full_code
+            self.curs,
+            table_name,
+            target_name,
+            fields_str,
+            load_date,
+            self.full_code,
+            self.stg_code,
         )
         sql.target_update_upd(
             self.curs,
@@ -336,6 +941,7 @@ class FraudDetecter:
             load_date,
             pk,
             self.full_code,
+            self.stg_code,
         )
         sql.target_update_del(
             self.curs,
@@ -345,8 +951,9 @@ class FraudDetecter:
             load_date,
             pk,
             self.full_code,
+            self.stg_code,
         )
-        self.conn.commit()
+        self.commit()
 
     def print_results(self, table_name):
         tables = [
@@ -368,11 +975,134 @@ class FraudDetecter:
                 footer = "_-" * 10
                 f.write(footer + "\n")
 
+    def init_rep_fraud(self, source_name: str) -> None:
+        """
+        Функция для создания таблицы отчетов, ее индексов и секций под операции из source_name
+
+        Args:
+            source_name (str) - таблица или подзапрос с полем event_dt операций, которые попадут в отчет
+
+        Returns:
+            None
+        """
+        rep_name = f"{self.full_code}_rep_fraud"
+        if REP_FRAUD_PARTITIONED:
+            sql.init_rep_fraud(self.curs, self.full_code, partition_by="event_dt")
+            self.init_partitions(rep_name, "event_dt", source_name)
+        else:
+            sql.init_rep_fraud(self.curs, self.full_code)
+        self.init_indexes(rep_name, REP_FRAUD_INDEXES)
+
+    @timed("refresh_card_clients", feed="card_clients")
+    def refresh_card_clients(self, full: bool = False) -> None:
+        """
+        Функция для обновления таблицы с данными клиентов по карте. Признаки мошенничества
+        берут паспорт, ФИО, телефон и сроки действия из нее одним поиском по номеру карты
+        вместо джоина трех таблиц банка. Пересобираются только карты, изменившиеся в банке
+        с прошлого обновления, водяной знак хранится в мета таблице. Строки карт, удаленных
+        в банке вместе со счетом или клиентом, удаляются при каждом обновлении
+
+        Args:
+            full (bool = False) (optional) - пересобрать все карты без водяного знака\n
+
+        Returns:
+            None
+        """
+        target_name = f"{self.full_code}_dwh_dim_card_clients"
+        tg_name = target_name.split(".", 1)[1]
+        sql.init_card_clients(self.curs, self.full_code)
+        sql.insert_meta(self.curs, tg_name, self.full_code, self.schema)
+        watermark = (
+            None
+            if full
+            else sql.meta_watermark(self.curs, tg_name, self.full_code, self.schema)
+        )
+        upserted, deleted, watermark = sql.refresh_card_clients(
+            self.curs, self.full_code, self.sourse_schema, watermark
+        )
+        sql.set_meta_watermark(
+            self.curs, tg_name, self.full_code, self.schema, watermark
+        )
+        if upserted or deleted:
+            sql.analyze(self.curs, target_name)
+            print(
+                f"Данные клиентов по картам обновлены: новых и измененных {upserted}, удаленных {deleted}"
+            )
+
+    @timed("rep_fraud", feed="rep_fraud")
     def rep_fraud(self):
         """Функция для создания и заполнения таблицы отчетов"""
-        sql.init_rep_fraud(self.curs, self.full_code)
-        sql.insert_rep_fraud(self.curs, self.full_code, self.load_date)
-        self.conn.commit()
+        if self.done("reported", "rep_fraud"):
+            print(
+                f"Отчет за {self.load_date} уже составлен в прерванной загрузке, пропущен"
+            )
+            return
+        self.run_stage("card_clients", self.refresh_card_clients)
+        # отчет за день попадает в секцию дня операций
+        self.init_rep_fraud(
+            f"(select {sql.day_start(self.load_date)} as event_dt) as load_day"
+        )
+        self.run_stage("rep_fraud", self.insert_rep_fraud)
+        self.checkpoint("reported", "rep_fraud")
+        self.commit()
+
+    def insert_rep_fraud(
+        self, rules: list = None, stream_reported: bool = STREAM_DETECTION
+    ) -> int:
+        """
+        Функция для пересчета отчета за день выбранным в REPORT_ENGINE способом.
+        Строки пересчитываемых признаков за день удаляются и добавляются заново в той же
+        транзакции, поэтому повторный запуск за день не создает дублей
+
+        Args:
+            rules (list = None) (optional) - признаки из REPORT_RULES, по умолчанию все\n
+            stream_reported (bool = STREAM_DETECTION) (optional) - в отчете есть строки
+            потоковой проверки. подтвержденные пересчетом строки сохраняют время попадания
+            в отчет, остальные удаляются\n
+
+        Returns:
+            int - количество удаленных строк
+        """
+        rules = list(REPORT_RULES.values()) if rules is None else list(rules)
+        stream_types = (
+            [rule.event_type for rule in rules if rule.streamed]
+            if stream_reported
+            else []
+        )
+        deleted = sql.delete_rep_fraud_day(
+            self.curs,
+            self.full_code,
+            self.load_date,
+            [rule.event_type for rule in rules],
+            stream_types,
+        )
+        if REPORT_ENGINE == "separate":
+            if len(rules) != len(REPORT_RULES):
+                raise ValueError(
+                    "Способ построения отчета separate считает только все признаки"
+                )
+            sql.insert_rep_fraud(
+                self.curs, self.full_code, self.load_date, AMOUNT_GUESS_MODE
+            )
+        elif REPORT_ENGINE == "fused":
+            # эталонная проверка подбора суммы остается построчной
+            python_guess = (
+                AMOUNT_GUESS_MODE == "python" and REPORT_RULES["amount_guess"] in rules
+            )
+            if python_guess:
+                rules.remove(REPORT_RULES["amount_guess"])
+            sql.insert_rep_fraud_fused(self.curs, self.full_code, self.load_date, rules)
+            if python_guess:
+                sql.insert_amount_guess_python(
+                    self.curs, self.full_code, self.load_date
+                )
+        else:
+            raise ValueError(
+                f"Способ построения отчета {REPORT_ENGINE} не поддерживается"
+            )
+        if stream_types:
+            sql.restore_stream_report_dt(self.curs, self.full_code, self.load_date)
+        return deleted
 
     def __enter__(self):
         return self
@@ -380,3 +1110,5 @@ class FraudDetecter:
     def __exit__(self, exc_type, exc_value, traceback):
         self.conn.close()
         self.curs.close()
+        if self.pool is not None:
+            self.pool.closeall()
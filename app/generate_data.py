@@ -0,0 +1,633 @@
+import argparse
+import json
+import os
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from openpyxl import Workbook
+import sql_scripts as sql
+from psycopg2.extensions import cursor
+from psycopg2.extras import execute_values
+from settings import BENCHMARK_SOURSE_SCHEMA, SOURSE_SCHEMA
+
+# названия признаков мошеннических операций в таблице отчетов
+FRAUD_TYPES = {
+    "passport": "Совершение операции при просроченном или заблокированном паспорте",
+    "contract": "Совершение операции при недействующем договоре",
+    "city": "Совершение операций в разных городах в течение одного часа",
+    "amount": "Попытка подбора суммы",
+}
+
+CITIES = (
+    "Москва",
+    "Санкт-Петербург",
+    "Новосибирск",
+    "Екатеринбург",
+    "Казань",
+    "Нижний Новгород",
+    "Челябинск",
+    "Самара",
+    "Омск",
+    "Ростов-на-Дону",
+    "Уфа",
+    "Красноярск",
+    "Воронеж",
+    "Пермь",
+    "Волгоград",
+)
+STREETS = (
+    "ул. Ленина",
+    "ул. Гагарина",
+    "пр. Мира",
+    "ул. Садовая",
+    "ул. Советская",
+    "Центральная ул.",
+    "ул. Победы",
+    "Молодежная ул.",
+)
+LAST_NAMES = ("Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Волков")
+FIRST_NAMES = ("Иван", "Петр", "Сергей", "Андрей", "Алексей", "Дмитрий", "Николай")
+PATRONYMICS = ("Иванович", "Петрович", "Сергеевич", "Андреевич", "Алексеевич")
+# окно признака подбора суммы, по нему строятся цепочки на границе окна
+GUESS_WINDOW = sql.timedelta_from_interval(sql.AMOUNT_GUESS_WINDOW)
+# типы терминалов и префиксы их идентификаторов
+TERMINAL_TYPES = {"ATM": "A", "POS": "P", "ETERM": "E"}
+OPER_TYPES = ("PAYMENT", "WITHDRAW", "DEPOSIT")
+
+
+@dataclass
+class Dataset:
+    """
+    Сгенерированные файлы и строки схемы bank.
+
+    Args:
+        clients (list) - строки bank.clients\n
+        accounts (list) - строки bank.accounts\n
+        cards (list) - строки bank.cards\n
+        files (dict) - количество строк по названиям сгенерированных файлов\n
+        planted (list) - заложенные мошеннические операции: event_dt, passport и event_type\n
+    """
+
+    clients: list = field(default_factory=list)
+    accounts: list = field(default_factory=list)
+    cards: list = field(default_factory=list)
+    files: dict = field(default_factory=dict)
+    planted: list = field(default_factory=list)
+
+
+class Generator:
+    def __init__(
+        self,
+        start: date,
+        days: int,
+        transactions: int,
+        clients: int,
+        terminals: int,
+        churn: float,
+        fraud: int,
+        seed: int = 1,
+    ) -> None:
+        """
+        Класс для генерации файлов выгрузки и клиентов банка с заложенными мошенническими операциями.
+        Обычные клиенты не нарушают признаки мошенничества, поэтому каждый заложенный случай
+        должен попасть в отчет
+
+        Args:
+            start (date) - первый день выгрузки\n
+            days (int) - количество дней\n
+            transactions (int) - количество операций в день\n
+            clients (int) - количество обычных клиентов\n
+            terminals (int) - количество терминалов в первый день\n
+            churn (float) - доля терминалов, которые меняются каждый день\n
+            fraud (int) - количество заложенных случаев каждого признака в день\n
+            seed (int = 1) (optional) - зерно генератора случайных чисел\n
+
+        Returns:
+            None
+        """
+        self.start = start
+        self.days = days
+        self.transactions = transactions
+        self.n_clients = clients
+        self.n_terminals = terminals
+        self.churn = churn
+        self.fraud = fraud
+        self.rnd = random.Random(seed)
+        self.dataset = Dataset()
+        self.trans_id = 10_000_000_000
+        self.terminal_seq = 1000
+        # действующие терминалы по идентификатору: тип, город и адрес
+        self.terminals = {}
+        # карты обычных клиентов и их города
+        self.normal_cards = []
+        self.used_numbers = set()
+        # записи черного списка: дата и паспорт
+        self.blacklist = []
+
+    def generate(self, out_dir: str) -> Dataset:
+        """
+        Функция для генерации всех дней выгрузки в папку out_dir
+
+        Args:
+            out_dir (str) - папка для файлов выгрузки
+
+        Returns:
+            Dataset - сгенерированные строки банка, файлы и заложенные операции
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        for _ in range(self.n_terminals):
+            self.add_terminal()
+        for _ in range(self.n_clients):
+            self.normal_cards.extend(self.add_client())
+
+        for n in range(self.days):
+            day = self.start + timedelta(days=n)
+            if n:
+                self.churn_terminals()
+            rows = self.day_transactions(day)
+            self.write_transactions(out_dir, day, rows)
+            self.write_terminals(out_dir, day)
+            self.write_blacklist(out_dir, day)
+        return self.dataset
+
+    def number(self, template: str) -> str:
+        """Функция для генерации уникального номера по шаблону, где # - случайная цифра"""
+        while True:
+            value = "".join(
+                str(self.rnd.randint(0, 9)) if c == "#" else c for c in template
+            )
+            if value not in self.used_numbers:
+                self.used_numbers.add(value)
+                return value
+
+    def add_terminal(self, city: str = None) -> str:
+        """Функция для добавления нового терминала. Возвращает идентификатор терминала"""
+        terminal_type = self.rnd.choice(list(TERMINAL_TYPES))
+        self.terminal_seq += 1
+        terminal_id = f"{TERMINAL_TYPES[terminal_type]}{self.terminal_seq}"
+        city = city or self.rnd.choice(CITIES)
+        self.terminals[terminal_id] = (terminal_type, city, self.address(city))
+        return terminal_id
+
+    def address(self, city: str) -> str:
+        """Функция для генерации адреса терминала в городе"""
+        return f"г. {city}, {self.rnd.choice(STREETS)}, д. {self.rnd.randint(1, 150)}"
+
+    def churn_terminals(self) -> None:
+        """
+        Функция для изменения терминалов между днями: часть терминалов меняет адрес в том же городе,
+        часть закрывается и столько же открывается. Город терминала не меняется, чтобы обычные
+        операции не попадали в признак смены города
+        """
+        changed = self.rnd.sample(
+            list(self.terminals), int(len(self.terminals) * self.churn)
+        )
+        for terminal_id in changed[::2]:
+            terminal_type, city, _ = self.terminals[terminal_id]
+            self.terminals[terminal_id] = (terminal_type, city, self.address(city))
+        for terminal_id in changed[1::2]:
+            city = self.terminals.pop(terminal_id)[1]
+            self.add_terminal(city)
+
+    def add_client(
+        self, passport_valid_to: date = None, account_valid_to: date = None
+    ) -> list:
+        """
+        Функция для добавления клиента с одним счетом и одной или двумя картами
+
+        Args:
+            passport_valid_to (date = None) (optional) - срок действия паспорта, по умолчанию бессрочный\n
+            account_valid_to (date = None) (optional) - срок действия счета, по умолчанию через год после начала\n
+
+        Returns:
+            list - карты клиента: номер карты, паспорт и город клиента
+        """
+        client_id = f"{len(self.dataset.clients):07d}"
+        passport = self.number("#### ######")
+        self.dataset.clients.append(
+            (
+                client_id,
+                self.rnd.choice(LAST_NAMES),
+                self.rnd.choice(FIRST_NAMES),
+                self.rnd.choice(PATRONYMICS),
+                date(1960, 1, 1) + timedelta(days=self.rnd.randint(0, 15000)),
+                passport,
+                passport_valid_to,
+                self.number("+7 9## ### ## ##"),
+            )
+        )
+        account = self.number("40817810############")
+        self.dataset.accounts.append(
+            (account, account_valid_to or self.start + timedelta(days=365), client_id)
+        )
+        city = self.rnd.choice(CITIES)
+        cards = []
+        for _ in range(self.rnd.randint(1, 2)):
+            card_num = self.number("#### #### #### ####")
+            # в bank.cards номер карты хранится с пробелами в конце, как в исходной схеме
+            self.dataset.cards.append((card_num.ljust(20), account))
+            cards.append((card_num, passport, city))
+        return cards
+
+    def city_terminals(self) -> dict:
+        """Функция для группировки действующих терминалов по городам"""
+        by_city = {}
+        for terminal_id, (_, city, _) in self.terminals.items():
+            by_city.setdefault(city, []).append(terminal_id)
+        return by_city
+
+    def transaction(
+        self,
+        trans_date: datetime,
+        card_num: str,
+        terminal: str,
+        amount: float = None,
+        oper_result: str = None,
+    ) -> tuple:
+        """Функция для создания строки операции"""
+        self.trans_id += self.rnd.randint(1, 50)
+        if amount is None:
+            amount = round(self.rnd.uniform(10, 50_000), 2)
+        if oper_result is None:
+            oper_result = "REJECT" if self.rnd.random() < 0.02 else "SUCCESS"
+        return (
+            str(self.trans_id),
+            trans_date,
+            amount,
+            card_num,
+            self.rnd.choice(OPER_TYPES),
+            oper_result,
+            terminal,
+        )
+
+    def plant(self, event_dt: datetime, passport: str, fraud_type: str) -> None:
+        """Функция для записи заложенной мошеннической операции"""
+        self.dataset.planted.append(
+            {
+                "event_dt": f"{event_dt:%Y-%m-%d %H:%M:%S}",
+                "passport": passport,
+                "event_type": FRAUD_TYPES[fraud_type],
+            }
+        )
+
+    def amount_chain(
+        self, by_city: dict, trans_date: datetime, rejects: int, window=None
+    ) -> tuple:
+        """
+        Функция для создания цепочки подбора суммы нового клиента в одном терминале:
+        отклоненные операции с убывающими суммами и успешная меньшая сумма
+
+        Args:
+            by_city (dict) - действующие терминалы по городам\n
+            trans_date (datetime) - время первой операции\n
+            rejects (int) - количество отклоненных операций, не меньше AMOUNT_GUESS_REJECTS\n
+            window (timedelta = None) (optional) - время от первой из последних
+            AMOUNT_GUESS_REJECTS отклоненных операций до успешной, по умолчанию случайное\n
+
+        Returns:
+            tuple - строки операций и паспорт клиента
+        """
+        card_num, passport, city = self.rnd.choice(self.add_client())
+        terminal = self.rnd.choice(by_city[city])
+        steps = [timedelta(seconds=self.rnd.randint(30, 240)) for _ in range(rejects)]
+        if window is not None:
+            # последние шаги цепочки укладываются ровно в window
+            cuts = sorted(
+                self.rnd.sample(
+                    range(1, int(window.total_seconds())),
+                    sql.AMOUNT_GUESS_REJECTS - 1,
+                )
+            )
+            bounds = [0, *cuts, int(window.total_seconds())]
+            steps[-sql.AMOUNT_GUESS_REJECTS :] = [
+                timedelta(seconds=b - a) for a, b in zip(bounds, bounds[1:])
+            ]
+        amount = round(self.rnd.uniform(20_000, 50_000), 2)
+        rows = []
+        for step in steps:
+            rows.append(
+                self.transaction(trans_date, card_num, terminal, amount, "REJECT")
+            )
+            trans_date += step
+            amount = round(amount * self.rnd.uniform(0.6, 0.95), 2)
+        rows.append(self.transaction(trans_date, card_num, terminal, amount, "SUCCESS"))
+        return rows, passport
+
+    def day_transactions(self, day: date) -> list:
+        """
+        Функция для генерации операций одного дня: обычные операции и заложенные случаи
+        каждого признака мошенничества. Заложенные цепочки укладываются в рабочее время дня,
+        чтобы окна признаков не пересекали полночь
+
+        Args:
+            day (date) - день выгрузки
+
+        Returns:
+            list - строки операций дня
+        """
+        by_city = self.city_terminals()
+        day_start = datetime.combine(day, datetime.min.time())
+
+        def moment(start_hour: int = 0, end_hour: int = 24) -> datetime:
+            return day_start + timedelta(
+                seconds=self.rnd.randint(start_hour * 3600, end_hour * 3600 - 1)
+            )
+
+        rows = []
+        for _ in range(self.fraud):
+            # просроченный паспорт и паспорт из черного списка, внесенный в этот день
+            for blacklisted in (False, True):
+                valid_to = None
+                if not blacklisted:
+                    valid_to = day - timedelta(days=self.rnd.randint(1, 60))
+                card_num, passport, city = self.rnd.choice(self.add_client(valid_to))
+                if blacklisted:
+                    self.blacklist.append((day, passport))
+                trans_date = moment()
+                rows.append(
+                    self.transaction(
+                        trans_date, card_num, self.rnd.choice(by_city[city])
+                    )
+                )
+                self.plant(trans_date, passport, "passport")
+
+            # недействующий договор
+            account_valid_to = day - timedelta(days=self.rnd.randint(1, 60))
+            card_num, passport, city = self.rnd.choice(
+                self.add_client(account_valid_to=account_valid_to)
+            )
+            trans_date = moment()
+            rows.append(
+                self.transaction(trans_date, card_num, self.rnd.choice(by_city[city]))
+            )
+            self.plant(trans_date, passport, "contract")
+
+            # две операции в разных городах меньше чем за час
+            card_num, passport, city = self.rnd.choice(self.add_client())
+            other_city = self.rnd.choice([c for c in by_city if c != city])
+            first_date = moment(1, 22)
+            second_date = first_date + timedelta(minutes=self.rnd.randint(5, 55))
+            rows.append(
+                self.transaction(first_date, card_num, self.rnd.choice(by_city[city]))
+            )
+            rows.append(
+                self.transaction(
+                    second_date, card_num, self.rnd.choice(by_city[other_city])
+                )
+            )
+            self.plant(second_date, passport, "city")
+
+            # отклоненные операции с убывающими суммами и успешная меньшая сумма:
+            # обычная цепочка, возможно длиннее трех отклонений, и цепочка ровно в окно признака
+            for rejects, window in (
+                (self.rnd.randint(sql.AMOUNT_GUESS_REJECTS, 5), None),
+                (sql.AMOUNT_GUESS_REJECTS, GUESS_WINDOW),
+            ):
+                chain, passport = self.amount_chain(
+                    by_city, moment(1, 22), rejects, window
+                )
+                rows.extend(chain)
+                self.plant(chain[-1][1], passport, "amount")
+            # цепочка чуть длиннее окна признака в отчет не попадает
+            chain, _ = self.amount_chain(
+                by_city,
+                moment(1, 22),
+                sql.AMOUNT_GUESS_REJECTS,
+                GUESS_WINDOW + timedelta(seconds=self.rnd.randint(1, 120)),
+            )
+            rows.extend(chain)
+
+        # обычные операции в городе клиента
+        for _ in range(max(self.transactions - len(rows), 0)):
+            card_num, _, city = self.rnd.choice(self.normal_cards)
+            terminals = by_city.get(city) or self.rnd.choice(list(by_city.values()))
+            rows.append(
+                self.transaction(moment(), card_num, self.rnd.choice(terminals))
+            )
+
+        # идентификаторы операций идут по времени, как в исходных выгрузках
+        rows.sort(key=lambda row: row[1])
+        ids = sorted(row[0] for row in rows)
+        return [(trans_id, *row[1:]) for trans_id, row in zip(ids, rows)]
+
+    def write_transactions(self, out_dir: str, day: date, rows: list) -> None:
+        """Функция для записи операций дня в transactions_DDMMYYYY.txt"""
+        file_name = f"transactions_{day:%d%m%Y}.txt"
+        with open(os.path.join(out_dir, file_name), "w", encoding="utf-8") as f:
+            f.write(
+                "transaction_id;transaction_date;amount;card_num;"
+                "oper_type;oper_result;terminal\n"
+            )
+            for trans_id, trans_date, amount, *rest in rows:
+                amount = f"{amount:.2f}".replace(".", ",")
+                f.write(
+                    ";".join(
+                        (trans_id, f"{trans_date:%Y-%m-%d %H:%M:%S}", amount, *rest)
+                    )
+                    + "\n"
+                )
+        self.dataset.files[file_name] = len(rows)
+
+    def write_terminals(self, out_dir: str, day: date) -> None:
+        """Функция для записи полного среза терминалов в terminals_DDMMYYYY.xlsx"""
+        file_name = f"terminals_{day:%d%m%Y}.xlsx"
+        rows = [
+            (terminal_id, *values) for terminal_id, values in self.terminals.items()
+        ]
+        write_xlsx(
+            os.path.join(out_dir, file_name),
+            ("terminal_id", "terminal_type", "terminal_city", "terminal_address"),
+            rows,
+        )
+        self.dataset.files[file_name] = len(rows)
+
+    def write_blacklist(self, out_dir: str, day: date) -> None:
+        """
+        Функция для записи черного списка с накоплением с начала месяца
+        в passport_blacklist_DDMMYYYY.xlsx. Кроме паспортов клиентов каждый день в список
+        попадают несколько паспортов без счетов в банке
+        """
+        for _ in range(3):
+            self.blacklist.append((day, self.number("#### ######")))
+        file_name = f"passport_blacklist_{day:%d%m%Y}.xlsx"
+        rows = [
+            (datetime.combine(entry_dt, datetime.min.time()), passport)
+            for entry_dt, passport in self.blacklist
+            if entry_dt <= day and entry_dt.replace(day=1) == day.replace(day=1)
+        ]
+        write_xlsx(os.path.join(out_dir, file_name), ("date", "passport"), rows)
+        self.dataset.files[file_name] = len(rows)
+
+
+def write_xlsx(file_path: str, header: tuple, rows: list) -> None:
+    """
+    Функция для записи строк на первый лист xlsx файла в потоковом режиме
+
+    Args:
+        file_path (str) - путь к файлу\n
+        header (tuple) - заголовки столбцов\n
+        rows (list) - строки\n
+
+    Returns:
+        None
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file_path)
+
+
+def write_bank(curs: cursor, schema: str, dataset: Dataset) -> None:
+    """
+    Функция для пересоздания таблиц clients, accounts и cards в схеме для сгенерированных данных
+    и заполнения их сгенерированными строками. Таблицы схемы банка SOURSE_SCHEMA не пересоздаются
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        schema (str) - название схемы для сгенерированных данных\n
+        dataset (Dataset) - сгенерированные строки\n
+
+    Returns:
+        None
+    """
+    if schema == SOURSE_SCHEMA:
+        raise ValueError(
+            f"Сгенерированные данные нельзя записать в схему банка {SOURSE_SCHEMA}"
+        )
+    curs.execute(f"create schema if not exists {schema}")
+    curs.execute(
+        f"drop table if exists {schema}.clients, {schema}.accounts, {schema}.cards"
+    )
+    curs.execute(
+        f"""
+    create table {schema}.clients (
+        client_id varchar(10) primary key,
+        last_name varchar(20),
+        first_name varchar(20),
+        patronymic varchar(20),
+        date_of_birth date,
+        passport_num varchar(15),
+        passport_valid_to date,
+        phone char(16),
+        create_dt timestamp(0) default current_timestamp,
+        update_dt timestamp(0)
+    )
+    """
+    )
+    curs.execute(
+        f"""
+    create table {schema}.accounts (
+        account char(20) primary key,
+        valid_to date,
+        client varchar(10),
+        create_dt timestamp(0) default current_timestamp,
+        update_dt timestamp(0)
+    )
+    """
+    )
+    curs.execute(
+        f"""
+    create table {schema}.cards (
+        card_num char(20) primary key,
+        account char(20),
+        create_dt timestamp(0) default current_timestamp,
+        update_dt timestamp(0)
+    )
+    """
+    )
+    execute_values(
+        curs,
+        f"""
+    insert into {schema}.clients (
+        client_id, last_name, first_name, patronymic, date_of_birth,
+        passport_num, passport_valid_to, phone
+    ) values %s
+    """,
+        dataset.clients,
+    )
+    execute_values(
+        curs,
+        f"insert into {schema}.accounts (account, valid_to, client) values %s",
+        dataset.accounts,
+    )
+    execute_values(
+        curs, f"insert into {schema}.cards (card_num, account) values %s", dataset.cards
+    )
+    for table in ("clients", "accounts", "cards"):
+        curs.execute(f"analyze {schema}.{table}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Функция для создания разбора аргументов генератора. Используется и в бенчмарке"""
+    parser = argparse.ArgumentParser(
+        description="Генерация файлов выгрузки и клиентов банка с заложенными мошенническими операциями"
+    )
+    parser.add_argument("--start", default="01032021", help="первый день, DDMMYYYY")
+    parser.add_argument("--days", type=int, default=3, help="количество дней")
+    parser.add_argument(
+        "--transactions", type=int, default=15_000, help="операций в день"
+    )
+    parser.add_argument("--clients", type=int, default=5_000, help="обычных клиентов")
+    parser.add_argument(
+        "--terminals", type=int, default=1_500, help="терминалов в первый день"
+    )
+    parser.add_argument(
+        "--churn", type=float, default=0.02, help="доля терминалов, меняющихся за день"
+    )
+    parser.add_argument(
+        "--fraud",
+        type=int,
+        default=10,
+        help="заложенных случаев каждого признака в день",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора")
+    return parser
+
+
+def generator_from_args(args: argparse.Namespace) -> Generator:
+    """Функция для создания генератора по аргументам командной строки"""
+    return Generator(
+        start=datetime.strptime(args.start, "%d%m%Y").date(),
+        days=args.days,
+        transactions=args.transactions,
+        clients=args.clients,
+        terminals=args.terminals,
+        churn=args.churn,
+        fraud=args.fraud,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    from db_conn import init_db_conn
+
+    parser = build_parser()
+    parser.add_argument("--out", default="data", help="папка для файлов выгрузки")
+    parser.add_argument(
+        "--manifest",
+        default="planted_fraud.json",
+        help="файл со списком заложенных мошеннических операций",
+    )
+    parser.add_argument(
+        "--bank",
+        action="store_true",
+        help="пересоздать таблицы схемы BENCHMARK_SOURSE_SCHEMA со сгенерированными клиентами",
+    )
+    args = parser.parse_args()
+
+    dataset = generator_from_args(args).generate(args.out)
+    with open(args.manifest, "w", encoding="utf-8") as f:
+        json.dump(dataset.planted, f, ensure_ascii=False, indent=1)
+    for file_name, rows in dataset.files.items():
+        print(f"Файл {file_name}: {rows} строк")
+
+    if args.bank:
+        conn, curs = init_db_conn()
+        write_bank(curs, BENCHMARK_SOURSE_SCHEMA, dataset)
+        conn.commit()
+        curs.close()
+        conn.close()
+        print(f"Схема {BENCHMARK_SOURSE_SCHEMA}: {len(dataset.clients)} клиентов")
@@ -0,0 +1,204 @@
+import io
+import queue
+import threading
+from time import perf_counter
+from typing import Iterator, Union
+
+import pandas as pd
+import sql_scripts as sql
+from psycopg2.extensions import cursor
+from psycopg2.extras import execute_values
+from settings import STREAM_MEMORY_LIMIT_MB
+
+
+def load_values(curs: cursor, table_name: str, df: pd.DataFrame, load_date) -> int:
+    """
+    Функция для загрузки датафрейма в таблицу через execute_values
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы с исходными данными\n
+        df (pd.DataFrame) - датафрейм с типизированными данными из файла\n
+        load_date - дата загрузки\n
+
+    Returns:
+        int - количество загруженных строк
+    """
+    # добавляем строки с датой загрузки для заполнения в values
+    values = [(*row, load_date) for row in df.itertuples(index=False, name=None)]
+
+    # создаем и выполняем запрос на заполнение данных в таблицу с исходными данными
+    insert_query = f"""
+    insert into {table_name}
+    values %s
+    """
+    execute_values(curs, insert_query, values)
+    return len(values)
+
+
+def frame_to_buffer(df: pd.DataFrame, load_date) -> io.StringIO:
+    """
+    Функция для преобразования датафрейма в буфер в формате csv для COPY
+
+    Args:
+        df (pd.DataFrame) - датафрейм с типизированными данными из файла\n
+        load_date - дата загрузки\n
+
+    Returns:
+        io.StringIO - буфер с данными, готовый к чтению
+    """
+    # дата загрузки добавляется в копию: исходный датафрейм может быть срезом,
+    # заранее прочитанным файлом или кэшем и используется повторно при повторе шага
+    buffer = io.StringIO()
+    df.assign(update_dt=load_date).to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+def load_copy(curs: cursor, table_name: str, df: pd.DataFrame, load_date) -> int:
+    """
+    Функция для загрузки датафрейма в таблицу через COPY FROM STDIN из буфера в памяти
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы с исходными данными\n
+        df (pd.DataFrame) - датафрейм с типизированными данными из файла\n
+        load_date - дата загрузки\n
+
+    Returns:
+        int - количество загруженных строк
+    """
+    sql.copy_stg_source(curs, table_name, frame_to_buffer(df, load_date))
+    return len(df)
+
+
+def prefetch(
+    buffers: Iterator[io.StringIO], memory_limit: int
+) -> Iterator[io.StringIO]:
+    """
+    Функция для подготовки буферов в фоновом потоке, пока текущий буфер загружается в базу.
+    Суммарный размер подготовленных, но еще не загруженных буферов не превышает memory_limit
+
+    Args:
+        buffers (Iterator[io.StringIO]) - генератор буферов\n
+        memory_limit (int) - максимальный объем подготовленных буферов в байтах\n
+
+    Returns:
+        Iterator[io.StringIO] - буферы в исходном порядке
+    """
+    ready = queue.Queue()
+    in_flight = [0]
+    cond = threading.Condition()
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for buffer in buffers:
+                if stop.is_set():
+                    return
+                buffer.seek(0, io.SEEK_END)
+                size = buffer.tell()
+                buffer.seek(0)
+                with cond:
+                    # ждем, пока загрузчик освободит место. один буфер пропускаем всегда
+                    while in_flight[0] and in_flight[0] + size > memory_limit:
+                        if stop.is_set():
+                            return
+                        cond.wait(0.1)
+                    in_flight[0] += size
+                ready.put((buffer, size))
+            ready.put(None)
+        except BaseException as exc:
+            ready.put(exc)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            buffer, size = item
+            yield buffer
+            with cond:
+                in_flight[0] -= size
+                cond.notify()
+    finally:
+        stop.set()
+        producer.join()
+
+
+def load_stream(
+    curs: cursor,
+    table_name: str,
+    chunks: Iterator[pd.DataFrame],
+    load_date,
+    memory_limit: int,
+) -> int:
+    """
+    Функция для потоковой загрузки файла частями фиксированного размера.
+    Следующая часть читается в фоновом потоке, пока текущая загружается через COPY
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы с исходными данными\n
+        chunks (Iterator[pd.DataFrame]) - генератор частей файла\n
+        load_date - дата загрузки\n
+        memory_limit (int) - максимальный объем подготовленных частей в байтах\n
+
+    Returns:
+        int - количество загруженных строк
+    """
+    rows = [0]
+
+    def prepare() -> Iterator[io.StringIO]:
+        for df in chunks:
+            rows[0] += len(df)
+            yield frame_to_buffer(df, load_date)
+
+    for buffer in prefetch(prepare(), memory_limit):
+        sql.copy_stg_source(curs, table_name, buffer)
+    return rows[0]
+
+
+# доступные способы загрузки датафрейма во временную таблицу с исходными данными
+LOADERS = {"values": load_values, "copy": load_copy}
+
+
+def load_stg_source(
+    curs: cursor,
+    loader: str,
+    table_name: str,
+    data: Union[pd.DataFrame, Iterator[pd.DataFrame]],
+    load_date,
+) -> None:
+    """
+    Функция для загрузки данных выбранным способом с выводом скорости загрузки
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        loader (str) - способ загрузки: values, copy или stream\n
+        table_name (str) - название таблицы с исходными данными\n
+        data (pd.DataFrame | Iterator[pd.DataFrame]) - датафрейм или генератор частей файла для способа stream\n
+        load_date - дата загрузки\n
+
+    Returns:
+        None
+    """
+    start = perf_counter()
+    if loader == "stream":
+        rows = load_stream(
+            curs, table_name, data, load_date, STREAM_MEMORY_LIMIT_MB * 1024 * 1024
+        )
+    elif loader in LOADERS:
+        rows = LOADERS[loader](curs, table_name, data, load_date)
+    else:
+        raise ValueError(f"Способ загрузки {loader} не поддерживается")
+    elapsed = perf_counter() - start
+    rate = rows / elapsed if elapsed else 0.0
+    print(
+        f"Таблица {table_name} загружена через {loader}: "
+        f"{rows} строк за {elapsed:.3f} с ({rate:.0f} строк/с)"
+    )
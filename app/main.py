@@ -1,29 +1,80 @@
+import argparse
 import os
 import shutil
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from threading import Event
 from time import sleep
 
-from db_conn import init_db_conn
+from db_conn import init_db_conn, init_db_pool
 from fraud_detecter import FraudDetecter
-from settings import CODE, SCHEMA, SOURSE_SCHEMA
+from metrics import METRICS
+from plans import PLANS
+from profiling import Profiler
+from settings import (
+    CODE,
+    EXPLAIN_PLANS,
+    METRICS_JSONL,
+    METRICS_TEXTFILE,
+    PARALLEL_LOAD,
+    PLANS_BASELINE,
+    PLANS_DIR,
+    POOL_SIZE,
+    PROFILE_DIR,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_TOP_N,
+    SCHEMA,
+    SOURSE_SCHEMA,
+    UNIT_OF_WORK,
+    WATCH_INTERVAL,
+    WATCH_LATE_DIR,
+    WATCH_LATE_TIMEOUT,
+    WATCH_SETTLE_SECONDS,
+)
+from watcher import DayWatcher, group_by_date, scan_files
 
-conn, curs = init_db_conn()
-
-# получаем названия всез файлов в папке дата
-files_list = os.listdir("data")
-file_groups = {}
-# для каждого файла, достаем название, дату и расширение файла. после добавляем в каждую категорию соответсвующие названия файлов
-for file in files_list:
-    file_name, file_date = file.rsplit("_", 1)
-    file_date, file_type = file_date.split(".")
-    file_groups.setdefault(file_name, []).append(({file}, file_date))
-
-# для каждой категории файлов сортируем названия файлов по дате
-for ftype, file_list in file_groups.items():
-    sorted_file_list = sorted(file_list, key=lambda x: x[1])
-    file_groups[ftype] = sorted_file_list
+parser = argparse.ArgumentParser(
+    description="Загрузка данных и составление отчета мошенников"
+)
+parser.add_argument(
+    "--catch-up",
+    action="store_true",
+    help="догоняющий режим: без паузы между днями, следующий день читается во время загрузки текущего",
+)
+parser.add_argument(
+    "--watch",
+    action="store_true",
+    help="режим демона: папка data проверяется каждые WATCH_INTERVAL секунд, "
+    "день загружается, когда пришли файлы всех типов",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="профилирование python части: cProfile и tracemalloc по дням и шагам, отчеты в PROFILE_DIR. "
+    "файлы дня загружаются последовательно",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="продолжение прерванной загрузки: шаги, отмеченные в мета таблице как выполненные, "
+    "пропускаются. без флага отметки дня удаляются и день загружается заново",
+)
+args = parser.parse_args()
 
-# получаем количество файлов из категории в которой больше всего файлов
-r_count = len(max(file_groups.values(), key=lambda x: len(x)))
+conn, curs = init_db_conn()
+# пул подключений для параллельной загрузки файлов. при загрузке дня одной транзакцией
+# и при профилировании не нужен
+pool = (
+    init_db_pool(POOL_SIZE)
+    if PARALLEL_LOAD and not UNIT_OF_WORK and not args.profile
+    else None
+)
+profiler = (
+    Profiler(PROFILE_DIR, PROFILE_TOP_N, PROFILE_SAMPLE_INTERVAL)
+    if args.profile
+    else None
+)
 
 
 def archive_files(files_group: list) -> None:
@@ -47,19 +98,93 @@ def archive_files(files_group: list) -> None:
         print(f"Файл {file_name} перемещен в {dest_path}")
 
 
-# используя FraudDetecter загружаем данные и составляем отчет мон=шенников
-with FraudDetecter(conn, curs, CODE, SCHEMA, SOURSE_SCHEMA) as fd:
-    for i in range(r_count):
-        # имитация ежедневной загрузки
-        sleep(1)
-        # составляем список с названием файла и датой
-        date_group = [
-            (list(file_list[i][0])[0], file_list[i][1])
-            for file_list in file_groups.values()
-        ]
-        # загружаем выбранные файлы
-        fd.load_data(date_group)
-        # заполняем отчет
-        fd.rep_fraud()
-        # переносим файлы в архив
-        archive_files(date_group)
+# для каждого дня составляем список с названиями файлов и датой. файлы группируются по дате
+# из названия, поэтому пропущенный или лишний файл одного типа не сдвигает остальные дни
+date_groups = [] if args.watch else group_by_date(scan_files("data"))
+
+
+def process_day(fd: FraudDetecter, date_group: list, parsed: dict = None) -> None:
+    """
+    Функция для загрузки файлов одного дня, составления отчета и переноса файлов в архив
+
+    Args:
+        fd (FraudDetecter) - объект для загрузки данных и составления отчета\n
+        date_group (list) - список с названиями файлов и датой загрузки\n
+        parsed (dict = None) (optional) - заранее прочитанные датафреймы по названиям файлов\n
+    """
+    load_date = date_group[0][1]
+    with profiler.day(load_date) if profiler else nullcontext():
+        if UNIT_OF_WORK:
+            # загружаем файлы и составляем отчет одной транзакцией
+            with fd.unit_of_work():
+                fd.reset_checkpoints(load_date)
+                fd.load_data(date_group, parsed)
+                fd.rep_fraud()
+        else:
+            fd.reset_checkpoints(load_date)
+            # загружаем выбранные файлы. отчет составляется только после загрузки всех файлов
+            fd.load_data(date_group, parsed)
+            # заполняем отчет
+            fd.rep_fraud()
+    # переносим файлы в архив только после фиксации дня
+    archive_files(date_group)
+    fd.load_date = load_date
+    fd.checkpoint("archived", "day")
+    fd.commit()
+    # записываем замеры дня
+    METRICS.flush(METRICS_JSONL, METRICS_TEXTFILE)
+    if EXPLAIN_PLANS:
+        # сохраняем планы дня и выводим новые ухудшения относительно базовых планов
+        PLANS.flush(PLANS_DIR, PLANS_BASELINE)
+
+
+def watch(fd: FraudDetecter) -> None:
+    """
+    Функция для работы в режиме демона. Подключение к базе, пул и прочитанные модули
+    остаются открытыми между днями, день загружается сразу после прихода всех его файлов
+
+    Args:
+        fd (FraudDetecter) - объект для загрузки данных и составления отчета
+    """
+    os.makedirs("data", exist_ok=True)
+    watcher = DayWatcher(
+        "data", "archive", WATCH_LATE_DIR, WATCH_SETTLE_SECONDS, WATCH_LATE_TIMEOUT
+    )
+    # по SIGTERM демон останавливается после загрузки текущего дня
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    print(f"Ожидание файлов в папке data, проверка каждые {WATCH_INTERVAL} с")
+    try:
+        while not stop.is_set():
+            for date_group in watcher.poll():
+                process_day(fd, date_group)
+                watcher.loaded(date_group)
+                if stop.is_set():
+                    break
+            stop.wait(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    print("Ожидание файлов остановлено")
+
+
+# используя FraudDetecter загружаем данные и составляем отчет мошенников
+with FraudDetecter(conn, curs, CODE, SCHEMA, SOURSE_SCHEMA, pool) as fd:
+    if args.resume:
+        fd.load_checkpoints()
+    if args.watch:
+        watch(fd)
+    elif args.catch_up and date_groups:
+        # файлы следующего дня читаются в фоновом потоке, пока в базу загружается текущий день.
+        # запись в базу идет строго по порядку дат, чтобы история SCD2 оставалась корректной
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            next_parsed = reader.submit(fd.parse_data, date_groups[0])
+            for i, date_group in enumerate(date_groups):
+                parsed = next_parsed.result()
+                if i + 1 < len(date_groups):
+                    next_parsed = reader.submit(fd.parse_data, date_groups[i + 1])
+                process_day(fd, date_group, parsed)
+    else:
+        for date_group in date_groups:
+            # имитация ежедневной загрузки
+            sleep(1)
+            process_day(fd, date_group)
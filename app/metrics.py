@@ -0,0 +1,279 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from time import perf_counter
+
+from psycopg2.extensions import cursor
+
+# команды, для которых rowcount означает количество измененных или загруженных строк
+ROW_COMMANDS = ("INSERT", "UPDATE", "DELETE", "COPY", "MERGE")
+# модуль с запросами, по функциям которого подписываются замеры запросов
+SQL_MODULE = "sql_scripts"
+
+
+class Metrics:
+    def __init__(self) -> None:
+        """
+        Класс для сбора замеров загрузки: время, количество строк и байт по шагам, запросам и коммитам.
+        Шаги вкладываются друг в друга в пределах потока, строки и байты вложенных шагов
+        и запросов добавляются ко всем открытым шагам потока
+
+        Returns:
+            None
+        """
+        self.run_id = uuid.uuid4().hex[:12]
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # замеры, еще не записанные в файл
+        self.events = []
+        # накопленные за запуск значения по виду, названию и типу файлов
+        self.totals = {}
+        # контекстные менеджеры, которыми оборачиваются шаги верхнего уровня каждого потока.
+        # вызываются с замером шага
+        self.stage_hooks = []
+
+    def stack(self) -> list:
+        """Функция для получения открытых шагов текущего потока"""
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def context(self) -> tuple:
+        """Функция для получения типа файлов и даты загрузки из самого вложенного открытого шага"""
+        stack = self.stack()
+        if not stack:
+            return None, None
+        return stack[-1]["feed"], stack[-1]["load_date"]
+
+    @contextmanager
+    def stage(
+        self, name: str, feed: str = None, load_date: str = None, kind: str = "stage"
+    ):
+        """
+        Контекстный менеджер для замера шага загрузки
+
+        Args:
+            name (str) - название шага\n
+            feed (str = None) (optional) - тип файлов, по умолчанию из внешнего шага\n
+            load_date (str = None) (optional) - дата загрузки, по умолчанию из внешнего шага\n
+            kind (str = "stage") (optional) - вид замера: stage или commit\n
+
+        Returns:
+            dict - замер, в который можно добавить строки и байты
+        """
+        outer_feed, outer_date = self.context()
+        event = {
+            "kind": kind,
+            "name": name,
+            "feed": feed or outer_feed,
+            "load_date": load_date or outer_date,
+            "rows": 0,
+            "bytes": 0,
+        }
+        stack = self.stack()
+        stack.append(event)
+        start = perf_counter()
+        try:
+            with ExitStack() as hooks:
+                if len(stack) == 1:
+                    for hook in self.stage_hooks:
+                        hooks.enter_context(hook(event))
+                yield event
+        finally:
+            event["seconds"] = perf_counter() - start
+            stack.pop()
+            self.record(event)
+
+    def add(self, rows: int = 0, bytes: int = 0) -> None:
+        """
+        Функция для добавления строк и прочитанных из файлов байт ко всем открытым шагам
+        текущего потока
+        """
+        for event in self.stack():
+            event["rows"] += rows
+            event["bytes"] += bytes
+
+    def record(self, event: dict) -> None:
+        """Функция для сохранения завершенного замера и добавления его к итогам запуска"""
+        event["run_id"] = self.run_id
+        event["ts"] = round(time.time(), 3)
+        key = (event["kind"], event["name"], event["feed"] or "")
+        with self.lock:
+            self.events.append(event)
+            total = self.totals.setdefault(
+                key, {"seconds": 0.0, "rows": 0, "bytes": 0, "calls": 0}
+            )
+            total["seconds"] += event["seconds"]
+            total["rows"] += event["rows"]
+            total["bytes"] += event["bytes"]
+            total["calls"] += 1
+
+    def flush(self, jsonl_path: str = None, textfile_path: str = None) -> None:
+        """
+        Функция для записи накопленных замеров в файл json lines и итогов запуска
+        в текстовый файл для node exporter
+
+        Args:
+            jsonl_path (str = None) (optional) - файл для дозаписи замеров\n
+            textfile_path (str = None) (optional) - файл метрик prometheus, перезаписывается целиком\n
+
+        Returns:
+            None
+        """
+        with self.lock:
+            events, self.events = self.events, []
+            totals = {key: dict(value) for key, value in self.totals.items()}
+        if jsonl_path:
+            make_dirs(jsonl_path)
+            with open(jsonl_path, "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        if textfile_path:
+            write_textfile(textfile_path, self.run_id, totals)
+
+
+def make_dirs(file_path: str) -> None:
+    """Функция для создания папки файла, если ее нет"""
+    dir_name = os.path.dirname(file_path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+
+
+def write_textfile(textfile_path: str, run_id: str, totals: dict) -> None:
+    """
+    Функция для записи итогов запуска в формате prometheus. Файл пишется во временный
+    и переименовывается, чтобы node exporter не прочитал его наполовину
+
+    Args:
+        textfile_path (str) - путь к файлу метрик\n
+        run_id (str) - идентификатор запуска\n
+        totals (dict) - итоги по виду, названию и типу файлов\n
+
+    Returns:
+        None
+    """
+    metrics = (
+        ("seconds", "Время выполнения в секундах"),
+        ("rows", "Количество измененных или загруженных строк"),
+        ("bytes", "Количество прочитанных или отправленных байт"),
+        ("calls", "Количество вызовов"),
+    )
+    # итоги относятся к одному запуску и перезаписываются следующим, поэтому это gauge
+    # без суффикса _total. идентификатор запуска вынесен в отдельную метрику, чтобы
+    # не создавать новые ряды при каждом запуске
+    lines = [
+        "# HELP fraud_detecter_run_info Идентификатор последнего запуска",
+        "# TYPE fraud_detecter_run_info gauge",
+        f'fraud_detecter_run_info{{run_id="{run_id}"}} 1',
+    ]
+    for field, help_text in metrics:
+        metric = f"fraud_detecter_{field}"
+        lines.append(f"# HELP {metric} {help_text} за последний запуск")
+        lines.append(f"# TYPE {metric} gauge")
+        for (kind, name, feed), total in sorted(totals.items()):
+            labels = f'kind="{kind}",name="{name}",feed="{feed}"'
+            lines.append(f"{metric}{{{labels}}} {total[field]}")
+    lines.append(
+        "# HELP fraud_detecter_last_flush_timestamp_seconds Время записи метрик"
+    )
+    lines.append("# TYPE fraud_detecter_last_flush_timestamp_seconds gauge")
+    lines.append(f"fraud_detecter_last_flush_timestamp_seconds {time.time():.3f}")
+
+    make_dirs(textfile_path)
+    tmp_path = f"{textfile_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, textfile_path)
+
+
+def timed(name: str, feed: str = None):
+    """
+    Декоратор для замера метода FraudDetecter. Тип файлов и дата загрузки берутся
+    из полей feed и load_date объекта
+
+    Args:
+        name (str) - название шага\n
+        feed (str = None) (optional) - постоянный тип файлов вместо поля feed объекта\n
+
+    Returns:
+        декоратор метода
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with METRICS.stage(name, feed or self.feed, self.load_date):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def sql_function() -> str:
+    """Функция для получения названия функции из sql_scripts, которая выполняет запрос, или None"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals.get("__name__") == SQL_MODULE:
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return None
+
+
+def statement_name() -> str:
+    """Функция для получения названия запроса: функция из sql_scripts или вызвавшая функция"""
+    return sql_function() or sys._getframe(2).f_code.co_name
+
+
+class InstrumentedCursor(cursor):
+    """Курсор, который замеряет каждый запрос и COPY и добавляет строки к открытым шагам"""
+
+    def execute(self, query, vars=None):
+        name = statement_name()
+        self.before_execute(query, vars)
+        start = perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self.record(name, start)
+
+    def copy_expert(self, sql, file, size=8192):
+        name = statement_name()
+        start = perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self.record(name, start, file.tell() if hasattr(file, "tell") else 0)
+
+    def before_execute(self, query, vars) -> None:
+        """Функция, которая вызывается перед каждым запросом. В этом курсоре ничего не делает"""
+
+    def record(self, name: str, start: float, bytes: int = 0) -> None:
+        """Функция для сохранения замера запроса"""
+        seconds = perf_counter() - start
+        status = self.statusmessage or ""
+        rows = self.rowcount if status.startswith(ROW_COMMANDS) else 0
+        rows = max(rows, 0)
+        # байты, отправленные через COPY, остаются в замере запроса, в шаги идут только строки
+        METRICS.add(rows)
+        feed, load_date = METRICS.context()
+        METRICS.record(
+            {
+                "kind": "statement",
+                "name": name,
+                "feed": feed,
+                "load_date": load_date,
+                "rows": rows,
+                "bytes": bytes,
+                "seconds": seconds,
+            }
+        )
+
+
+# общий сборщик замеров процесса
+METRICS = Metrics()
@@ -0,0 +1,50 @@
+import os
+import threading
+
+import pandas as pd
+from feed_specs import FeedSpec
+from fingerprints import file_hash
+
+# версия формата кэша. при изменении чтения или преобразования типов старый кэш не используется
+CACHE_VERSION = 1
+
+
+def cache_path(cache_dir: str, spec: FeedSpec, fingerprint: str) -> str:
+    """
+    Функция для получения пути к файлу кэша
+
+    Args:
+        cache_dir (str) - папка кэша\n
+        spec (FeedSpec) - описание типа файлов\n
+        fingerprint (str) - хэш содержимого файла\n
+
+    Returns:
+        str - путь к файлу кэша
+    """
+    return os.path.join(cache_dir, f"{spec.name}_v{CACHE_VERSION}_{fingerprint}.pkl")
+
+
+def read(spec: FeedSpec, file_path: str, cache_dir: str) -> tuple:
+    """
+    Функция для чтения файла через кэш. Файл с тем же содержимым читается только один раз,
+    дальше датафрейм с уже преобразованными столбцами берется из кэша
+
+    Args:
+        spec (FeedSpec) - описание типа файлов\n
+        file_path (str) - путь к файлу\n
+        cache_dir (str) - папка кэша\n
+
+    Returns:
+        tuple - датафрейм и флаг чтения из кэша
+    """
+    path = cache_path(cache_dir, spec, file_hash(file_path))
+    if os.path.exists(path):
+        return pd.read_pickle(path), True
+
+    df = spec.read(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # пишем во временный файл и переименовываем, чтобы параллельное чтение не видело половину файла
+    tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+    return df, False
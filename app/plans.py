@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+
+import psycopg2
+from metrics import METRICS, InstrumentedCursor, make_dirs, sql_function
+from psycopg2.extensions import cursor, encodings
+from settings import PLAN_REGRESSION
+
+# запросы, которые можно выполнить через explain
+EXPLAINABLE = ("select", "insert", "update", "delete", "merge", "with", "values")
+# точка сохранения, к которой откатывается запрос, выполненный через explain analyze
+SAVEPOINT = "explain_plan"
+
+
+def explainable(query) -> bool:
+    """Функция для проверки, что запрос один и его план можно получить через explain"""
+    if not isinstance(query, str):
+        return False
+    # убираем однострочные комментарии в начале запроса
+    text = re.sub(r"^\s*(--[^\n]*\n\s*)*", "", query).strip().rstrip(";")
+    return text.lower().startswith(EXPLAINABLE) and ";" not in text
+
+
+def relation_key(relation: str) -> str:
+    """Функция для приведения названия секции к общему виду, чтобы секции разных дней совпадали"""
+    return re.sub(r"_p\d{6,8}$", "_p*", relation)
+
+
+def walk(node: dict):
+    """Функция для обхода всех узлов плана"""
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def plan_stats(plan: dict) -> dict:
+    """
+    Функция для получения показателей одного плана: полные чтения таблиц, буферы
+    и самая большая ошибка оценки количества строк
+
+    Args:
+        plan (dict) - результат explain (analyze, buffers, format json)
+
+    Returns:
+        dict - показатели плана
+    """
+    root = plan["Plan"]
+    stats = {
+        "seconds": plan.get("Execution Time", 0) / 1000,
+        "buffers": root.get("Shared Hit Blocks", 0)
+        + root.get("Shared Read Blocks", 0)
+        + root.get("Temp Read Blocks", 0),
+        "read_buffers": root.get("Shared Read Blocks", 0),
+        "seq_scans": {},
+        "rows_error": 1.0,
+        "rows_error_node": None,
+    }
+    for node in walk(root):
+        loops = node.get("Actual Loops", 0)
+        if node["Node Type"] == "Seq Scan":
+            relation = relation_key(node["Relation Name"])
+            rows = node.get("Actual Rows", 0) * loops + node.get(
+                "Rows Removed by Filter", 0
+            ) * max(loops, 1)
+            stats["seq_scans"][relation] = max(
+                stats["seq_scans"].get(relation, 0), rows
+            )
+        if not loops:
+            continue
+        # ошибка оценки в разах в любую сторону
+        estimated = max(node.get("Plan Rows", 0), 1)
+        actual = max(node.get("Actual Rows", 0), 1)
+        error = max(estimated / actual, actual / estimated)
+        if error > stats["rows_error"]:
+            stats["rows_error"] = error
+            stats["rows_error_node"] = node["Node Type"]
+    return stats
+
+
+def summarize(plans: list) -> dict:
+    """
+    Функция для сведения планов запуска по запросам и типам файлов
+
+    Args:
+        plans (list) - планы запросов с названием, типом файлов и показателями
+
+    Returns:
+        dict - по ключу "запрос:тип файлов": количество вызовов, средние буферы,
+        самые большие полные чтения таблиц и ошибка оценки строк
+    """
+    summary = {}
+    for item in plans:
+        key = f"{item['name']}:{item['feed'] or ''}"
+        stats = item["stats"]
+        total = summary.setdefault(
+            key,
+            {
+                "calls": 0,
+                "seconds": 0.0,
+                "buffers": 0,
+                "read_buffers": 0,
+                "seq_scans": {},
+                "rows_error": 1.0,
+                "rows_error_node": None,
+            },
+        )
+        total["calls"] += 1
+        total["seconds"] += stats["seconds"]
+        total["buffers"] += stats["buffers"]
+        total["read_buffers"] += stats["read_buffers"]
+        for relation, rows in stats["seq_scans"].items():
+            total["seq_scans"][relation] = max(
+                total["seq_scans"].get(relation, 0), rows
+            )
+        if stats["rows_error"] > total["rows_error"]:
+            total["rows_error"] = stats["rows_error"]
+            total["rows_error_node"] = stats["rows_error_node"]
+    for total in summary.values():
+        total["buffers_per_call"] = total["buffers"] / total["calls"]
+    return summary
+
+
+def regressions(summary: dict, baseline: dict, thresholds: dict = None) -> list:
+    """
+    Функция для поиска ухудшений планов относительно базовых: новое полное чтение большой таблицы,
+    рост буферов на вызов и ошибка оценки строк выше порога
+
+    Args:
+        summary (dict) - сводка планов запуска\n
+        baseline (dict) - сводка базовых планов\n
+        thresholds (dict = None) (optional) - пороги, по умолчанию PLAN_REGRESSION из настроек\n
+
+    Returns:
+        list - найденные ухудшения
+    """
+    thresholds = thresholds or PLAN_REGRESSION
+    found = []
+    for key, current in summary.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for relation, rows in current["seq_scans"].items():
+            if (
+                relation not in base["seq_scans"]
+                and rows >= thresholds["seq_scan_rows"]
+            ):
+                found.append(
+                    {
+                        "statement": key,
+                        "kind": "seq_scan",
+                        "message": f"новое полное чтение {relation}: {rows} строк",
+                    }
+                )
+        before, after = base["buffers_per_call"], current["buffers_per_call"]
+        if (
+            after - before >= thresholds["buffers_min"]
+            and after > before * thresholds["buffers_ratio"]
+        ):
+            found.append(
+                {
+                    "statement": key,
+                    "kind": "buffers",
+                    "message": f"буферов на вызов {before:.0f} -> {after:.0f}",
+                }
+            )
+        if current["rows_error"] > max(thresholds["rows_error"], base["rows_error"]):
+            found.append(
+                {
+                    "statement": key,
+                    "kind": "rows_error",
+                    "message": f"ошибка оценки строк в {current['rows_error']:.0f} раз "
+                    f"в узле {current['rows_error_node']}, "
+                    f"в базовом плане в {base['rows_error']:.0f} раз",
+                }
+            )
+    return found
+
+
+def load_summary(path: str) -> dict:
+    """Функция для чтения сводки планов из файла. Если файла нет, возвращает None"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_regressions(found: list) -> None:
+    """Функция для вывода найденных ухудшений планов"""
+    for item in found:
+        print(f"Ухудшение плана {item['statement']}: {item['message']}")
+
+
+class PlanCapture:
+    def __init__(self) -> None:
+        """
+        Класс для сбора планов запросов из sql_scripts в режиме диагностики.
+        Планы сохраняются по запускам с тем же идентификатором, что и замеры
+
+        Returns:
+            None
+        """
+        self.lock = threading.Lock()
+        # планы, еще не записанные в файл
+        self.pending = []
+        # показатели всех планов запуска
+        self.plans = []
+        # уже выведенные ухудшения
+        self.reported = set()
+
+    def record(self, name: str, query: str, plan: dict) -> None:
+        """Функция для сохранения плана запроса вместе с типом файлов и датой загрузки"""
+        feed, load_date = METRICS.context()
+        item = {
+            "run_id": METRICS.run_id,
+            "name": name,
+            "feed": feed,
+            "load_date": load_date,
+            "query": query,
+            "plan": plan,
+            "stats": plan_stats(plan),
+        }
+        with self.lock:
+            self.pending.append(item)
+            self.plans.append(
+                {key: item[key] for key in ("name", "feed", "load_date", "stats")}
+            )
+
+    def flush(self, plans_dir: str, baseline_path: str = None) -> list:
+        """
+        Функция для дозаписи планов в файл запуска, перезаписи сводки запуска
+        и сравнения ее с базовой
+
+        Args:
+            plans_dir (str) - папка для планов\n
+            baseline_path (str = None) (optional) - файл базовой сводки\n
+
+        Returns:
+            list - ухудшения относительно базовой сводки
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            summary = summarize(self.plans)
+        run_path = os.path.join(plans_dir, f"{METRICS.run_id}.jsonl")
+        make_dirs(run_path)
+        with open(run_path, "a", encoding="utf-8") as f:
+            for item in pending:
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+        summary_path = os.path.join(plans_dir, f"{METRICS.run_id}_summary.json")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        baseline = load_summary(baseline_path)
+        if baseline is None:
+            return []
+        found = regressions(summary, baseline)
+        new = [
+            item
+            for item in found
+            if (item["statement"], item["kind"]) not in self.reported
+        ]
+        self.reported.update((item["statement"], item["kind"]) for item in new)
+        print_regressions(new)
+        return found
+
+
+class ExplainCursor(InstrumentedCursor):
+    """
+    Курсор для режима диагностики. Перед каждым запросом из sql_scripts выполняет
+    explain (analyze, buffers, format json) и откатывает его результат до точки сохранения,
+    после чего выполняет сам запрос. Запросы выполняются дважды, режим не для ежедневной загрузки
+    """
+
+    def before_execute(self, query, vars) -> None:
+        name = sql_function()
+        if name is None:
+            return
+        if isinstance(query, bytes):
+            # execute_values передает уже собранный запрос байтами в кодировке подключения
+            query = query.decode(encodings[self.connection.encoding])
+        if not explainable(query):
+            return
+        # запросы выполняются в обход замеров, чтобы explain не попадал в метрики
+        cursor.execute(self, f"savepoint {SAVEPOINT}")
+        try:
+            cursor.execute(
+                self, "explain (analyze, buffers, format json) " + query, vars
+            )
+            plan = self.fetchone()[0][0]
+        except psycopg2.Error:
+            # ошибку покажет сам запрос
+            plan = None
+        cursor.execute(self, f"rollback to savepoint {SAVEPOINT}")
+        cursor.execute(self, f"release savepoint {SAVEPOINT}")
+        if plan is not None:
+            PLANS.record(name, query, plan)
+
+
+# общий сборщик планов процесса
+PLANS = PlanCapture()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Сравнение сводки планов запуска с базовой сводкой"
+    )
+    parser.add_argument("summary", help="файл сводки планов запуска")
+    parser.add_argument("--baseline", required=True, help="файл базовой сводки")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="сохранить сводку запуска как базовую после сравнения",
+    )
+    args = parser.parse_args()
+
+    baseline = load_summary(args.baseline)
+    if baseline is None:
+        print(f"Базовой сводки {args.baseline} нет")
+    else:
+        found = regressions(load_summary(args.summary), baseline)
+        print_regressions(found)
+        print(f"Найдено ухудшений: {len(found)}")
+    if args.save_baseline:
+        make_dirs(args.baseline)
+        shutil.copyfile(args.summary, args.baseline)
+        print(f"Сводка {args.summary} сохранена как базовая {args.baseline}")
@@ -0,0 +1,250 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+from metrics import METRICS
+
+# количество кадров в трассировке выделений памяти. одного кадра достаточно для отчета по строкам
+TRACEMALLOC_FRAMES = 1
+# выделения памяти самого профилировщика не попадают в отчет
+SKIPPED_FILES = (
+    tracemalloc.__file__,
+    cProfile.__file__,
+    pstats.__file__,
+    __file__,
+    "<unknown>",
+)
+
+
+def frame_label(frame) -> str:
+    """Функция для получения подписи кадра в свернутом стеке"""
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def collapse(frame) -> str:
+    """Функция для получения стека вызовов кадра от корня, подписи разделены точкой с запятой"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StageProfile:
+    def __init__(self, label: str) -> None:
+        """
+        Класс для накопления профиля одного шага за день: время python функций,
+        выделения памяти по строкам и пик памяти
+
+        Args:
+            label (str) - подпись шага: название, тип файлов и дата загрузки
+
+        Returns:
+            None
+        """
+        self.label = label
+        self.calls = 0
+        self.seconds = 0.0
+        self.stats = None
+        self.allocations = Counter()
+        self.allocation_counts = Counter()
+        self.peak = 0
+
+    def add_profile(self, profile: cProfile.Profile) -> None:
+        """Функция для добавления замера cProfile одного вызова шага"""
+        try:
+            stats = pstats.Stats(profile)
+        except TypeError:
+            # в профиле нет ни одного вызова
+            return
+        if self.stats is None:
+            self.stats = stats
+        else:
+            self.stats.add(stats)
+
+    def add_allocations(
+        self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot
+    ) -> None:
+        """Функция для добавления памяти, выделенной и не освобожденной за вызов шага"""
+        for diff in after.compare_to(before, "lineno"):
+            if diff.traceback[0].filename in SKIPPED_FILES:
+                continue
+            line = str(diff.traceback[0])
+            self.allocations[line] += diff.size_diff
+            self.allocation_counts[line] += diff.count_diff
+
+
+class Profiler:
+    def __init__(self, profile_dir: str, top_n: int, sample_interval: float) -> None:
+        """
+        Класс для профилирования python части загрузки по дням и шагам. Шаги верхнего уровня
+        каждого потока оборачиваются в cProfile и снимки tracemalloc, стеки всех потоков
+        с открытым шагом периодически сохраняются для построения flamegraph
+
+        Args:
+            profile_dir (str) - папка для отчетов\n
+            top_n (int) - количество строк в топах функций и выделений памяти\n
+            sample_interval (float) - период снятия стеков в секундах\n
+
+        Returns:
+            None
+        """
+        self.profile_dir = profile_dir
+        self.top_n = top_n
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.stacks = Counter()
+        # подписи открытых шагов по идентификаторам потоков
+        self.active = {}
+        self.day_thread = None
+        self.stop_sampling = threading.Event()
+
+    @contextmanager
+    def day(self, load_date: str):
+        """
+        Контекстный менеджер для профилирования одного дня. После дня отчеты записываются
+        в папку profile_dir/run_id/load_date
+
+        Args:
+            load_date (str) - дата загрузки в формате DDMMYYYY
+        """
+        self.stages, self.stacks = {}, Counter()
+        self.day_thread = threading.get_ident()
+        # трассировка памяти не останавливается между днями: шаг фонового чтения
+        # следующего дня может закончиться уже после дня
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.stop_sampling.clear()
+        sampler = threading.Thread(target=self.sample, name="profiler", daemon=True)
+        sampler.start()
+        METRICS.stage_hooks.append(self.stage)
+        start = perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = perf_counter() - start
+            METRICS.stage_hooks.remove(self.stage)
+            self.stop_sampling.set()
+            sampler.join()
+            self.write(load_date, seconds)
+
+    @contextmanager
+    def stage(self, event: dict):
+        """Контекстный менеджер для профилирования шага верхнего уровня потока"""
+        label = "_".join(
+            str(part)
+            for part in (event["name"], event["feed"], event["load_date"])
+            if part
+        )
+        thread_id = threading.get_ident()
+        with self.lock:
+            stage = self.stages.setdefault(label, StageProfile(label))
+            self.active[thread_id] = label
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # начиная с python 3.12 cProfile нельзя включить одновременно в нескольких потоках
+            profile = None
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            if profile is not None:
+                profile.disable()
+            peak = tracemalloc.get_traced_memory()[1] - current
+            after = tracemalloc.take_snapshot()
+            with self.lock:
+                self.active.pop(thread_id, None)
+                stage.calls += 1
+                stage.seconds += seconds
+                stage.peak = max(stage.peak, peak)
+                if profile is not None:
+                    stage.add_profile(profile)
+                stage.add_allocations(before, after)
+
+    def sample(self) -> None:
+        """Функция потока, который снимает стеки потоков с открытыми шагами"""
+        own_id = threading.get_ident()
+        while not self.stop_sampling.wait(self.sample_interval):
+            with self.lock:
+                active = dict(self.active)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                label = active.get(thread_id)
+                if label is None and thread_id != self.day_thread:
+                    continue
+                stack = f"{label or 'day'};{collapse(frame)}"
+                with self.lock:
+                    self.stacks[stack] += 1
+
+    def write(self, load_date: str, seconds: float) -> None:
+        """
+        Функция для записи отчетов дня: текстовый отчет с топами по шагам и за день,
+        файлы pstats по шагам и свернутые стеки
+
+        Args:
+            load_date (str) - дата загрузки\n
+            seconds (float) - время дня в секундах\n
+
+        Returns:
+            None
+        """
+        day_dir = os.path.join(self.profile_dir, METRICS.run_id, load_date)
+        os.makedirs(day_dir, exist_ok=True)
+        report = io.StringIO()
+        report.write(f"День {load_date}: {seconds:.3f} с\n")
+        day_stats = pstats.Stats()
+        for label, stage in sorted(
+            self.stages.items(), key=lambda item: -item[1].seconds
+        ):
+            report.write(
+                f"\n=== {label}: вызовов {stage.calls}, {stage.seconds:.3f} с, "
+                f"пик памяти {stage.peak / 2**20:.1f} МБ\n"
+            )
+            if stage.stats is not None:
+                stage.stats.dump_stats(os.path.join(day_dir, f"{label}.prof"))
+                self.write_stats(report, stage.stats)
+                day_stats.add(stage.stats)
+            report.write(f"Выделено памяти, топ {self.top_n} строк:\n")
+            for line, size in stage.allocations.most_common(self.top_n):
+                report.write(
+                    f"{size / 2**10:>12.1f} КБ {stage.allocation_counts[line]:>9} блоков  {line}\n"
+                )
+        if day_stats.total_calls:
+            report.write("\n=== весь день\n")
+            day_stats.dump_stats(os.path.join(day_dir, "day.prof"))
+            self.write_stats(report, day_stats)
+
+        with open(os.path.join(day_dir, "report.txt"), "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        # формат для flamegraph.pl и speedscope: стек и количество снимков
+        with open(
+            os.path.join(day_dir, "stacks.collapsed"), "w", encoding="utf-8"
+        ) as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        print(f"Профиль дня {load_date} сохранен в {day_dir}")
+
+    def write_stats(self, report: io.StringIO, stats: pstats.Stats) -> None:
+        """Функция для записи топа функций по общему и собственному времени"""
+        for sort in ("cumulative", "tottime"):
+            report.write(f"Функции по {sort}, топ {self.top_n}:\n")
+            stats.stream = report
+            stats.sort_stats(sort).print_stats(self.top_n)
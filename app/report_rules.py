@@ -0,0 +1,93 @@
+from dataclasses import dataclass, field
+
+import sql_scripts as sql
+
+
+@dataclass(frozen=True)
+class ReportRule:
+    """
+    Описание признака мошеннической операции для общего запроса отчета.
+
+    Args:
+        name (str) - короткое название признака\n
+        event_type (str) - тип мошеннической операции в отчете\n
+        condition (str) - условие на sql по полям операций дня и столбцам признаков\n
+        columns (tuple) - дополнительные столбцы признака: выражения с оконными функциями
+            по окну card_window (операции карты по времени)\n
+        lookback (str) - сколько операций до начала дня нужно признаку, интервал postgres\n
+        streamed (bool) - признак также ищется потоковой проверкой\n
+    """
+
+    name: str
+    event_type: str
+    condition: str
+    columns: tuple = field(default_factory=tuple)
+    lookback: str = None
+    streamed: bool = False
+
+
+def amount_guess_columns() -> tuple:
+    """Функция для получения сумм, результатов и времени предыдущих операций по карте"""
+    columns = []
+    for n in range(1, sql.AMOUNT_GUESS_REJECTS + 1):
+        columns.append(f"lag(amt, {n}) over card_window as amt_{n}")
+        columns.append(f"lag(oper_result, {n}) over card_window as oper_result_{n}")
+    columns.append(
+        f"lag(trans_date, {sql.AMOUNT_GUESS_REJECTS}) over card_window as guess_first_date"
+    )
+    return tuple(columns)
+
+
+def amount_guess_condition() -> str:
+    """Функция для получения условия цепочки отклоненных операций с убывающими суммами"""
+    return " and ".join(
+        ["oper_result = 'SUCCESS'"]
+        + [
+            f"oper_result_{n} = 'REJECT'"
+            for n in range(1, sql.AMOUNT_GUESS_REJECTS + 1)
+        ]
+        + ["amt_1 > amt"]
+        + [f"amt_{n + 1} > amt_{n}" for n in range(1, sql.AMOUNT_GUESS_REJECTS)]
+        + [f"trans_date - guess_first_date <= interval '{sql.AMOUNT_GUESS_WINDOW}'"]
+        # цепочка внутри дня операции, как в insert_amount_guess_sql
+        + ["guess_first_date::date = trans_date::date"]
+    )
+
+
+# реестр признаков мошеннических операций. новый признак добавляется сюда и вычисляется
+# в том же проходе по операциям дня, что и остальные
+REPORT_RULES = {
+    rule.name: rule
+    for rule in (
+        ReportRule(
+            name="passport",
+            event_type="Совершение операции при просроченном или заблокированном паспорте",
+            condition="trans_date > coalesce(passport_valid_to, '2999-12-31')::date "
+            "or trans_date::date >= blacklisted_from",
+        ),
+        ReportRule(
+            name="contract",
+            event_type="Совершение операции при недействующем договоре",
+            condition="account_valid_to < trans_date::date",
+        ),
+        ReportRule(
+            name="city_change",
+            event_type=sql.CITY_CHANGE_EVENT,
+            condition="terminal_city != prev_city "
+            f"and trans_date - prev_city_date <= interval '{sql.CITY_CHANGE_WINDOW}'",
+            columns=(
+                "lag(terminal_city) over card_window as prev_city",
+                "lag(trans_date) over card_window as prev_city_date",
+            ),
+            lookback=sql.CITY_CHANGE_WINDOW,
+            streamed=True,
+        ),
+        ReportRule(
+            name="amount_guess",
+            event_type=sql.AMOUNT_GUESS_EVENT,
+            condition=amount_guess_condition(),
+            columns=amount_guess_columns(),
+            streamed=True,
+        ),
+    )
+}
@@ -1,9 +1,117 @@
 CODE = "ANKA"
 SCHEMA = "deit"
 SOURSE_SCHEMA = "bank"
+# схема для клиентов банка, сгенерированных бенчмарком и генератором данных.
+# таблицы схемы SOURSE_SCHEMA генератор не изменяет
+BENCHMARK_SOURSE_SCHEMA = "bench_bank"
 DIM_PREFIX = "DWH_DIM"
 FACT_PREFIX = "DWH_FACT"
 
+# способ поиска мошеннических операций "Попытка подбора суммы": sql - одним запросом в базе,
+# python - эталонная построчная проверка
+AMOUNT_GUESS_MODE = "sql"
+
+# способ построения отчета: fused - один запрос с одним чтением операций дня по всем признакам
+# из app/report_rules.py, separate - отдельный запрос на каждый признак
+REPORT_ENGINE = "fused"
+# количество потоков пересчета отчета за диапазон дней (app/backfill.py), каждый со своим подключением
+BACKFILL_WORKERS = 4
+
+# способ обновления SCD2 таблиц: hash_diff - один запрос по хэшам строк,
+# tables - через временные таблицы с новыми, измененными и удаленными строками
+SCD_ENGINE = "hash_diff"
+
+# полные снимки, которые загружаются по хэшам содержимого: неизмененный файл пропускается,
+# у измененного загружаются только отличающиеся строки. только для SCD_ENGINE = "hash_diff"
+FINGERPRINT_FEEDS = ("terminals",)
+
+# период секций для секционированных таблиц: day или month
+PARTITION_INTERVAL = "day"
+# секционирование таблицы отчетов по event_dt
+REP_FRAUD_PARTITIONED = False
+
+# параллельная загрузка файлов одного дня, каждый файл в своем подключении из пула
+PARALLEL_LOAD = True
+# максимальное количество подключений в пуле
+POOL_SIZE = 3
+
+# вид временных таблиц загрузки: unlogged - в схеме SCHEMA без записи в журнал,
+# temp - в схеме сессии. таблицы создаются один раз и очищаются через truncate
+STAGING_TABLE_KIND = "unlogged"
+
+# загрузка дня одной транзакцией: все файлы, мета таблица и отчет фиксируются одним коммитом.
+# файлы дня загружаются последовательно в основном подключении, PARALLEL_LOAD не используется
+UNIT_OF_WORK = False
+# количество повторов шага загрузки после временной ошибки базы внутри транзакции дня
+STAGE_RETRIES = 2
+
+# способ загрузки во временные таблицы для каждого типа файлов: values, copy или stream.
+# stream читает txt файлы частями, для xlsx файлов используется copy
+STG_LOADERS = {
+    "terminals": "copy",
+    "transactions": "stream",
+    "passport_blacklist": "copy",
+}
+# способ чтения xlsx файлов: openpyxl - построчно в режиме только для чтения, pandas - pd.read_excel
+XLSX_READER = "openpyxl"
+# папка для кэша прочитанных файлов по хэшу содержимого, None - без кэша
+PARSE_CACHE_DIR = "cache"
+
+# количество строк в одной части файла при потоковой загрузке
+STREAM_CHUNK_SIZE = 100_000
+# максимальный объем подготовленных, но еще не загруженных частей в мегабайтах
+STREAM_MEMORY_LIMIT_MB = 64
+
+# файл для дозаписи замеров шагов и запросов в формате json lines, None - без записи
+METRICS_JSONL = "metrics/fraud_detecter.jsonl"
+# файл метрик prometheus для textfile collector node exporter, None - без записи
+METRICS_TEXTFILE = "metrics/fraud_detecter.prom"
+
+# режим диагностики: каждый запрос из sql_scripts дополнительно выполняется через
+# explain (analyze, buffers, format json) с откатом, планы сохраняются в PLANS_DIR
+EXPLAIN_PLANS = False
+# папка для планов запусков
+PLANS_DIR = "plans"
+# базовая сводка планов, с которой сравнивается каждый запуск, None - без сравнения
+PLANS_BASELINE = "plans/baseline.json"
+# пороги ухудшения плана: количество строк таблицы для нового полного чтения,
+# рост буферов на вызов в разах и минимальный рост в блоках, ошибка оценки строк в разах
+PLAN_REGRESSION = {
+    "seq_scan_rows": 10_000,
+    "buffers_ratio": 1.5,
+    "buffers_min": 1_000,
+    "rows_error": 10,
+}
+
+# папка для отчетов профилирования python части загрузки, включается флагом --profile
+PROFILE_DIR = "profiles"
+# количество строк в топах функций и выделений памяти
+PROFILE_TOP_N = 20
+# период снятия стеков для flamegraph в секундах
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# режим демона: период проверки папки data в секундах
+WATCH_INTERVAL = 5
+# сколько секунд файл не должен меняться, чтобы считаться полностью скопированным
+WATCH_SETTLE_SECONDS = 2
+# сколько секунд ждать недостающие файлы дня, после чего день загружается без них
+WATCH_LATE_TIMEOUT = 30 * 60
+# папка для файлов, пришедших после загрузки своего дня
+WATCH_LATE_DIR = "late"
+
+# потоковая проверка операций (app/stream_detector.py) пишет смену города и подбор суммы в отчет
+# в течение нескольких секунд. ежедневный отчет тогда пересчитывает эти признаки: подтвержденные
+# строки сохраняют время попадания в отчет, неподтвержденные удаляются
+STREAM_DETECTION = False
+# максимальное количество строк в одной порции потоковой проверки
+STREAM_BATCH_ROWS = 1000
+# период проверки новых строк в файле операций в секундах
+STREAM_POLL_INTERVAL = 1
+# максимальное количество карт в памяти потоковой проверки, давно не активные карты вытесняются
+STREAM_MAX_CARDS = 1_000_000
+# период обновления городов терминалов и данных клиентов по картам в секундах
+STREAM_REFRESH_INTERVAL = 300
+
 DATABASE = "dbname"
 HOST = "host"
 USER = "user"
@@ -1,6 +1,67 @@
+import re
+from datetime import datetime, timedelta
+from io import StringIO
+
 from psycopg2.extensions import cursor
 from psycopg2.extras import execute_values
 
+# выборка полей используемых в запросах для загрузки данных в таблицу с отчетами
+REP_FRAUD_FIELDS = """
+    trn.trans_date as event_dt,
+    cln.passport_num as passport,
+    cln.fio as fio,
+    cln.phone as phone,
+    '{event_type}' as event_type,
+    current_timestamp as report_dt
+    """
+
+# выборка таблицы и джоин с данными клиентов по карте, используемые в запросах для загрузки
+# данных в таблицу с отчетами. данные клиентов заранее собраны из схемы банка в refresh_card_clients
+TRANSACTIONS_JOIN_TABLES = """
+        deit.anka_dwh_fact_transactions trn
+    inner join
+        {full_code}_dwh_dim_card_clients cln on cln.card_num = trn.card_num
+    """
+
+# параметры признака "Попытка подбора суммы": количество отклоненных операций перед успешной
+# и максимальное время от первой отклоненной до успешной операции
+AMOUNT_GUESS_REJECTS = 3
+AMOUNT_GUESS_WINDOW = "20 minutes"
+# максимальное время между операциями в разных городах для признака "Совершение операций в разных городах"
+CITY_CHANGE_WINDOW = "1 hour"
+# типы мошеннических операций, которые также ищутся потоковой проверкой
+CITY_CHANGE_EVENT = "Совершение операций в разных городах в течение одного часа"
+AMOUNT_GUESS_EVENT = "Попытка подбора суммы"
+
+
+def day_start(load_date: str) -> str:
+    """
+    Функция для получения начала дня загрузки в виде литерала timestamp
+
+    Args:
+        load_date (str) - дата загрузки в формате DDMMYYYY
+
+    Returns:
+        str - литерал timestamp начала дня
+    """
+    return f"timestamp '{datetime.strptime(load_date, '%d%m%Y'):%Y-%m-%d}'"
+
+
+def in_day(column: str, load_date: str) -> str:
+    """
+    Функция для создания условия попадания поля в день загрузки.
+    Условие записано диапазоном с литералами, поэтому использует индексы и отсечение партиций
+
+    Args:
+        column (str) - поле с типом timestamp\n
+        load_date (str) - дата загрузки в формате DDMMYYYY\n
+
+    Returns:
+        str - условие для where
+    """
+    start = day_start(load_date)
+    return f"{column} >= {start} and {column} < {start} + interval '1 day'"
+
 
 def init_meta(curs: cursor, full_code: str) -> None:
     """
@@ -22,6 +83,36 @@ def init_meta(curs: cursor, full_code: str) -> None:
     )
     """
     )
+    # хэш последнего загруженного снимка и хэши его строк для пропуска неизмененных файлов
+    curs.execute(
+        f"alter table {full_code}_meta add column if not exists file_hash char(32)"
+    )
+    # последнее загруженное значение поля-водяного знака для накопительных файлов
+    curs.execute(
+        f"alter table {full_code}_meta add column if not exists watermark timestamp(0)"
+    )
+    curs.execute(
+        f"""
+    create table if not exists {full_code}_meta_fingerprints (
+        table_name varchar(100),
+        pk varchar(200),
+        row_hash char(32),
+        primary key (table_name, pk)
+    )
+    """
+    )
+    # выполненные шаги загрузки по дням и типам файлов для продолжения прерванной загрузки
+    curs.execute(
+        f"""
+    create table if not exists {full_code}_meta_checkpoints (
+        load_date date,
+        feed varchar(100),
+        stage varchar(100),
+        done_dt timestamp(0) default(current_timestamp),
+        primary key (load_date, feed, stage)
+    )
+    """
+    )
 
 
 def insert_meta(curs: cursor, target_name: str, full_code: str, schema: str) -> None:
@@ -53,7 +144,12 @@ def insert_meta(curs: cursor, target_name: str, full_code: str, schema: str) ->
 
 
 def update_meta(
-    curs: cursor, target_name: str, full_code: str, schema: str, table_name: str
+    curs: cursor,
+    target_name: str,
+    full_code: str,
+    schema: str,
+    table_name: str,
+    stg_code: str = None,
 ) -> None:
     """
     Функция для изменения мета таблицы
@@ -64,410 +160,1490 @@ def update_meta(
         full_code (str) - полный код для таблицы\n
         schema (str) - название схемы где создается таргет таблица\n
         table_name (str) - название таблицы
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
 
     Returns:
         None
     """
+    stg_code = stg_code or full_code
     curs.execute(
         f"""
     update {full_code}_meta
-        set max_update_dt = (select max(update_dt) from {full_code}_stg_source_{table_name})
+        set max_update_dt = coalesce(
+                (select max(update_dt) from {stg_code}_stg_source_{table_name}),
+                max_update_dt
+            ),
+            file_hash = null
         where schema_name = '{schema}' and table_name = '{target_name}';
     """
     )
 
 
-def scd_new(
-    curs: cursor, all_fields: str, full_code: str, table_name: str, pk: str
-) -> None:
+def meta_file_hash(curs: cursor, target_name: str, full_code: str, schema: str) -> str:
     """
-    Функция для создания временной таблицы с новыми записями
+    Функция для получения хэша последнего загруженного снимка
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        all_fields (str) - все поля с указателем stg\n
+        target_name (str) - название таргет таблицы\n
         full_code (str) - полный код для таблицы\n
-        table_name (str) - название таблицы\n
-        pk (str) - первичный ключ в таблице\n
+        schema (str) - название схемы где создается таргет таблица\n
 
     Returns:
-        None
+        str - хэш файла или None, если хэши строк снимка не сохранены
     """
     curs.execute(
         f"""
-    create table {full_code}_stg_new_{table_name} as
-        select
-        {all_fields}
-        from {full_code}_stg_source_{table_name} stg
-        left join {full_code}_v_{table_name} trg
-        on stg.{pk} = trg.{pk}
-        where trg.{pk} is null
-    """
+    select file_hash from {full_code}_meta
+    where schema_name = %s and table_name = %s
+    """,
+        (schema, target_name),
     )
+    row = curs.fetchone()
+    return row[0] if row else None
 
 
-def scd_upd(
+def update_meta_fingerprint(
     curs: cursor,
-    all_fields: str,
+    target_name: str,
     full_code: str,
-    table_name: str,
-    pk: str,
-    fields_ne_cond: str,
+    schema: str,
+    file_hash: str,
+    load_date: str,
 ) -> None:
     """
-    Функция для создания временной таблицы с измененными записями
+    Функция для изменения мета таблицы после загрузки снимка по хэшам строк
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        all_fields (str) - все поля с указателем stg\n
+        target_name (str) - название таргет таблицы\n
         full_code (str) - полный код для таблицы\n
-        table_name (str) - название таблицы\n
-        pk (str) - первичный ключ в таблице\n
-        fields_ne_cond (str) - выражение неравенства всех полей stg и trg\n
+        schema (str) - название схемы где создается таргет таблица\n
+        file_hash (str) - хэш загруженного файла\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
 
     Returns:
         None
     """
     curs.execute(
         f"""
-    create table {full_code}_stg_upd_{table_name} as
-        select
-        {all_fields}
-        from {full_code}_v_{table_name} trg
-        inner join {full_code}_stg_source_{table_name} stg
-        on stg.{pk} = trg.{pk}
-        where (
-        1 = 0
-        {fields_ne_cond}
-        )
-    """
+    update {full_code}_meta
+        set max_update_dt = {load_date},
+            file_hash = %s
+        where schema_name = %s and table_name = %s;
+    """,
+        (file_hash, schema, target_name),
     )
 
 
-def scd_del(curs: cursor, table_name: str, full_code: str, pk: str) -> None:
+def meta_watermark(curs: cursor, target_name: str, full_code: str, schema: str):
     """
-    Функция для создания временной таблицы с удаленными записями
+    Функция для получения водяного знака накопительного файла
 
     Args:
         curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название таргет таблицы\n
         full_code (str) - полный код для таблицы\n
-        table_name (str) - название таблицы\n
-        pk (str) - первичный ключ в таблице\n
+        schema (str) - название схемы где создается таргет таблица\n
 
     Returns:
-        None
+        datetime - последнее загруженное значение или None, если загрузок еще не было
     """
     curs.execute(
         f"""
-    create table {full_code}_stg_del_{table_name} as
-        select
-            trg.{pk}
-        from {full_code}_v_{table_name} trg
-        left join {full_code}_stg_source_{table_name} stg
-        on stg.{pk} = trg.{pk}
-        where stg.{pk} is null
-    """
+    select watermark from {full_code}_meta
+    where schema_name = %s and table_name = %s
+    """,
+        (schema, target_name),
     )
+    row = curs.fetchone()
+    return row[0] if row else None
 
 
-def insert_transactions(
+def update_meta_watermark(
     curs: cursor,
     target_name: str,
-    fields_str: str,
     full_code: str,
-    table_name: str,
-    load_date: str,
+    schema: str,
+    target_table: str,
+    watermark: str,
 ) -> None:
     """
-    Функция для заполнения таргет таблицы транзакций
+    Функция для сдвига водяного знака накопительного файла по загруженным данным
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        target_name (str) - название таргет таблицы\n
-        fields_dts (str) - строка с полями\n
+        target_name (str) - название таргет таблицы без схемы\n
         full_code (str) - полный код для таблицы\n
-        table_name (str) - название таблицы\n
-        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        schema (str) - название схемы где создается таргет таблица\n
+        target_table (str) - полное название таргет таблицы\n
+        watermark (str) - поле водяного знака\n
 
     Returns:
         None
     """
     curs.execute(
         f"""
-    insert into {target_name} (
-        {fields_str},
-        effective_from
-    )
-    select
-    {fields_str},
-    {load_date}
-    from {full_code}_stg_source_{table_name}
-    """
+    update {full_code}_meta
+        set watermark = (select max({watermark}) from {target_table})
+        where schema_name = %s and table_name = %s;
+    """,
+        (schema, target_name),
     )
 
 
-def target_hist(
-    curs: cursor, target_name: str, fields_dts_str: str, load_date: str
-) -> None:
+def select_fingerprints(curs: cursor, full_code: str, table_name: str) -> dict:
     """
-    Функция для создания таргет таблицы
+    Функция для получения хэшей строк последнего загруженного снимка
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        target_name (str) - название таргет таблицы\n
-        fields_dts_str (str) - строка с полями и типами данных
-        load_date (str) - скрипт для преобразования даты загрузки в тип данных date
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
 
     Returns:
-        None
+        dict - хэши строк по ключу
     """
     curs.execute(
-        f"""
-        create table if not exists {target_name}(
-            {fields_dts_str},
-            deleted_flg char(1) default 'N',
-            effective_from timestamp default ({load_date}),
-            effective_to timestamp default '2999-12-31 23:59:59'
-        )
-        """
+        f"select pk, row_hash from {full_code}_meta_fingerprints where table_name = %s",
+        (table_name,),
     )
+    return dict(curs.fetchall())
 
 
-def view(
-    curs: cursor, view_name: str, fields_str: str, target_name: str, load_date: str
+def save_fingerprints(
+    curs: cursor, full_code: str, table_name: str, fingerprints: list
 ) -> None:
     """
-    Функция для создания представления хранящего актуальные значения
+    Функция для сохранения хэшей новых и измененных строк снимка
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        view_name (str) - название представления\n
-        fields_str (str) - названия полей\n
-        target_name (str) - название таргет таблицы\n
-        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        fingerprints (list) - список пар из ключа и хэша строки\n
 
     Returns:
         None
     """
-    curs.execute(
+    execute_values(
+        curs,
         f"""
-        create or replace view {view_name} as
-        select
-            {fields_str}
-        from {target_name}
-        where {load_date} between effective_from and effective_to
-        """
+    insert into {full_code}_meta_fingerprints (table_name, pk, row_hash)
+    values %s
+    on conflict (table_name, pk) do update set row_hash = excluded.row_hash
+    """,
+        [(table_name, pk, row_hash) for pk, row_hash in fingerprints],
     )
 
 
-def target_update_new(
-    curs: cursor,
-    table_name: str,
-    target_name: str,
-    fields_str: str,
-    load_date: str,
-    full_code: str,
+def delete_fingerprints(
+    curs: cursor, full_code: str, table_name: str, pks: list = None
 ) -> None:
     """
-    Функция для заполнения таргет таблицы новыми данными
+    Функция для удаления хэшей строк снимка
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        table_name (str) - название таблицы\n
-        target_name (str) - название таргет таблицы\n
-        fields_str (str) - названия полей\n
-        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
         full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        pks (list = None) (optional) - ключи удаленных строк, по умолчанию удаляются все хэши таблицы\n
 
     Returns:
         None
     """
-    curs.execute(
-        f"""
-        insert into {target_name} (
-            {fields_str},
-            effective_from
-        )
-        select
-        {fields_str},
-        {load_date}
-        from {full_code}_stg_new_{table_name}
-        """
-    )
+    query = f"delete from {full_code}_meta_fingerprints where table_name = %s"
+    if pks is None:
+        curs.execute(query, (table_name,))
+    else:
+        curs.execute(query + " and pk = any(%s)", (table_name, pks))
 
 
-def target_update_upd(
-    curs: cursor,
-    table_name: str,
-    target_name: str,
-    fields_str: str,
-    load_date: str,
-    pk: str,
-    full_code: str,
-) -> None:
+def select_checkpoints(curs: cursor, full_code: str) -> dict:
     """
-    Функция для заполнения таргет таблицы измененными данными
+    Функция для получения выполненных шагов загрузки
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        table_name (str) - название таблицы\n
-        target_name (str) - название таргет таблицы\n
-        fields_str (str) - названия полей\n
-        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
-        pk (str) - первичный ключ в таблице\n
         full_code (str) - полный код для таблицы\n
 
     Returns:
-        None
+        dict - пары из типа файлов и шага по датам загрузки в формате DDMMYYYY
     """
-    # закрытие сесссии измененной строки
-    curs.execute(
-        f"""
-        update {target_name} set
-        effective_to = {load_date} - interval '1 second',
-        deleted_flg = 'Y'
-        where {pk} in (select {pk} from {full_code}_stg_upd_{table_name})
-            and effective_to = '2999-12-31 23:59:59'
-        """
-    )
-    # добавление измененной строки с новыми данными
     curs.execute(
-        f"""
-        insert into {target_name} (
-            {fields_str},
-            effective_from
-        )
-        select
-        {fields_str},
-        {load_date}
-        from {full_code}_stg_upd_{table_name}
-        """
+        f"select to_char(load_date, 'DDMMYYYY'), feed, stage from {full_code}_meta_checkpoints"
     )
+    checkpoints = {}
+    for load_date, feed, stage in curs.fetchall():
+        checkpoints.setdefault(load_date, set()).add((feed, stage))
+    return checkpoints
 
 
-def target_update_del(
-    curs: cursor,
-    table_name: str,
-    target_name: str,
-    fields_str: str,
-    load_date: str,
-    pk: str,
-    full_code: str,
+def save_checkpoint(
+    curs: cursor, full_code: str, load_date: str, feed: str, stage: str
 ) -> None:
     """
-    Функция для заполнения таргет таблицы удаленными данными
+    Функция для отметки выполненного шага загрузки. Отметка фиксируется вместе с результатом шага
 
     Args:
         curs (cursor) - объект курсора базы данных\n
-        table_name (str) - название таблицы\n
-        target_name (str) - название таргет таблицы\n
-        fields_str (str) - названия полей\n
-        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
-        pk (str) - первичный ключ в таблице\n
         full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+        feed (str) - тип файлов или часть загрузки дня\n
+        stage (str) - шаг загрузки\n
 
     Returns:
         None
     """
-    # закрытие сесссии удаленной строки
-    curs.execute(
-        f"""
-        update {target_name} set
-        effective_to = {load_date} - interval '1 second',
-        deleted_flg = 'Y'
-        where {pk} in (select {pk} from {full_code}_stg_del_{table_name})
-            and effective_to = '2999-12-31 23:59:59'
-        """
-    )
-    # добавление удаленной строки с новым временем
     curs.execute(
         f"""
-        insert into {target_name} (
-            {fields_str},
-            deleted_flg,
-            effective_from
-        )
-        select
-        {fields_str},
-        'Y',
-        {load_date}
-        from {target_name}
-        where {pk} in (select {pk} from {full_code}_stg_del_{table_name})
-            and effective_to != '2999-12-31 23:59:59' and deleted_flg = 'Y'
-        """
+    insert into {full_code}_meta_checkpoints (load_date, feed, stage)
+    values (to_date(%s, 'DDMMYYYY'), %s, %s)
+    on conflict (load_date, feed, stage) do update set done_dt = current_timestamp
+    """,
+        (load_date, feed, stage),
     )
 
 
-def init_rep_fraud(curs: cursor, full_code: str) -> None:
+def delete_checkpoints(curs: cursor, full_code: str, load_date: str) -> None:
     """
-    Функция для создания таблицы с отчетами мошеннечиских транзакций
+    Функция для удаления отметок шагов загрузки за день
 
     Args:
         curs (cursor) - объект курсора базы данных\n
         full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
 
     Returns:
         None
     """
     curs.execute(
-        f"""
-    create table if not exists {full_code}_rep_fraud (
-        event_dt timestamp,
-        passport varchar(200),
-        fio varchar(200),
-        phone varchar(200),
-        event_type varchar(200),
-        report_dt timestamp default(current_timestamp)
+        f"delete from {full_code}_meta_checkpoints where load_date = to_date(%s, 'DDMMYYYY')",
+        (load_date,),
     )
-    """
+
+
+def has_rows(curs: cursor, table_name: str) -> bool:
+    """
+    Функция для проверки, что таблица существует и в ней есть строки
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+
+    Returns:
+        bool - True если в таблице есть строки
+    """
+    if table_kind(curs, table_name) is None:
+        return False
+    curs.execute(f"select exists (select 1 from {table_name})")
+    return curs.fetchone()[0]
+
+
+def copy_stg_source(curs: cursor, table_name: str, buffer: StringIO) -> None:
+    """
+    Функция для загрузки данных из буфера в таблицу с исходными данными через COPY
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы с исходными данными\n
+        buffer (StringIO) - буфер с данными в формате csv\n
+
+    Returns:
+        None
+    """
+    curs.copy_expert(f"copy {table_name} from stdin with (format csv)", buffer)
+
+
+def create_stg_table(
+    curs: cursor, table_name: str, fields_dts_str: str, kind: str
+) -> None:
+    """
+    Функция для создания временной таблицы, если ее еще нет
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название временной таблицы\n
+        fields_dts_str (str) - строка с полями и типами данных\n
+        kind (str) - вид таблицы: unlogged или temp\n
+
+    Returns:
+        None
+    """
+    curs.execute(
+        f"""
+    create {kind} table if not exists {table_name} (
+        {fields_dts_str}
+    )
+    """
+    )
+
+
+def table_columns(curs: cursor, table_name: str) -> list:
+    """
+    Функция для получения полей и типов данных таблицы
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+
+    Returns:
+        list - список пар из названия поля и типа данных, пустой если таблицы нет
+    """
+    curs.execute(
+        """
+        select attname, format_type(atttypid, atttypmod)
+        from pg_attribute
+        where attrelid = to_regclass(%s) and attnum > 0 and not attisdropped
+        order by attnum
+        """,
+        (table_name,),
+    )
+    return curs.fetchall()
+
+
+def table_persistence(curs: cursor, table_name: str) -> str:
+    """
+    Функция для получения вида хранения таблицы
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+
+    Returns:
+        str - p для обычной, u для unlogged, t для temp таблицы или None если таблицы нет
+    """
+    curs.execute(
+        "select relpersistence from pg_class where oid = to_regclass(%s)",
+        (table_name,),
+    )
+    row = curs.fetchone()
+    return row[0] if row else None
+
+
+def truncate(curs: cursor, table_names: list) -> None:
+    """
+    Функция для очистки таблиц одним запросом
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_names (list) - названия таблиц\n
+
+    Returns:
+        None
+    """
+    curs.execute(f"truncate {', '.join(table_names)}")
+
+
+def drop_table(curs: cursor, table_name: str) -> None:
+    """
+    Функция для удаления таблицы
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+
+    Returns:
+        None
+    """
+    curs.execute(f"drop table if exists {table_name}")
+
+
+def create_index(curs: cursor, table_name: str, columns: tuple) -> None:
+    """
+    Функция для создания индекса, если его еще нет
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы со схемой\n
+        columns (tuple) - поля или выражения индекса\n
+
+    Returns:
+        None
+    """
+    # название индекса без схемы, составленное из названия таблицы и полей
+    index_name = "_".join([table_name.split(".", 1)[-1], *columns, "idx"])
+    index_name = re.sub(r"[\W_]+", "_", index_name).lower()
+    curs.execute(
+        f"create index if not exists {index_name} on {table_name} ({', '.join(columns)})"
+    )
+
+
+def analyze(curs: cursor, table_name: str) -> None:
+    """
+    Функция для сбора статистики по таблице для планировщика
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+
+    Returns:
+        None
+    """
+    curs.execute(f"analyze {table_name}")
+
+
+def scd_new(
+    curs: cursor,
+    all_fields: str,
+    full_code: str,
+    table_name: str,
+    pk: str,
+    stg_code: str = None,
+) -> None:
+    """
+    Функция для создания временной таблицы с новыми записями
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        all_fields (str) - все поля с указателем stg\n
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        pk (str) - первичный ключ в таблице\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        None
+    """
+    stg_code = stg_code or full_code
+    curs.execute(
+        f"""
+    create table {stg_code}_stg_new_{table_name} as
+        select
+        {all_fields}
+        from {stg_code}_stg_source_{table_name} stg
+        left join {full_code}_v_{table_name} trg
+        on stg.{pk} = trg.{pk}
+        where trg.{pk} is null
+    """
+    )
+
+
+def scd_upd(
+    curs: cursor,
+    all_fields: str,
+    full_code: str,
+    table_name: str,
+    pk: str,
+    fields_ne_cond: str,
+    stg_code: str = None,
+) -> None:
+    """
+    Функция для создания временной таблицы с измененными записями
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        all_fields (str) - все поля с указателем stg\n
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        pk (str) - первичный ключ в таблице\n
+        fields_ne_cond (str) - выражение неравенства всех полей stg и trg\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        None
+    """
+    stg_code = stg_code or full_code
+    curs.execute(
+        f"""
+    create table {stg_code}_stg_upd_{table_name} as
+        select
+        {all_fields}
+        from {full_code}_v_{table_name} trg
+        inner join {stg_code}_stg_source_{table_name} stg
+        on stg.{pk} = trg.{pk}
+        where (
+        1 = 0
+        {fields_ne_cond}
+        )
+    """
+    )
+
+
+def scd_del(
+    curs: cursor, table_name: str, full_code: str, pk: str, stg_code: str = None
+) -> None:
+    """
+    Функция для создания временной таблицы с удаленными записями
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        pk (str) - первичный ключ в таблице\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        None
+    """
+    stg_code = stg_code or full_code
+    curs.execute(
+        f"""
+    create table {stg_code}_stg_del_{table_name} as
+        select
+            trg.{pk}
+        from {full_code}_v_{table_name} trg
+        left join {stg_code}_stg_source_{table_name} stg
+        on stg.{pk} = trg.{pk}
+        where stg.{pk} is null
+    """
+    )
+
+
+def insert_transactions(
+    curs: cursor,
+    target_name: str,
+    fields_str: str,
+    full_code: str,
+    table_name: str,
+    load_date: str,
+    stg_code: str = None,
+) -> None:
+    """
+    Функция для заполнения таргет таблицы транзакций
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название таргет таблицы\n
+        fields_dts (str) - строка с полями\n
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        None
+    """
+    stg_code = stg_code or full_code
+    curs.execute(
+        f"""
+    insert into {target_name} (
+        {fields_str},
+        effective_from
+    )
+    select
+    {fields_str},
+    {load_date}
+    from {stg_code}_stg_source_{table_name}
+    """
+    )
+
+
+def insert_cumulative(
+    curs: cursor,
+    target_name: str,
+    fields: list,
+    pk: str,
+    watermark: str,
+    full_code: str,
+    table_name: str,
+    load_date: str,
+    stg_code: str = None,
+) -> int:
+    """
+    Функция для дозаписи в таргет таблицу новых записей накопительного файла.
+    Записи, которые уже есть в таргет таблице с тем же ключом и водяным знаком, пропускаются,
+    а пропавшие из файла записи не закрываются
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название таргет таблицы\n
+        fields (list) - список полей таблицы\n
+        pk (str) - первичный ключ в таблице\n
+        watermark (str) - поле водяного знака\n
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        int - количество добавленных строк
+    """
+    stg_code = stg_code or full_code
+    fields_str = ", ".join(fields)
+    curs.execute(
+        f"""
+    insert into {target_name} (
+        {fields_str},
+        row_hash,
+        effective_from
+    )
+    select distinct
+        {", ".join(f"stg.{f}" for f in fields)},
+        {row_hash(fields, "stg")},
+        {load_date}
+    from {stg_code}_stg_source_{table_name} stg
+    where not exists (
+        select 1 from {target_name} trg
+        where trg.{pk} = stg.{pk}
+            and trg.{watermark} = stg.{watermark}
+            and trg.effective_to = '2999-12-31 23:59:59'
+            and trg.deleted_flg = 'N'
+    )
+    """
+    )
+    return curs.rowcount
+
+
+def target_hist(
+    curs: cursor,
+    target_name: str,
+    fields_dts_str: str,
+    load_date: str,
+    partition_by: str = None,
+) -> None:
+    """
+    Функция для создания таргет таблицы
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название таргет таблицы\n
+        fields_dts_str (str) - строка с полями и типами данных
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date
+        partition_by (str = None) (optional) - поле для секционирования по диапазонам\n
+
+    Returns:
+        None
+    """
+    partition = f"partition by range ({partition_by})" if partition_by else ""
+    curs.execute(
+        f"""
+        create table if not exists {target_name}(
+            {fields_dts_str},
+            deleted_flg char(1) default 'N',
+            effective_from timestamp default ({load_date}),
+            effective_to timestamp default '2999-12-31 23:59:59'
+        ) {partition}
+        """
+    )
+
+
+def table_kind(curs: cursor, table_name: str) -> str:
+    """
+    Функция для получения типа таблицы
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы со схемой\n
+
+    Returns:
+        str - r для обычной таблицы, p для секционированной, None если таблицы нет
+    """
+    curs.execute(
+        "select relkind from pg_class where oid = to_regclass(%s)", (table_name,)
+    )
+    row = curs.fetchone()
+    return row[0] if row else None
+
+
+def partition_periods(
+    curs: cursor, table_name: str, column: str, interval: str
+) -> list:
+    """
+    Функция для получения начал периодов секционирования, встречающихся в таблице
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+        column (str) - поле секционирования\n
+        interval (str) - период секций: day или month\n
+
+    Returns:
+        list - список начал периодов
+    """
+    curs.execute(
+        f"""
+        select distinct date_trunc('{interval}', {column})
+        from {table_name}
+        where {column} is not null
+        """
+    )
+    return [row[0] for row in curs.fetchall()]
+
+
+def create_partition(
+    curs: cursor, table_name: str, period_start: datetime, interval: str
+) -> str:
+    """
+    Функция для создания секции за период, если ее еще нет
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название секционированной таблицы со схемой\n
+        period_start (datetime) - начало периода\n
+        interval (str) - период секций: day или month\n
+
+    Returns:
+        str - название секции
+    """
+    suffix = f"{period_start:%Y%m%d}" if interval == "day" else f"{period_start:%Y%m}"
+    partition_name = f"{table_name}_p{suffix}"
+    curs.execute(
+        f"""
+        create table if not exists {partition_name}
+        partition of {table_name}
+        for values from ('{period_start:%Y-%m-%d}') to (timestamp '{period_start:%Y-%m-%d}' + interval '1 {interval}')
+        """
+    )
+    return partition_name
+
+
+def migrate_to_partitioned(
+    curs: cursor, table_name: str, column: str, interval: str
+) -> None:
+    """
+    Функция для переноса данных обычной таблицы в секционированную таблицу с тем же названием.
+    Представления над таблицей удаляются и должны быть созданы заново
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы со схемой\n
+        column (str) - поле секционирования\n
+        interval (str) - период секций: day или month\n
+
+    Returns:
+        None
+    """
+    old_name = f"{table_name}_unpartitioned"
+    curs.execute(f"alter table {table_name} rename to {old_name.split('.', 1)[-1]}")
+    curs.execute(
+        f"""
+        create table {table_name} (like {old_name} including defaults)
+        partition by range ({column})
+        """
+    )
+    for period_start in partition_periods(curs, old_name, column, interval):
+        create_partition(curs, table_name, period_start, interval)
+    curs.execute(f"insert into {table_name} select * from {old_name}")
+    # вместе со старой таблицей удаляются ее индексы и представления
+    curs.execute(f"drop table {old_name} cascade")
+
+
+def view(
+    curs: cursor, view_name: str, fields_str: str, target_name: str, load_date: str
+) -> None:
+    """
+    Функция для создания представления хранящего актуальные значения
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        view_name (str) - название представления\n
+        fields_str (str) - названия полей\n
+        target_name (str) - название таргет таблицы\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+
+    Returns:
+        None
+    """
+    curs.execute(
+        f"""
+        create or replace view {view_name} as
+        select
+            {fields_str}
+        from {target_name}
+        where {load_date} between effective_from and effective_to
+        """
+    )
+
+
+def target_update_new(
+    curs: cursor,
+    table_name: str,
+    target_name: str,
+    fields_str: str,
+    load_date: str,
+    full_code: str,
+    stg_code: str = None,
+) -> None:
+    """
+    Функция для заполнения таргет таблицы новыми данными
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+        target_name (str) - название таргет таблицы\n
+        fields_str (str) - названия полей\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        full_code (str) - полный код для таблицы\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        None
+    """
+    stg_code = stg_code or full_code
+    curs.execute(
+        f"""
+        insert into {target_name} (
+            {fields_str},
+            effective_from
+        )
+        select
+        {fields_str},
+        {load_date}
+        from {stg_code}_stg_new_{table_name}
+        """
+    )
+
+
+def target_update_upd(
+    curs: cursor,
+    table_name: str,
+    target_name: str,
+    fields_str: str,
+    load_date: str,
+    pk: str,
+    full_code: str,
+    stg_code: str = None,
+) -> None:
+    """
+    Функция для заполнения таргет таблицы измененными данными
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+        target_name (str) - название таргет таблицы\n
+        fields_str (str) - названия полей\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        pk (str) - первичный ключ в таблице\n
+        full_code (str) - полный код для таблицы\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        None
+    """
+    stg_code = stg_code or full_code
+    # закрытие сесссии измененной строки
+    curs.execute(
+        f"""
+        update {target_name} set
+        effective_to = {load_date} - interval '1 second',
+        deleted_flg = 'Y'
+        where {pk} in (select {pk} from {stg_code}_stg_upd_{table_name})
+            and effective_to = '2999-12-31 23:59:59'
+        """
+    )
+    # добавление измененной строки с новыми данными
+    curs.execute(
+        f"""
+        insert into {target_name} (
+            {fields_str},
+            effective_from
+        )
+        select
+        {fields_str},
+        {load_date}
+        from {stg_code}_stg_upd_{table_name}
+        """
+    )
+
+
+def target_update_del(
+    curs: cursor,
+    table_name: str,
+    target_name: str,
+    fields_str: str,
+    load_date: str,
+    pk: str,
+    full_code: str,
+    stg_code: str = None,
+) -> None:
+    """
+    Функция для заполнения таргет таблицы удаленными данными
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        table_name (str) - название таблицы\n
+        target_name (str) - название таргет таблицы\n
+        fields_str (str) - названия полей\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        pk (str) - первичный ключ в таблице\n
+        full_code (str) - полный код для таблицы\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+
+    Returns:
+        None
+    """
+    stg_code = stg_code or full_code
+    # закрытие сесссии удаленной строки и добавление удаленной строки с новым временем.
+    # уже удаленные строки не закрываются повторно, копируется только закрытая сейчас версия
+    curs.execute(
+        f"""
+        with closed as (
+            update {target_name} set
+            effective_to = {load_date} - interval '1 second',
+            deleted_flg = 'Y'
+            where {pk} in (select {pk} from {stg_code}_stg_del_{table_name})
+                and effective_to = '2999-12-31 23:59:59'
+                and deleted_flg = 'N'
+            returning {fields_str}
+        )
+        insert into {target_name} (
+            {fields_str},
+            deleted_flg,
+            effective_from
+        )
+        select
+        {fields_str},
+        'Y',
+        {load_date}
+        from closed
+        """
+    )
+
+
+def row_hash(fields: list, alias: str = None) -> str:
+    """
+    Функция для создания выражения хэша строки по всем полям
+
+    Args:
+        fields (list) - список полей\n
+        alias (str = None) (optional) - указатель таблицы для полей\n
+
+    Returns:
+        str - выражение md5 от всех полей строки
+    """
+    prefix = f"{alias}." if alias else ""
+    return f"md5(row({', '.join(prefix + f for f in fields)})::text)"
+
+
+def init_row_hash(curs: cursor, target_name: str, fields: list) -> None:
+    """
+    Функция для добавления в таргет таблицу поля с хэшем строки. Для уже загруженных строк хэш
+    заполняется один раз при добавлении поля
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название таргет таблицы\n
+        fields (list) - список полей таблицы\n
+
+    Returns:
+        None
+    """
+    curs.execute(
+        """
+        select 1 from pg_attribute
+        where attrelid = to_regclass(%s) and attname = 'row_hash' and not attisdropped
+        """,
+        (target_name,),
+    )
+    if curs.fetchone():
+        return
+    curs.execute(f"alter table {target_name} add column row_hash char(32)")
+    curs.execute(f"update {target_name} set row_hash = {row_hash(fields)}")
+
+
+def scd_merge(
+    curs: cursor,
+    target_name: str,
+    fields: list,
+    pk: str,
+    full_code: str,
+    table_name: str,
+    load_date: str,
+    stg_code: str = None,
+    deleted_name: str = None,
+) -> tuple:
+    """
+    Функция для обновления таргет таблицы SCD2 одним запросом. Новые, измененные и удаленные
+    строки находятся одним полным соединением источника с актуальными версиями по хэшу строки,
+    изменения применяются в том же запросе без промежуточных таблиц
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название таргет таблицы\n
+        fields (list) - список полей таблицы\n
+        pk (str) - первичный ключ в таблице\n
+        full_code (str) - полный код для таблицы\n
+        table_name (str) - название таблицы\n
+        load_date (str) - скрипт для преобразования даты загрузки в тип данных date\n
+        stg_code (str = None) (optional) - код для временных таблиц, по умолчанию full_code\n
+        deleted_name (str = None) (optional) - таблица с ключами удаленных строк. если задана,
+            источник содержит только изменения снимка и остальные строки не закрываются\n
+
+    Returns:
+        tuple - количество новых, измененных и удаленных строк
+    """
+    stg_code = stg_code or full_code
+    fields_str = ", ".join(fields)
+    # при загрузке изменений сравниваются только затронутые ключи
+    delta_cond = ""
+    if deleted_name:
+        delta_cond = f"""
+                and (
+                    {pk} in (select {pk} from {stg_code}_stg_source_{table_name})
+                    or {pk} in (select {pk} from {deleted_name})
+                )"""
+    curs.execute(
+        f"""
+        with src as (
+            select
+                {fields_str},
+                {row_hash(fields)} as row_hash
+            from {stg_code}_stg_source_{table_name}
+        ),
+        cur as (
+            select
+                {pk},
+                row_hash,
+                deleted_flg
+            from {target_name}
+            where effective_to = '2999-12-31 23:59:59'{delta_cond}
+        ),
+        diff as (
+            select
+                coalesce(src.{pk}, cur.{pk}) as {pk},
+                case
+                    when cur.{pk} is null then 'N'
+                    when src.{pk} is null then 'D'
+                    else 'U'
+                end as change_type
+            from src
+            full join cur on src.{pk} = cur.{pk}
+            where
+                cur.{pk} is null
+                or (src.{pk} is null and cur.deleted_flg = 'N')
+                or (
+                    src.{pk} is not null
+                    and (src.row_hash is distinct from cur.row_hash or cur.deleted_flg = 'Y')
+                )
+        ),
+        closed as (
+            update {target_name} trg set
+                effective_to = {load_date} - interval '1 second',
+                deleted_flg = 'Y'
+            from diff
+            where trg.{pk} = diff.{pk}
+                and diff.change_type in ('U', 'D')
+                and trg.effective_to = '2999-12-31 23:59:59'
+            returning trg.*
+        ),
+        inserted as (
+            insert into {target_name} (
+                {fields_str},
+                row_hash,
+                effective_from
+            )
+            select
+                {", ".join(f"src.{f}" for f in fields)},
+                src.row_hash,
+                {load_date}
+            from src
+            inner join diff on diff.{pk} = src.{pk}
+            returning 1
+        ),
+        deleted as (
+            insert into {target_name} (
+                {fields_str},
+                row_hash,
+                deleted_flg,
+                effective_from
+            )
+            select
+                {", ".join(f"closed.{f}" for f in fields)},
+                closed.row_hash,
+                'Y',
+                {load_date}
+            from closed
+            inner join diff on diff.{pk} = closed.{pk}
+            where diff.change_type = 'D'
+            returning 1
+        )
+        select
+            count(*) filter (where change_type = 'N'),
+            count(*) filter (where change_type = 'U'),
+            count(*) filter (where change_type = 'D')
+        from diff
+        """
+    )
+    return curs.fetchone()
+
+
+def init_card_clients(curs: cursor, full_code: str) -> None:
+    """
+    Функция для создания таблицы с данными клиентов по номеру карты без пробелов
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+
+    Returns:
+        None
+    """
+    curs.execute(
+        f"""
+    create table if not exists {full_code}_dwh_dim_card_clients (
+        card_num varchar(200) primary key,
+        passport_num varchar(200),
+        fio varchar(200),
+        phone varchar(200),
+        passport_valid_to date,
+        account_valid_to date,
+        row_hash char(32)
+    )
+    """
+    )
+
+
+def refresh_card_clients(
+    curs: cursor, full_code: str, sourse_schema: str, watermark=None
+) -> tuple:
+    """
+    Функция для обновления таблицы с данными клиентов по карте из схемы банка.
+    Пересобираются только карты, у которых с водяного знака изменилась строка карты, счета
+    или клиента по create_dt и update_dt. Записываются только новые и изменившиеся по хэшу строки,
+    Удаленные в банке строки не меняют create_dt и update_dt, поэтому при каждом обновлении
+    удаляются строки всех карт, которые больше не соединяются со счетом и клиентом.
+    Без водяного знака пересобираются все карты
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        sourse_schema (str) - схема банка\n
+        watermark (datetime = None) (optional) - время последнего учтенного изменения в банке\n
+
+    Returns:
+        tuple - количество добавленных или измененных строк, количество удаленных строк
+        и новый водяной знак
+    """
+    fields = [
+        "passport_num",
+        "fio",
+        "phone",
+        "passport_valid_to",
+        "account_valid_to",
+    ]
+    target_name = f"{full_code}_dwh_dim_card_clients"
+    full = watermark is None
+    # строка изменилась, если время создания или изменения не раньше водяного знака.
+    # строки с тем же временем пересобираются повторно и отсекаются сравнением хэшей
+    since = {
+        alias: "true"
+        if full
+        else f"greatest({alias}.create_dt, {alias}.update_dt) >= %(watermark)s"
+        for alias in ("crd", "acc", "cln")
+    }
+    changed_filter = (
+        ""
+        if full
+        else "where trim(crd.card_num) in (select card_num from changed_cards)"
+    )
+    curs.execute(
+        f"""
+    with changed_cards as (
+        select
+            trim(crd.card_num) as card_num,
+            greatest(crd.create_dt, crd.update_dt) as change_dt
+        from
+            {sourse_schema}.cards crd
+        where
+            {since['crd']}
+        union all
+        select
+            trim(crd.card_num),
+            greatest(acc.create_dt, acc.update_dt)
+        from
+            {sourse_schema}.accounts acc
+        inner join
+            {sourse_schema}.cards crd on crd.account = acc.account
+        where
+            {since['acc']}
+        union all
+        select
+            trim(crd.card_num),
+            greatest(cln.create_dt, cln.update_dt)
+        from
+            {sourse_schema}.clients cln
+        inner join
+            {sourse_schema}.accounts acc on acc.client = cln.client_id
+        inner join
+            {sourse_schema}.cards crd on crd.account = acc.account
+        where
+            {since['cln']}
+    ),
+    source as (
+        select distinct on (trim(crd.card_num))
+            trim(crd.card_num) as card_num,
+            cln.passport_num,
+            cln.last_name||' '||cln.first_name||' '||cln.patronymic as fio,
+            cln.phone::varchar(200) as phone,
+            cln.passport_valid_to,
+            acc.valid_to as account_valid_to
+        from
+            {sourse_schema}.cards crd
+        inner join
+            {sourse_schema}.accounts acc on acc.account = crd.account
+        inner join
+            {sourse_schema}.clients cln on acc.client = cln.client_id
+        {changed_filter}
+        order by
+            trim(crd.card_num), crd.update_dt desc nulls last, crd.account
+    ),
+    upserted as (
+        insert into {target_name} (card_num, {', '.join(fields)}, row_hash)
+        select
+            card_num,
+            {', '.join(fields)},
+            {row_hash(fields)}
+        from
+            source
+        on conflict (card_num) do update set
+            {', '.join(f'{f} = excluded.{f}' for f in fields)},
+            row_hash = excluded.row_hash
+        where
+            {target_name}.row_hash is distinct from excluded.row_hash
+        returning 1
+    ),
+    deleted as (
+        delete from {target_name} tgt
+        where
+            not exists (
+                select 1
+                from
+                    {sourse_schema}.cards crd
+                inner join
+                    {sourse_schema}.accounts acc on acc.account = crd.account
+                inner join
+                    {sourse_schema}.clients cln on acc.client = cln.client_id
+                where
+                    trim(crd.card_num) = tgt.card_num
+            )
+        returning 1
     )
+    select
+        (select count(*) from upserted),
+        (select count(*) from deleted),
+        (select max(change_dt) from changed_cards)
+    """,
+        {"watermark": watermark},
+    )
+    upserted, deleted, last_change = curs.fetchone()
+    if last_change is not None and (watermark is None or last_change > watermark):
+        watermark = last_change
+    return upserted, deleted, watermark
 
 
-def insert_rep_fraud(curs: cursor, full_code: str, load_date: str) -> None:
+def set_meta_watermark(
+    curs: cursor, target_name: str, full_code: str, schema: str, watermark
+) -> None:
     """
-    Функция для заполнения данными в таблицу с отчетами мошеннечиских транзакций
+    Функция для записи водяного знака таблицы, которая собирается не из файла
 
     Args:
         curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название таргет таблицы без схемы\n
         full_code (str) - полный код для таблицы\n
-        load_date (str) - дата загрузки\n
+        schema (str) - название схемы где создается таргет таблица\n
+        watermark (datetime) - новое значение водяного знака\n
 
     Returns:
         None
     """
-    # выборка полей используемых в запросах для загрузки данных в таблицу с отчетами
-    rep_fraud_fields = """
-    trn.trans_date as event_dt,
-    cln.passport_num as passport,
-    cln.last_name||' '||cln.first_name||' '||cln.patronymic as fio,
-    cln.phone as phone,
-    '{event_type}' as event_type,
-    current_timestamp as report_dt
+    curs.execute(
+        f"""
+    update {full_code}_meta
+        set watermark = %s
+        where schema_name = %s and table_name = %s;
+    """,
+        (watermark, schema, target_name),
+    )
+
+
+def not_reported(full_code: str, event_dt: str, passport: str, event_type: str) -> str:
     """
+    Функция для получения условия, что операция еще не попала в отчет с тем же типом
 
-    # выборка таблицы и джоины таблиц используемых в запросах для загрузки данных в таблицу с отчетами
-    transactions_join_tables = """
-        deit.anka_dwh_fact_transactions trn
-    inner join
-        bank.cards crd on trim(crd.card_num) = trn.card_num
-    inner join
-        bank.accounts acc on acc.account = crd.account
-    inner join
-        bank.clients cln on acc.client = cln.client_id
+    Args:
+        full_code (str) - полный код для таблицы\n
+        event_dt (str) - выражение времени операции\n
+        passport (str) - выражение паспорта клиента\n
+        event_type (str) - выражение типа мошеннической операции\n
+
+    Returns:
+        str - условие для where
+    """
+    return f"""not exists (
+                select 1
+                from {full_code}_rep_fraud rep
+                where rep.event_dt = {event_dt}
+                    and rep.passport = {passport}
+                    and rep.event_type = {event_type}
+            )"""
+
+
+def init_rep_fraud(curs: cursor, full_code: str, partition_by: str = None) -> None:
+    """
+    Функция для создания таблицы с отчетами мошеннечиских транзакций
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        partition_by (str = None) (optional) - поле для секционирования по диапазонам\n
+
+    Returns:
+        None
+    """
+    partition = f"partition by range ({partition_by})" if partition_by else ""
+    curs.execute(
+        f"""
+    create table if not exists {full_code}_rep_fraud (
+        event_dt timestamp,
+        passport varchar(200),
+        fio varchar(200),
+        phone varchar(200),
+        event_type varchar(200),
+        report_dt timestamp default(current_timestamp)
+    ) {partition}
+    """
+    )
+
+
+def delete_rep_fraud_day(
+    curs: cursor,
+    full_code: str,
+    load_date: str,
+    event_types: list,
+    stream_types: list = (),
+) -> int:
+    """
+    Функция для удаления из отчета строк заданных типов за день операций.
+    Время попадания в отчет удаленных строк типов stream_types сохраняется во временную
+    таблицу stream_report_dt, чтобы restore_stream_report_dt вернул его подтвержденным строкам
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+        event_types (list) - типы мошеннических операций\n
+        stream_types (list = ()) (optional) - типы, которые пишет потоковая проверка\n
+
+    Returns:
+        int - количество удаленных строк
+    """
+    if not event_types:
+        return 0
+    if not stream_types:
+        curs.execute(
+            f"""
+        delete from {full_code}_rep_fraud
+        where
+            {in_day('event_dt', load_date)}
+            and event_type = any(%s)
+        """,
+            (list(event_types),),
+        )
+        return curs.rowcount
+
+    curs.execute(
+        """
+    create temp table if not exists stream_report_dt (
+        event_dt timestamp,
+        passport varchar(200),
+        event_type varchar(200),
+        report_dt timestamp
+    ) on commit drop;
+    truncate stream_report_dt;
+    """
+    )
+    # удаление и сохранение одним запросом: строка, добавленная потоковой проверкой
+    # между ними, не потеряет время попадания в отчет
+    curs.execute(
+        f"""
+    with deleted as (
+        delete from {full_code}_rep_fraud
+        where
+            {in_day('event_dt', load_date)}
+            and event_type = any(%s)
+        returning event_dt, passport, event_type, report_dt
+    ),
+    saved as (
+        insert into stream_report_dt
+        select
+            event_dt,
+            passport,
+            event_type,
+            min(report_dt)
+        from
+            deleted
+        where
+            event_type = any(%s)
+        group by
+            event_dt,
+            passport,
+            event_type
+    )
+    select count(*) from deleted
+    """,
+        (list(event_types), list(stream_types)),
+    )
+    return curs.fetchone()[0]
+
+
+def restore_stream_report_dt(curs: cursor, full_code: str, load_date: str) -> int:
+    """
+    Функция для возврата времени попадания в отчет строкам, которые нашла потоковая проверка
+    и подтвердил пересчет отчета за день. Неподтвержденные строки потоковой проверки
+    остаются удаленными
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+
+    Returns:
+        int - количество строк, которым возвращено время
+    """
+    curs.execute(
+        f"""
+    update {full_code}_rep_fraud rep
+        set report_dt = hit.report_dt
+    from
+        stream_report_dt hit
+    where
+        {in_day('rep.event_dt', load_date)}
+        and rep.event_dt = hit.event_dt
+        and rep.passport = hit.passport
+        and rep.event_type = hit.event_type
+        and rep.report_dt > hit.report_dt
     """
+    )
+    restored = curs.rowcount
+    curs.execute("drop table stream_report_dt")
+    return restored
+
+
+def insert_rep_fraud(
+    curs: cursor,
+    full_code: str,
+    load_date: str,
+    amount_guess_mode: str = "sql",
+    skip_reported: bool = False,
+) -> None:
+    """
+    Функция для заполнения данными в таблицу с отчетами мошеннечиских транзакций
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+        amount_guess_mode (str = "sql") (optional) - способ поиска подбора суммы: sql или python\n
+        skip_reported (bool = False) (optional) - не добавлять операции, уже найденные потоковой
+        проверкой: смена города и подбор суммы дополняют отчет только пропущенными операциями\n
 
+    Returns:
+        None
+    """
     # поиск мошеннеческих операций "Совершение операции при просроченном или заблокированном паспорте"
     curs.execute(
         f"""
     insert into {full_code}_rep_fraud (
         select
-            {rep_fraud_fields.format(event_type='Совершение операции при просроченном или заблокированном паспорте')}
+            {REP_FRAUD_FIELDS.format(event_type='Совершение операции при просроченном или заблокированном паспорте')}
         from
-            {transactions_join_tables}
+            {TRANSACTIONS_JOIN_TABLES.format(full_code=full_code)}
         left join
             deit.anka_dwh_fact_passport_blacklist blk on trim(blk.passport_num) = trim(cln.passport_num)
         where
-            trn.trans_date::date = to_date('{load_date}', 'DDMMYYYY')
+            {in_day('trn.trans_date', load_date)}
             and
             (trn.trans_date > coalesce(cln.passport_valid_to, '2999-12-31')::date
             or
@@ -481,125 +1657,459 @@ def insert_rep_fraud(curs: cursor, full_code: str, load_date: str) -> None:
         f"""
     insert into {full_code}_rep_fraud (
         select
-            {rep_fraud_fields.format(event_type='Совершение операции при недействующем договоре')}
+            {REP_FRAUD_FIELDS.format(event_type='Совершение операции при недействующем договоре')}
         from
-            {transactions_join_tables}
+            {TRANSACTIONS_JOIN_TABLES.format(full_code=full_code)}
         where
-            trn.trans_date::date = to_date('{load_date}', 'DDMMYYYY')
+            {in_day('trn.trans_date', load_date)}
             and
-            acc.valid_to::date < trn.trans_date::date
+            cln.account_valid_to < trn.trans_date::date
     )
     """
     )
 
     # поиск мошеннеческих операций "Совершение операций в разных городах в течение одного часа"
+    insert_city_change(curs, full_code, load_date, skip_reported)
+
+    # поиск мошеннеческих операций "Попытка подбора суммы"
+    if amount_guess_mode == "sql":
+        insert_amount_guess_sql(curs, full_code, load_date, skip_reported)
+    elif amount_guess_mode == "python":
+        insert_amount_guess_python(curs, full_code, load_date, skip_reported)
+    else:
+        raise ValueError(f"Способ поиска {amount_guess_mode} не поддерживается")
+
+
+def insert_city_change(
+    curs: cursor, full_code: str, load_date: str, skip_reported: bool = False
+) -> None:
+    """
+    Функция для поиска мошеннеческих операций "Совершение операций в разных городах в течение одного часа".
+    Просматриваются только операции дня загрузки и последний CITY_CHANGE_WINDOW предыдущего дня,
+    поэтому время работы не зависит от объема накопленной истории.
+    Город терминала берется из версии, действовавшей в день операции: файл терминалов за день
+    содержит состояние терминалов на этот день
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+        skip_reported (bool = False) (optional) - пропускать операции, уже попавшие в отчет\n
+
+    Returns:
+        None
+    """
+    reported_cond = (
+        "and "
+        + not_reported(
+            full_code, "trn.trans_date", "cln.passport_num", f"'{CITY_CHANGE_EVENT}'"
+        )
+        if skip_reported
+        else ""
+    )
     curs.execute(
         f"""
     insert into {full_code}_rep_fraud (
-        with ordered_city as (
+        with window_transactions as (
             select
+                trn.trans_id,
                 trn.trans_date,
                 trn.card_num,
-                lag(trm.terminal_city) over (partition by trn.card_num order by trn.trans_date) as prev_city,
-                trm.terminal_city
+                (
+                    select
+                        trm.terminal_city
+                    from
+                        deit.anka_dwh_dim_terminals_hist trm
+                    where
+                        trm.terminal_id = trn.terminal
+                        and trm.effective_from < trn.trans_date::date + interval '1 day'
+                    order by
+                        trm.effective_from desc
+                    limit 1
+                ) as terminal_city
             from
                 deit.anka_dwh_fact_transactions trn
-            inner join
-                deit.anka_dwh_dim_terminals_hist trm on trn.terminal = trm.terminal_id
+            where
+                trn.trans_date >= {day_start(load_date)} - interval '{CITY_CHANGE_WINDOW}'
+                and trn.trans_date < {day_start(load_date)} + interval '1 day'
         ),
-        ordered_line as (
+        ordered_city as (
             select
+                trans_id,
                 trans_date,
-                card_num,
-                prev_city,
                 terminal_city,
-                dense_rank() over (partition by card_num order by trans_date) as line_number
+                lag(terminal_city) over card_window as prev_city,
+                lag(trans_date) over card_window as prev_date
+            from
+                window_transactions
+            window card_window as (partition by card_num order by trans_date)
+        ),
+        changed_city as (
+            select
+                trans_id
             from
                 ordered_city
-            where terminal_city != prev_city
+            where
+                trans_date >= {day_start(load_date)}
+                and terminal_city != prev_city
+                and trans_date - prev_date <= interval '{CITY_CHANGE_WINDOW}'
         )
         select
-            {rep_fraud_fields.format(event_type='Совершение операций в разных городах в течение одного часа')}
+            {REP_FRAUD_FIELDS.format(event_type=CITY_CHANGE_EVENT)}
         from
-            {transactions_join_tables}
+            {TRANSACTIONS_JOIN_TABLES.format(full_code=full_code)}
         inner join
-            ordered_line ord on ord.trans_date = trn.trans_date
+            changed_city chg on chg.trans_id = trn.trans_id
         where
-            ord.trans_date::date = to_date('{load_date}', 'DDMMYYYY')
+            {in_day('trn.trans_date', load_date)}
+            {reported_cond}
     )
     """
     )
 
-    # поиск мошеннеческих операций "Попытка подбора суммы"
-    # получаем все данные с нужными полями, суммой операции и результатом операции, отсортированные по карте и времени
+
+def insert_amount_guess_sql(
+    curs: cursor, full_code: str, load_date: str, skip_reported: bool = False
+) -> None:
+    """
+    Функция для поиска мошеннеческих операций "Попытка подбора суммы" одним запросом.
+    Операция считается мошеннической, если перед ней по той же карте прошли AMOUNT_GUESS_REJECTS
+    отклоненных операций, каждая сумма меньше предыдущей, сама операция успешна, ее сумма меньше
+    последней отклоненной и вся цепочка уложилась в AMOUNT_GUESS_WINDOW
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+        skip_reported (bool = False) (optional) - пропускать операции, уже попавшие в отчет\n
+
+    Returns:
+        None
+    """
+    reported_cond = (
+        "and "
+        + not_reported(
+            full_code, "trn.trans_date", "cln.passport_num", f"'{AMOUNT_GUESS_EVENT}'"
+        )
+        if skip_reported
+        else ""
+    )
+    # для каждой операции достаем суммы и результаты предыдущих операций по той же карте
+    lags = ",\n\t\t\t\t".join(
+        f"lag(trn.amt, {n}) over card_window as amt_{n},\n\t\t\t\t"
+        f"lag(trn.oper_result, {n}) over card_window as oper_result_{n}"
+        for n in range(1, AMOUNT_GUESS_REJECTS + 1)
+    )
+    # все предыдущие операции отклонены и суммы убывают до успешной операции
+    chain_cond = "\n\t\t\t\tand ".join(
+        [f"oper_result_{n} = 'REJECT'" for n in range(1, AMOUNT_GUESS_REJECTS + 1)]
+        + ["amt_1 > amt"]
+        + [f"amt_{n + 1} > amt_{n}" for n in range(1, AMOUNT_GUESS_REJECTS)]
+    )
+    curs.execute(
+        f"""
+    insert into {full_code}_rep_fraud (
+        with ordered as (
+            select
+                trn.trans_id,
+                trn.trans_date,
+                trn.amt,
+                trn.oper_result,
+                {lags},
+                lag(trn.trans_date, {AMOUNT_GUESS_REJECTS}) over card_window as first_date
+            from
+                deit.anka_dwh_fact_transactions trn
+            where
+                {in_day('trn.trans_date', load_date)}
+            window card_window as (partition by trn.card_num order by trn.trans_date)
+        ),
+        guessed as (
+            select
+                trans_id
+            from
+                ordered
+            where
+                oper_result = 'SUCCESS'
+                and {chain_cond}
+                and trans_date - first_date <= interval '{AMOUNT_GUESS_WINDOW}'
+        )
+        select
+            {REP_FRAUD_FIELDS.format(event_type=AMOUNT_GUESS_EVENT)}
+        from
+            {TRANSACTIONS_JOIN_TABLES.format(full_code=full_code)}
+        inner join
+            guessed gss on gss.trans_id = trn.trans_id
+        where
+            {in_day('trn.trans_date', load_date)}
+            {reported_cond}
+    )
+    """
+    )
+
+
+def insert_amount_guess_python(
+    curs: cursor, full_code: str, load_date: str, skip_reported: bool = False
+) -> None:
+    """
+    Функция для поиска мошеннеческих операций "Попытка подбора суммы" построчно в python.
+    Эталонная реализация того же правила, что и insert_amount_guess_sql
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+        skip_reported (bool = False) (optional) - пропускать операции, уже попавшие в отчет\n
+
+    Returns:
+        None
+    """
+    # получаем все данные с нужными полями, картой, суммой операции и результатом операции, отсортированные по карте и времени
     curs.execute(
         f"""
     select
-        {rep_fraud_fields.format(event_type='Попытка подбора суммы')},
+        {REP_FRAUD_FIELDS.format(event_type=AMOUNT_GUESS_EVENT)},
+        trn.card_num,
         trn.amt,
         trn.oper_result
     from
-        {transactions_join_tables}
+        {TRANSACTIONS_JOIN_TABLES.format(full_code=full_code)}
     where
-        trn.trans_date::date = to_date('{load_date}', 'DDMMYYYY')
+        {in_day('trn.trans_date', load_date)}
     order by
         trn.card_num, event_dt
     """
     )
 
     # получаем данные выборки
-    transactions_per_fio = curs.fetchall()
+    transactions_per_card = curs.fetchall()
+    window = timedelta_from_interval(AMOUNT_GUESS_WINDOW)
 
-    i = 0
     values = []
-    t_count = len(transactions_per_fio)
-    # цикл до тех порЮ пока не проверим все строки
-    while i < t_count:
-        row = transactions_per_fio[i]
-        passport = row[1]
-        oper_result = row[-1]
-        amt = float(row[-2])
-        oper_date = row[0]
-        # если статус строки - "REJECT"
-        if oper_result == "REJECT":
-            j = 1
-            # объявляем переменные с последней суммой и датой транзакции
-            last_amt = amt
-            last_oper_date = row[0]
-            # до тех пор пока статус следующей строки - "REJECT"
-            while transactions_per_fio[j + i][-1] == "REJECT":
-                next_row = transactions_per_fio[j + i]
-                new_amt = float(next_row[-2])
-                new_oper_date = next_row[0]
-                # если сумма следующей транзакции, меньше чем последняя - переопределяем последнюю сумму и дату транзакции
-                # иначе = выходим из цикла
-                if last_amt > new_amt:
-                    last_amt = new_amt
-                    last_oper_date = new_oper_date
-                    j += 1
-                else:
-                    i += 1
-                    break
-            # количество последующих отклоненных строк больше или равно двум
-            jm2 = j >= 2
-            # статус последней операции - "SUCCESS"
-            oper_success = transactions_per_fio[j + i][-1] == "SUCCESS"
-            # последняя отклоненная сумма больше следующей суммы транзакции
-            more_then_last = last_amt > float(transactions_per_fio[j + i][-2])
-            # транзакции производил один и тот же человек
-            same_person = passport == transactions_per_fio[j + i][1]
-            # разница между первой отклоненной и успешной транзакцией меньше или равна 20 минутам
-            time_diff = last_oper_date - oper_date
-            in20min = (time_diff.total_seconds() / 60) >= 20.0
-            # если все условия истина - добавляем строку с успешной операцией в values
-            if jm2 and oper_success and more_then_last and same_person and in20min:
-                values.append(transactions_per_fio[j + i][:-2])
-                i += j
-            else:
-                i += j
-        else:
-            i += 1
+    # проверяем каждую успешную операцию, перед которой есть достаточно операций
+    for i in range(AMOUNT_GUESS_REJECTS, len(transactions_per_card)):
+        row = transactions_per_card[i]
+        event_dt, card_num, amt, oper_result = row[0], row[-3], row[-2], row[-1]
+        if oper_result != "SUCCESS":
+            continue
+        chain = transactions_per_card[i - AMOUNT_GUESS_REJECTS : i]
+        # все предыдущие операции по той же карте и отклонены
+        same_card = all(prev[-3] == card_num for prev in chain)
+        all_rejected = all(prev[-1] == "REJECT" for prev in chain)
+        # каждая следующая сумма меньше предыдущей, включая успешную операцию
+        amounts = [prev[-2] for prev in chain] + [amt]
+        decreasing = all(a > b for a, b in zip(amounts, amounts[1:]))
+        # цепочка уложилась в заданное время
+        in_window = event_dt - chain[0][0] <= window
+        # если все условия истина - добавляем строку с успешной операцией в values
+        if same_card and all_rejected and decreasing and in_window:
+            values.append(row[:-3])
 
     # добавляем в rep_fraud мошеннические операции по подбору суммы
     insert_query = f"insert into {full_code}_rep_fraud values %s"
+    if skip_reported:
+        insert_query = f"""
+        insert into {full_code}_rep_fraud
+        select *
+        from (values %s) as trn(event_dt, passport, fio, phone, event_type, report_dt)
+        where {not_reported(full_code, "trn.event_dt", "trn.passport", "trn.event_type")}
+        """
     execute_values(curs, insert_query, values)
+
+
+def insert_rep_fraud_fused(
+    curs: cursor,
+    full_code: str,
+    load_date: str,
+    rules: list,
+    skip_reported: bool = False,
+) -> None:
+    """
+    Функция для заполнения таблицы с отчетами одним запросом по всем признакам.
+    Операции дня вместе с данными клиентов, городом терминала и датой попадания паспорта
+    в черный список читаются один раз. Город берется из версии терминала, действовавшей в день
+    операции, как в insert_city_change, но соединением с границами версий, а не подзапросом на строку, столбцы признаков с оконными функциями считаются
+    в том же проходе, строки всех типов добавляются одной вставкой
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        load_date (str) - дата загрузки\n
+        rules (list) - признаки мошеннических операций, объекты ReportRule\n
+        skip_reported (bool = False) (optional) - не добавлять операции признаков потоковой
+        проверки, уже попавшие в отчет\n
+
+    Returns:
+        None
+    """
+    if not rules:
+        return
+    # операции до начала дня нужны признакам, которые сравнивают операцию с предыдущими
+    lookback = max(
+        (timedelta_from_interval(rule.lookback) for rule in rules if rule.lookback),
+        default=timedelta(0),
+    )
+    columns = "".join(
+        f",\n\t\t\t\t{column}" for rule in rules for column in rule.columns
+    )
+    hits = []
+    for rule in rules:
+        condition = f"({rule.condition})"
+        if skip_reported and rule.streamed:
+            condition += " and " + not_reported(
+                full_code, "wnd.trans_date", "wnd.passport_num", f"'{rule.event_type}'"
+            )
+        hits.append(f"case when {condition} then '{rule.event_type}' end")
+    hits = ",\n\t\t\t\t".join(hits)
+    curs.execute(
+        f"""
+    insert into {full_code}_rep_fraud (
+        with day_transactions as (
+            select
+                trn.trans_id,
+                trn.trans_date,
+                trn.card_num,
+                trn.amt,
+                trn.oper_result,
+                trm.terminal_city,
+                cln.passport_num,
+                cln.fio,
+                cln.phone,
+                cln.passport_valid_to,
+                cln.account_valid_to,
+                blk.entry_dt as blacklisted_from
+            from
+                {TRANSACTIONS_JOIN_TABLES.format(full_code=full_code)}
+            left join (
+                select
+                    trim(passport_num) as passport_num,
+                    min(entry_dt) as entry_dt
+                from
+                    deit.anka_dwh_fact_passport_blacklist
+                group by
+                    trim(passport_num)
+            ) blk on blk.passport_num = trim(cln.passport_num)
+            left join (
+                select
+                    terminal_id,
+                    terminal_city,
+                    effective_from,
+                    lead(effective_from) over (
+                        partition by terminal_id order by effective_from
+                    ) as next_from
+                from
+                    deit.anka_dwh_dim_terminals_hist
+            ) trm on trm.terminal_id = trn.terminal
+                and trm.effective_from < trn.trans_date::date + interval '1 day'
+                and (trm.next_from is null or trm.next_from >= trn.trans_date::date + interval '1 day')
+            where
+                trn.trans_date >= {day_start(load_date)} - interval '{int(lookback.total_seconds())} seconds'
+                and trn.trans_date < {day_start(load_date)} + interval '1 day'
+        ),
+        windowed as (
+            select
+                *{columns}
+            from
+                day_transactions
+            window card_window as (partition by card_num order by trans_date)
+        )
+        select
+            wnd.trans_date as event_dt,
+            wnd.passport_num as passport,
+            wnd.fio,
+            wnd.phone,
+            rul.event_type,
+            current_timestamp as report_dt
+        from
+            windowed wnd
+        cross join lateral unnest(array[
+                {hits}
+            ]) as rul(event_type)
+        where
+            {in_day('wnd.trans_date', load_date)}
+            and rul.event_type is not null
+    )
+    """
+    )
+
+
+def select_terminal_cities(curs: cursor, target_name: str) -> dict:
+    """
+    Функция для получения городов всех версий терминалов, чтобы город операции брался
+    из версии, действовавшей в день операции, как в insert_city_change.
+    Если таблицы терминалов еще нет, возвращает пустой словарь
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        target_name (str) - название SCD2 таблицы терминалов\n
+
+    Returns:
+        dict - начала версий по возрастанию и города версий по идентификатору терминала
+    """
+    if table_kind(curs, target_name) is None:
+        return {}
+    curs.execute(
+        f"""
+        select
+            terminal_id,
+            array_agg(effective_from order by effective_from),
+            array_agg(terminal_city order by effective_from)
+        from {target_name}
+        group by terminal_id
+        """
+    )
+    return {terminal: (froms, cities) for terminal, froms, cities in curs.fetchall()}
+
+
+def insert_stream_hits(curs: cursor, full_code: str, hits: list) -> int:
+    """
+    Функция для добавления в отчет операций, найденных потоковой проверкой.
+    Операции, уже попавшие в отчет, повторно не добавляются, поэтому файл можно прочитать заново
+
+    Args:
+        curs (cursor) - объект курсора базы данных\n
+        full_code (str) - полный код для таблицы\n
+        hits (list) - время операции, номер карты и тип мошеннической операции\n
+
+    Returns:
+        int - количество добавленных строк
+    """
+    # данные клиента берутся так же, как в TRANSACTIONS_JOIN_TABLES
+    execute_values(
+        curs,
+        f"""
+        insert into {full_code}_rep_fraud
+        select
+            hit.trans_date as event_dt,
+            cln.passport_num as passport,
+            cln.fio as fio,
+            cln.phone as phone,
+            hit.event_type,
+            current_timestamp as report_dt
+        from
+            (values %s) as hit(trans_date, card_num, event_type)
+        inner join
+            {full_code}_dwh_dim_card_clients cln on cln.card_num = hit.card_num
+        where
+            {not_reported(full_code, "hit.trans_date", "cln.passport_num", "hit.event_type")}
+        """,
+        hits,
+        template="(%s::timestamp, %s, %s)",
+        # одной страницей, чтобы rowcount учитывал все строки
+        page_size=max(len(hits), 1),
+    )
+    return curs.rowcount
+
+
+def timedelta_from_interval(interval: str) -> timedelta:
+    """
+    Функция для преобразования интервала вида '20 minutes' в timedelta
+
+    Args:
+        interval (str) - интервал в формате postgres с одной единицей измерения
+
+    Returns:
+        timedelta - интервал
+    """
+    amount, unit = interval.split()
+    unit = unit if unit.endswith("s") else unit + "s"
+    return timedelta(**{unit: int(amount)})
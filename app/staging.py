@@ -0,0 +1,160 @@
+import re
+
+import sql_scripts as sql
+from psycopg2.extensions import cursor
+
+# названия типов, которые format_type возвращает вместо сокращений из описаний файлов
+TYPE_ALIASES = {
+    "varchar": "character varying",
+    "char": "character",
+    "bpchar": "character",
+    "decimal": "numeric",
+    "int": "integer",
+    "int4": "integer",
+    "int8": "bigint",
+    "int2": "smallint",
+    "float": "double precision",
+    "float8": "double precision",
+    "float4": "real",
+    "bool": "boolean",
+    "timestamp": "timestamp without time zone",
+    "timestamptz": "timestamp with time zone",
+    "time": "time without time zone",
+}
+
+
+def type_name(dtype: str) -> str:
+    """
+    Функция для приведения названия типа к виду, в котором его возвращает format_type,
+    например decimal(8, 3) к numeric(8,3). Нераспознанный тип в худшем случае
+    приводит к пересозданию таблицы
+
+    Args:
+        dtype (str) - тип данных
+
+    Returns:
+        str - название типа как в table_columns
+    """
+    dtype = re.sub(r"\s+", " ", dtype.strip().lower())
+    dtype = re.sub(r"\s*\(\s*", "(", dtype)
+    dtype = re.sub(r"\s*,\s*", ",", dtype)
+    dtype = re.sub(r"\s*\)", ")", dtype)
+    if "zone" in dtype:
+        # полное название с часовым поясом уже совпадает с format_type
+        return dtype
+    base, _, modifier = dtype.partition("(")
+    modifier = f"({modifier}" if modifier else ""
+    if base in ("timestamp", "time", "timestamptz"):
+        # точность пишется до указания часового пояса: timestamp(3) without time zone
+        zone = " with time zone" if base == "timestamptz" else " without time zone"
+        return f"{base.replace('tz', '')}{modifier}{zone}"
+    if base in ("char", "bpchar", "character") and not modifier:
+        modifier = "(1)"
+    return TYPE_ALIASES.get(base, base) + modifier
+
+
+class StagingArea:
+    def __init__(self, curs: cursor, schema: str, code: str, kind: str) -> None:
+        """
+        Класс для управления временными таблицами загрузки.
+        Таблицы создаются один раз как unlogged или temp и переиспользуются через truncate,
+        поэтому ежедневная загрузка не создает и не удаляет таблицы
+
+        Args:
+            curs (cursor) - курсор для базы данных\n
+            schema (str) - название схемы для unlogged таблиц\n
+            code (str) - личный четырехбуквенный код\n
+            kind (str) - вид таблиц: unlogged или temp\n
+
+        Returns:
+            None
+        """
+        if kind not in ("unlogged", "temp"):
+            raise ValueError(f"Вид временных таблиц {kind} не поддерживается")
+        self.curs = curs
+        self.kind = kind
+        # temp таблицы живут в схеме сессии, unlogged - в схеме для загрузки таблиц
+        self.stg_code = f"pg_temp.{code}" if kind == "temp" else f"{schema}.{code}"
+        # таблицы, подготовленные в этой сессии, и их поля
+        self.tables = {}
+
+    def table_name(self, name: str, table_name: str) -> str:
+        """
+        Функция для получения полного названия временной таблицы
+
+        Args:
+            name (str) - вид временной таблицы, например source\n
+            table_name (str) - название таблицы\n
+
+        Returns:
+            str - полное название временной таблицы
+        """
+        return f"{self.stg_code}_stg_{name}_{table_name}"
+
+    def prepare(self, name: str, table_name: str, fields_dtype: dict) -> str:
+        """
+        Функция для подготовки пустой временной таблицы. Таблица создается только если ее нет
+        или если ее поля не совпадают с нужными, иначе очищается через truncate
+
+        Args:
+            name (str) - вид временной таблицы, например source\n
+            table_name (str) - название таблицы\n
+            fields_dtype (dict) - словарь с полями и типами данных\n
+
+        Returns:
+            str - полное название временной таблицы
+        """
+        stg_name = self.table_name(name, table_name)
+        fields_dts = [(field, dtype) for field, dtype in fields_dtype.items()]
+        if self.tables.get(stg_name) != fields_dts:
+            self.create(stg_name, fields_dts)
+        else:
+            sql.truncate(self.curs, [stg_name])
+        return stg_name
+
+    def create(self, stg_name: str, fields_dts: list) -> None:
+        """
+        Функция для создания временной таблицы. Таблица, оставшаяся от прошлых запусков,
+        переиспользуется, если у нее те же поля с теми же типами и вид, иначе пересоздается
+
+        Args:
+            stg_name (str) - полное название временной таблицы\n
+            fields_dts (list) - список пар из поля и типа данных\n
+
+        Returns:
+            None
+        """
+        existing = sql.table_columns(self.curs, stg_name)
+        expected = [(field.lower(), type_name(dtype)) for field, dtype in fields_dts]
+        # обычные таблицы от прошлых версий загрузки пересоздаются как unlogged
+        persistence = sql.table_persistence(self.curs, stg_name)
+        if existing == expected and persistence == self.kind[0]:
+            sql.truncate(self.curs, [stg_name])
+        else:
+            if existing:
+                sql.drop_table(self.curs, stg_name)
+            fields_dts_str = ",\n\t".join(
+                f"{field} {dtype}" for field, dtype in fields_dts
+            )
+            sql.create_stg_table(self.curs, stg_name, fields_dts_str, self.kind)
+        self.tables[stg_name] = fields_dts
+
+    def reset(self) -> None:
+        """
+        Функция для сброса списка подготовленных таблиц после отката транзакции.
+        При следующей подготовке таблицы проверяются по каталогу базы
+
+        Returns:
+            None
+        """
+        self.tables.clear()
+
+    def clear(self) -> None:
+        """
+        Функция для очистки всех временных таблиц, подготовленных в этой сессии
+
+        Returns:
+            None
+        """
+        if self.tables:
+            sql.truncate(self.curs, list(self.tables))
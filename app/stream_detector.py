@@ -0,0 +1,342 @@
+import argparse
+import signal
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from datetime import timedelta
+from threading import Event
+
+import pandas as pd
+import sql_scripts as sql
+from db_conn import init_db_conn
+from feed_specs import get_feed_spec
+from fraud_detecter import FraudDetecter
+from metrics import METRICS
+from settings import (
+    CODE,
+    DIM_PREFIX,
+    METRICS_JSONL,
+    METRICS_TEXTFILE,
+    SCHEMA,
+    SOURSE_SCHEMA,
+    STREAM_BATCH_ROWS,
+    STREAM_MAX_CARDS,
+    STREAM_POLL_INTERVAL,
+    STREAM_REFRESH_INTERVAL,
+)
+
+# окна признаков из sql_scripts, чтобы потоковая проверка совпадала с ежедневным отчетом
+CITY_WINDOW = sql.timedelta_from_interval(sql.CITY_CHANGE_WINDOW)
+GUESS_WINDOW = sql.timedelta_from_interval(sql.AMOUNT_GUESS_WINDOW)
+# состояние карты без операций дольше обоих окон уже не влияет на проверку
+STATE_TTL = max(CITY_WINDOW, GUESS_WINDOW)
+
+
+def terminal_city(versions: tuple, trans_date):
+    """
+    Функция для получения города терминала из версии, действовавшей в день операции.
+    Как в insert_city_change, берется последняя версия, начавшаяся до конца дня операции
+
+    Args:
+        versions (tuple) - начала версий по возрастанию и города версий или None\n
+        trans_date - время операции\n
+
+    Returns:
+        str | None - город терминала или None, если версии на день операции нет
+    """
+    if versions is None:
+        return None
+    froms, cities = versions
+    day_start = trans_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    i = bisect_left(froms, day_start + timedelta(days=1))
+    return cities[i - 1] if i else None
+
+
+class CardState:
+    """Состояние карты: время и город последней операции и последние операции для подбора суммы"""
+
+    __slots__ = ("last_dt", "last_city", "chain")
+
+    def __init__(self) -> None:
+        self.last_dt = None
+        self.last_city = None
+        # время, сумма и результат последних операций, не больше AMOUNT_GUESS_REJECTS
+        self.chain = deque(maxlen=sql.AMOUNT_GUESS_REJECTS)
+
+
+class CardWindows:
+    def __init__(self, max_cards: int) -> None:
+        """
+        Класс для хранения состояний карт в памяти. Карты хранятся в порядке последней операции:
+        карты без операций дольше STATE_TTL и самые давние карты сверх max_cards вытесняются
+
+        Args:
+            max_cards (int) - максимальное количество карт в памяти
+
+        Returns:
+            None
+        """
+        self.max_cards = max_cards
+        self.cards = OrderedDict()
+        # время самой поздней обработанной операции
+        self.watermark = None
+        self.evicted = 0
+
+    def process(self, trans_date, card_num: str, city: str, amt, oper_result: str):
+        """
+        Функция для проверки операции по состоянию карты и обновления состояния.
+        Условия те же, что в insert_city_change и insert_amount_guess_sql
+
+        Args:
+            trans_date - время операции\n
+            card_num (str) - номер карты\n
+            city (str) - город терминала или None\n
+            amt - сумма операции\n
+            oper_result (str) - результат операции\n
+
+        Returns:
+            list | None - типы найденных мошеннических операций или None для операции
+            раньше последней операции карты
+        """
+        state = self.cards.get(card_num)
+        if state is None:
+            state = self.cards[card_num] = CardState()
+        elif state.last_dt is not None and trans_date < state.last_dt:
+            # операция пришла не по порядку. ее проверит ежедневный отчет
+            return None
+        self.cards.move_to_end(card_num)
+        if self.watermark is None or trans_date > self.watermark:
+            self.watermark = trans_date
+
+        hits = []
+        # смена города относительно предыдущей операции по карте
+        if (
+            city is not None
+            and state.last_city is not None
+            and city != state.last_city
+            and trans_date - state.last_dt <= CITY_WINDOW
+        ):
+            hits.append(sql.CITY_CHANGE_EVENT)
+
+        # успешная операция после отклоненных с убывающими суммами в пределах окна и дня
+        chain = state.chain
+        if (
+            oper_result == "SUCCESS"
+            and len(chain) == chain.maxlen
+            and all(result == "REJECT" for _, _, result in chain)
+            and all(a[1] > b[1] for a, b in zip(chain, list(chain)[1:]))
+            and chain[-1][1] > amt
+            and trans_date - chain[0][0] <= GUESS_WINDOW
+            and chain[0][0].date() == trans_date.date()
+        ):
+            hits.append(sql.AMOUNT_GUESS_EVENT)
+
+        state.last_dt, state.last_city = trans_date, city
+        chain.append((trans_date, amt, oper_result))
+        return hits
+
+    def evict(self) -> None:
+        """Функция для вытеснения карт без операций дольше STATE_TTL и карт сверх max_cards"""
+        while self.cards:
+            card_num, state = next(iter(self.cards.items()))
+            if (
+                len(self.cards) <= self.max_cards
+                and self.watermark - state.last_dt <= STATE_TTL
+            ):
+                break
+            self.cards.popitem(last=False)
+            self.evicted += 1
+
+
+def micro_batches(file_path: str, follow: bool, stop: Event):
+    """
+    Генератор порций строк файла операций. Строки без перевода строки в конце файла
+    ждут дозаписи, заголовок пропускается
+
+    Args:
+        file_path (str) - путь к файлу\n
+        follow (bool) - ждать новые строки после конца файла\n
+        stop (Event) - событие остановки\n
+
+    Returns:
+        Iterator[list] - порции строк, не больше STREAM_BATCH_ROWS
+    """
+    batch, pending, header = [], "", True
+    with open(file_path, encoding="utf-8") as f:
+        while not stop.is_set():
+            chunk = f.readline()
+            if chunk:
+                pending += chunk
+                if not pending.endswith("\n"):
+                    continue
+                line, pending = pending.rstrip("\r\n"), ""
+                if header:
+                    header = False
+                elif line:
+                    batch.append(line)
+                if len(batch) >= STREAM_BATCH_ROWS:
+                    yield batch
+                    batch = []
+                continue
+
+            # конец файла: отдаем накопленное и ждем дозаписи
+            if not follow and pending and not header:
+                batch.append(pending.rstrip("\r\n"))
+                pending = ""
+            if batch:
+                yield batch
+                batch = []
+            if not follow:
+                return
+            stop.wait(STREAM_POLL_INTERVAL)
+
+
+class StreamDetector:
+    def __init__(self, fd: FraudDetecter) -> None:
+        """
+        Класс для потоковой проверки операций порциями по мере дозаписи файла.
+        Смена города и подбор суммы ищутся по состоянию карт в памяти, найденные операции
+        сразу фиксируются в отчете
+
+        Args:
+            fd (FraudDetecter) - объект с подключением к базе данных
+
+        Returns:
+            None
+        """
+        self.fd = fd
+        self.spec = get_feed_spec("transactions")
+        self.windows = CardWindows(STREAM_MAX_CARDS)
+        self.terminals = {}
+        self.terminals_loaded_at = None
+
+    def refresh_lookups(self) -> None:
+        """
+        Функция для обновления версий городов терминалов и данных клиентов по картам
+        раз в STREAM_REFRESH_INTERVAL секунд
+        """
+        now = time.monotonic()
+        if (
+            self.terminals_loaded_at is not None
+            and now - self.terminals_loaded_at < STREAM_REFRESH_INTERVAL
+        ):
+            return
+        self.terminals = sql.select_terminal_cities(
+            self.fd.curs, f"{self.fd.full_code}_{DIM_PREFIX}_terminals_hist"
+        )
+        self.fd.refresh_card_clients()
+        self.fd.commit()
+        self.terminals_loaded_at = now
+
+    def parse(self, lines: list) -> pd.DataFrame:
+        """Функция для преобразования строк файла в датафрейм с типизированными столбцами"""
+        fields = self.spec.fields
+        rows = []
+        for line in lines:
+            values = line.split(self.spec.delimiter)
+            if len(values) != len(fields):
+                print(f"Строка пропущена: ожидалось {len(fields)} полей: {line}")
+                continue
+            rows.append(values)
+        df = pd.DataFrame(rows, columns=fields, dtype=str)
+        return self.spec.convert(df).sort_values("trans_date", kind="stable")
+
+    def process_batch(self, lines: list) -> None:
+        """
+        Функция для проверки порции строк и записи найденных операций в отчет
+
+        Args:
+            lines (list) - строки файла операций
+
+        Returns:
+            None
+        """
+        start = time.monotonic()
+        with METRICS.stage("stream_batch", "transactions"):
+            self.refresh_lookups()
+            df = self.parse(lines)
+            hits, late = [], 0
+            for trans_date, card_num, terminal, amt, oper_result in zip(
+                df["trans_date"],
+                df["card_num"],
+                df["terminal"],
+                df["amt"],
+                df["oper_result"],
+            ):
+                trans_date = trans_date.to_pydatetime()
+                found = self.windows.process(
+                    trans_date,
+                    card_num,
+                    terminal_city(self.terminals.get(terminal), trans_date),
+                    amt,
+                    oper_result,
+                )
+                if found is None:
+                    late += 1
+                    continue
+                hits.extend((trans_date, card_num, event_type) for event_type in found)
+            self.windows.evict()
+
+            inserted = 0
+            if hits:
+                self.fd.init_rep_fraud(
+                    "(values "
+                    + ", ".join(f"(timestamp '{hit[0]}')" for hit in hits)
+                    + ") as hits(event_dt)"
+                )
+                inserted = sql.insert_stream_hits(self.fd.curs, self.fd.full_code, hits)
+            self.fd.commit()
+            METRICS.add(rows=len(df))
+        METRICS.flush(METRICS_JSONL, METRICS_TEXTFILE)
+
+        print(
+            f"Проверено операций: {len(df)}, найдено {len(hits)}, добавлено в отчет {inserted}, "
+            f"не по порядку {late}, карт в памяти {len(self.windows.cards)}, "
+            f"вытеснено {self.windows.evicted}, {time.monotonic() - start:.3f} с"
+        )
+
+    def run(self, file_path: str, follow: bool, stop: Event) -> None:
+        """
+        Функция для проверки файла операций порциями
+
+        Args:
+            file_path (str) - путь к файлу\n
+            follow (bool) - ждать дозаписи файла до остановки\n
+            stop (Event) - событие остановки\n
+
+        Returns:
+            None
+        """
+        for lines in micro_batches(file_path, follow, stop):
+            self.process_batch(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Потоковая проверка операций: смена города и подбор суммы по мере дозаписи файла"
+    )
+    parser.add_argument(
+        "files", nargs="+", help="файлы операций, проверяются по порядку"
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="после конца последнего файла ждать новые строки до остановки",
+    )
+    args = parser.parse_args()
+
+    # по SIGTERM проверка останавливается после текущей порции
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    conn, curs = init_db_conn()
+    with FraudDetecter(
+        conn, curs, CODE, SCHEMA, SOURSE_SCHEMA, init_tables=False
+    ) as fd:
+        detector = StreamDetector(fd)
+        try:
+            for i, file_path in enumerate(args.files):
+                follow = args.follow and i == len(args.files) - 1
+                detector.run(file_path, follow, stop)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,171 @@
+import os
+import shutil
+import time
+from datetime import datetime
+
+from feed_specs import FEED_SPECS, get_file_spec
+
+# порядок типов файлов внутри дня
+FEED_ORDER = {name: i for i, name in enumerate(FEED_SPECS)}
+
+
+def file_date(file_name: str) -> str:
+    """Функция для получения даты DDMMYYYY из названия файла вида table_DDMMYYYY.ext"""
+    return file_name.rsplit("_", 1)[1].split(".")[0]
+
+
+def parse_date(fdate: str) -> datetime:
+    """Функция для перевода даты DDMMYYYY в datetime для сравнения дат"""
+    return datetime.strptime(fdate, "%d%m%Y")
+
+
+def scan_files(data_dir: str, settle_seconds: float = 0, ignored: set = None) -> list:
+    """
+    Функция для получения файлов поддерживаемых типов в папке выгрузки
+
+    Args:
+        data_dir (str) - папка выгрузки\n
+        settle_seconds (float = 0) (optional) - сколько секунд файл не должен меняться,
+        чтобы не прочитать файл, который еще копируется\n
+        ignored (set = None) (optional) - уже выведенные неподдерживаемые файлы\n
+
+    Returns:
+        list - названия файлов
+    """
+    ignored = set() if ignored is None else ignored
+    now = time.time()
+    files = []
+    for file_name in os.listdir(data_dir):
+        try:
+            get_file_spec(file_name)
+            parse_date(file_date(file_name))
+        except (ValueError, IndexError):
+            if file_name not in ignored:
+                ignored.add(file_name)
+                print(f"Файл {file_name} пропущен: неизвестный тип или дата")
+            continue
+        if now - os.path.getmtime(os.path.join(data_dir, file_name)) < settle_seconds:
+            continue
+        files.append(file_name)
+    return files
+
+
+def group_by_date(files: list) -> list:
+    """
+    Функция для группировки файлов по дням. Дни сортируются по дате, файлы внутри дня
+    по порядку типов файлов. Пропуск файла одного типа не сдвигает остальные дни
+
+    Args:
+        files (list) - названия файлов
+
+    Returns:
+        list - дни, каждый день - список с названиями файлов и датой загрузки
+    """
+    days = {}
+    for file_name in files:
+        fdate = file_date(file_name)
+        days.setdefault(fdate, []).append((file_name, fdate))
+    return [
+        sorted(days[fdate], key=lambda item: FEED_ORDER[get_file_spec(item[0]).name])
+        for fdate in sorted(days, key=parse_date)
+    ]
+
+
+def missing_feeds(date_group: list) -> list:
+    """Функция для получения типов файлов, которых нет в дне"""
+    present = {get_file_spec(file_name).name for file_name, _ in date_group}
+    return [name for name in FEED_SPECS if name not in present]
+
+
+def last_archived_date(archive_dir: str) -> datetime:
+    """Функция для получения даты последнего загруженного дня по файлам архива"""
+    if not os.path.exists(archive_dir):
+        return None
+    dates = []
+    for file_name in os.listdir(archive_dir):
+        try:
+            dates.append(parse_date(file_date(file_name.removesuffix(".backup"))))
+        except (ValueError, IndexError):
+            continue
+    return max(dates, default=None)
+
+
+class DayWatcher:
+    def __init__(
+        self,
+        data_dir: str,
+        archive_dir: str,
+        late_dir: str,
+        settle_seconds: float,
+        late_timeout: float,
+    ) -> None:
+        """
+        Класс для отслеживания папки выгрузки в режиме демона. День отдается на загрузку,
+        когда пришли файлы всех типов. Дни загружаются строго по порядку дат: неполный день
+        задерживает следующие, пока не истечет время ожидания, после чего загружается
+        без недостающих файлов. Файлы за уже загруженные дни переносятся в папку опоздавших
+
+        Args:
+            data_dir (str) - папка выгрузки\n
+            archive_dir (str) - папка архива, по ней определяется последний загруженный день\n
+            late_dir (str) - папка для опоздавших файлов\n
+            settle_seconds (float) - сколько секунд файл не должен меняться перед чтением\n
+            late_timeout (float) - сколько секунд ждать недостающие файлы дня\n
+
+        Returns:
+            None
+        """
+        self.data_dir = data_dir
+        self.late_dir = late_dir
+        self.settle_seconds = settle_seconds
+        self.late_timeout = late_timeout
+        self.last_loaded = last_archived_date(archive_dir)
+        # время появления первого файла дня
+        self.first_seen = {}
+        self.ignored = set()
+
+    def poll(self) -> list:
+        """
+        Функция для проверки папки выгрузки
+
+        Returns:
+            list - дни, готовые к загрузке, по порядку дат
+        """
+        now = time.time()
+        ready = []
+        files = scan_files(self.data_dir, self.settle_seconds, self.ignored)
+        for date_group in group_by_date(files):
+            fdate = date_group[0][1]
+            if self.last_loaded and parse_date(fdate) <= self.last_loaded:
+                self.move_late(date_group)
+                continue
+            self.first_seen.setdefault(fdate, now)
+            missing = missing_feeds(date_group)
+            if missing:
+                if now - self.first_seen[fdate] < self.late_timeout:
+                    # следующие дни ждут, чтобы не нарушить порядок загрузки
+                    break
+                print(
+                    f"День {fdate} загружается без файлов {', '.join(missing)}: "
+                    f"не пришли за {self.late_timeout:.0f} с"
+                )
+            ready.append(date_group)
+        return ready
+
+    def loaded(self, date_group: list) -> None:
+        """Функция для отметки загруженного дня"""
+        fdate = date_group[0][1]
+        self.first_seen.pop(fdate, None)
+        self.last_loaded = parse_date(fdate)
+
+    def move_late(self, date_group: list) -> None:
+        """Функция для переноса файлов за уже загруженный день в папку опоздавших"""
+        os.makedirs(self.late_dir, exist_ok=True)
+        for file_name, fdate in date_group:
+            shutil.move(
+                os.path.join(self.data_dir, file_name),
+                os.path.join(self.late_dir, file_name),
+            )
+            print(
+                f"Файл {file_name} опоздал: день {fdate} уже загружен, файл перемещен в {self.late_dir}"
+            )
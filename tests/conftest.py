@@ -0,0 +1,5 @@
+import os
+import sys
+
+# модули загрузки импортируют друг друга по имени, как при запуске из папки app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "app"))
@@ -0,0 +1,126 @@
+import os
+from datetime import date
+
+import benchmark
+import fraud_detecter
+import pytest
+from db_conn import init_db_conn
+from fraud_detecter import FraudDetecter
+from generate_data import FRAUD_TYPES, Generator, write_bank
+from settings import BENCHMARK_SOURSE_SCHEMA, CODE, SCHEMA
+
+# тесты пересоздают таблицы с личным кодом в SCHEMA и схему BENCHMARK_SOURSE_SCHEMA,
+# поэтому запускаются только явно и только на локальной базе
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("FRAUD_DB_TESTS"),
+    reason="сравнение способов загрузки на базе запускается с FRAUD_DB_TESTS=1",
+)
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    """Сгенерированные файлы выгрузки за несколько дней и клиенты банка"""
+    workdir = tmp_path_factory.mktemp("fraud_engines")
+    generated = Generator(
+        start=date(2021, 3, 1),
+        days=4,
+        transactions=3_000,
+        clients=500,
+        terminals=200,
+        churn=0.1,
+        fraud=3,
+    ).generate(str(workdir / "data"))
+    conn, curs = init_db_conn()
+    try:
+        write_bank(curs, BENCHMARK_SOURSE_SCHEMA, generated)
+        conn.commit()
+    finally:
+        conn.close()
+    return workdir, generated
+
+
+def load(monkeypatch, dataset, **overrides) -> dict:
+    """
+    Функция для загрузки всех дней в пустые таблицы с заданными настройками загрузки
+
+    Args:
+        monkeypatch - фикстура pytest\n
+        dataset (tuple) - рабочая папка и сгенерированные данные\n
+        overrides - настройки fraud_detecter, например SCD_ENGINE\n
+
+    Returns:
+        dict - строки таблиц терминалов, черного списка и отчета
+    """
+    workdir, generated = dataset
+    for name, value in overrides.items():
+        monkeypatch.setattr(fraud_detecter, name, value)
+    monkeypatch.chdir(workdir)
+
+    conn, curs = init_db_conn()
+    benchmark.reset_tables(curs)
+    curs.execute(f"create schema if not exists {SCHEMA}")
+    conn.commit()
+    with FraudDetecter(conn, curs, CODE, SCHEMA, BENCHMARK_SOURSE_SCHEMA) as fd:
+        benchmark.run_days(fd, generated.files)
+        full_code = fd.full_code
+        # время загрузки внутри дня отличается между запусками, сравниваются даты версий
+        curs.execute(
+            f"""
+            select
+                terminal_id, terminal_type, terminal_city, terminal_address, deleted_flg,
+                effective_from::date, effective_to::date
+            from {full_code}_dwh_dim_terminals_hist
+            order by 1, 6, 5
+            """
+        )
+        terminals = curs.fetchall()
+        curs.execute(
+            f"""
+            select passport_num, entry_dt, deleted_flg, effective_from::date, effective_to::date
+            from {full_code}_dwh_fact_passport_blacklist
+            order by 1, 4, 3
+            """
+        )
+        blacklist = curs.fetchall()
+        curs.execute(
+            f"""
+            select event_dt, passport, fio, phone, event_type
+            from {full_code}_rep_fraud
+            order by 1, 2, 5
+            """
+        )
+        report = curs.fetchall()
+        recall = benchmark.recall(curs, full_code, generated.planted)
+    return {
+        "terminals": terminals,
+        "blacklist": blacklist,
+        "report": report,
+        "recall": recall,
+    }
+
+
+def test_scd_engines_match(monkeypatch, dataset):
+    tables = load(monkeypatch, dataset, SCD_ENGINE="tables")
+    hash_diff = load(
+        monkeypatch,
+        dataset,
+        SCD_ENGINE="hash_diff",
+        FINGERPRINT_FEEDS=("terminals", "passport_blacklist"),
+    )
+    # за дни терминалы меняют адреса, закрываются и открываются
+    assert len({row[0] for row in tables["terminals"]}) < len(tables["terminals"])
+    assert hash_diff["terminals"] == tables["terminals"]
+    assert hash_diff["blacklist"] == tables["blacklist"]
+    assert hash_diff["report"] == tables["report"]
+
+
+def test_amount_guess_modes_match(monkeypatch, dataset):
+    in_sql = load(monkeypatch, dataset, AMOUNT_GUESS_MODE="sql")
+    in_python = load(monkeypatch, dataset, AMOUNT_GUESS_MODE="python")
+    assert in_python["report"] == in_sql["report"]
+
+    # заложенные цепочки найдены, цепочки длиннее окна признака в отчет не попали
+    amount = in_sql["recall"]["amount"]
+    assert amount["recall"] == 1
+    assert amount["extra"] == 0
+    assert any(row[4] == FRAUD_TYPES["amount"] for row in in_sql["report"])
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+from fingerprints import diff, row_hashes
+
+FIELDS = ["terminal_id", "terminal_city", "amt"]
+
+
+def snapshot(rows: list) -> pd.DataFrame:
+    """Функция для создания снимка с полями FIELDS"""
+    return pd.DataFrame(rows, columns=FIELDS)
+
+
+def previous_hashes(df: pd.DataFrame) -> dict:
+    """Функция для получения хэшей снимка по ключу, как их сохраняет save_fingerprints"""
+    return dict(zip(df["terminal_id"].astype(str), row_hashes(df, FIELDS)))
+
+
+def test_diff_new_changed_unchanged_deleted():
+    before = snapshot(
+        [("T1", "Москва", 1.5), ("T2", "Тверь", 2.0), ("T3", "Омск", 3.0)]
+    )
+    after = snapshot(
+        [("T1", "Москва", 1.5), ("T2", "Казань", 2.0), ("T4", "Сочи", 4.0)]
+    )
+    delta, deleted = diff(
+        after, "terminal_id", row_hashes(after, FIELDS), previous_hashes(before)
+    )
+    assert list(delta["terminal_id"]) == ["T2", "T4"]
+    assert deleted == ["T3"]
+
+
+def test_diff_does_not_change_source_frame():
+    df = snapshot([("T1", "Москва", 1.5)])
+    delta, _ = diff(df, "terminal_id", row_hashes(df, FIELDS), {})
+    delta.loc[:, "terminal_city"] = "Тверь"
+    assert df.loc[0, "terminal_city"] == "Москва"
+
+
+def test_diff_same_snapshot_is_empty():
+    df = snapshot([("T1", "Москва", 1.5), ("T2", None, np.nan)])
+    delta, deleted = diff(
+        df, "terminal_id", row_hashes(df, FIELDS), previous_hashes(df)
+    )
+    assert delta.empty
+    assert deleted == []
+
+
+def test_row_hashes_missing_values():
+    df = snapshot(
+        [
+            ("T1", None, np.nan),
+            ("T1", np.nan, None),
+            ("T1", "nan", np.nan),
+            ("T1", "", np.nan),
+            ("T1", "None", np.nan),
+        ]
+    )
+    hashes = list(row_hashes(df, FIELDS))
+    # пропуск хэшируется одинаково независимо от представления в pandas
+    assert hashes[0] == hashes[1]
+    # и отличается от строк, похожих на пропуск
+    assert len(set(hashes[1:])) == 4
+
+
+def test_row_hashes_missing_timestamp():
+    df = pd.DataFrame(
+        {
+            "trans_id": ["1", "1"],
+            "trans_date": pd.to_datetime([None, "2021-03-01 10:00:00"]),
+        }
+    )
+    first, second = row_hashes(df, ["trans_id", "trans_date"])
+    assert first != second
+    assert (
+        first
+        == row_hashes(
+            pd.DataFrame({"trans_id": ["1"], "trans_date": [None]}),
+            ["trans_id", "trans_date"],
+        ).iloc[0]
+    )
+
+
+def test_row_hashes_field_boundaries():
+    df = pd.DataFrame({"a": ["ab", "a"], "b": ["c", "bc"]})
+    first, second = row_hashes(df, ["a", "b"])
+    assert first != second
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import sql_scripts as sql
+from stream_detector import STATE_TTL, CardWindows, terminal_city
+
+START = datetime(2021, 3, 1, 10, 0, 0)
+
+
+def guess_chain(windows: CardWindows, card_num: str, first_dt, last_dt) -> list:
+    """Функция для подачи трех отклоненных операций с убывающими суммами и успешной последней"""
+    step = (last_dt - first_dt) / sql.AMOUNT_GUESS_REJECTS
+    for n, amt in enumerate((500, 400, 300)):
+        assert windows.process(first_dt + step * n, card_num, "A", amt, "REJECT") == []
+    return windows.process(last_dt, card_num, "A", 200, "SUCCESS")
+
+
+def test_amount_guess_at_window_bound():
+    windows = CardWindows(max_cards=10)
+    hits = guess_chain(windows, "1", START, START + timedelta(minutes=20))
+    assert hits == [sql.AMOUNT_GUESS_EVENT]
+
+
+def test_amount_guess_past_window():
+    windows = CardWindows(max_cards=10)
+    hits = guess_chain(windows, "1", START, START + timedelta(minutes=20, seconds=1))
+    assert hits == []
+
+
+def test_amount_guess_longer_chain():
+    windows = CardWindows(max_cards=10)
+    windows.process(START, "1", "A", 900, "REJECT")
+    hits = guess_chain(
+        windows, "1", START + timedelta(minutes=1), START + timedelta(minutes=10)
+    )
+    assert hits == [sql.AMOUNT_GUESS_EVENT]
+
+
+def test_amount_guess_requires_decreasing_rejects():
+    windows = CardWindows(max_cards=10)
+    for n, amt in enumerate((300, 400, 200)):
+        windows.process(START + timedelta(minutes=n), "1", "A", amt, "REJECT")
+    assert windows.process(START + timedelta(minutes=5), "1", "A", 100, "SUCCESS") == []
+
+
+def test_amount_guess_across_midnight():
+    windows = CardWindows(max_cards=10)
+    first_dt = datetime(2021, 3, 1, 23, 55)
+    hits = guess_chain(windows, "1", first_dt, first_dt + timedelta(minutes=10))
+    assert hits == []
+
+
+def test_city_change_at_window_bound():
+    windows = CardWindows(max_cards=10)
+    assert windows.process(START, "1", "A", 100, "SUCCESS") == []
+    hits = windows.process(START + timedelta(hours=1), "1", "B", 100, "SUCCESS")
+    assert hits == [sql.CITY_CHANGE_EVENT]
+
+
+def test_city_change_past_window():
+    windows = CardWindows(max_cards=10)
+    windows.process(START, "1", "A", 100, "SUCCESS")
+    hits = windows.process(
+        START + timedelta(hours=1, seconds=1), "1", "B", 100, "SUCCESS"
+    )
+    assert hits == []
+
+
+def test_city_change_unknown_terminal():
+    windows = CardWindows(max_cards=10)
+    windows.process(START, "1", "A", 100, "SUCCESS")
+    assert (
+        windows.process(START + timedelta(minutes=1), "1", None, 100, "SUCCESS") == []
+    )
+
+
+def test_out_of_order_operation():
+    windows = CardWindows(max_cards=10)
+    windows.process(START, "1", "A", 100, "SUCCESS")
+    assert (
+        windows.process(START - timedelta(seconds=1), "1", "B", 100, "SUCCESS") is None
+    )
+
+
+def test_evict_over_max_cards():
+    windows = CardWindows(max_cards=2)
+    for n, card_num in enumerate(("1", "2", "3")):
+        windows.process(START + timedelta(seconds=n), card_num, "A", 100, "SUCCESS")
+    windows.evict()
+    assert list(windows.cards) == ["2", "3"]
+    assert windows.evicted == 1
+
+
+def test_evict_keeps_recently_used_card():
+    windows = CardWindows(max_cards=2)
+    windows.process(START, "1", "A", 100, "SUCCESS")
+    windows.process(START + timedelta(seconds=1), "2", "A", 100, "SUCCESS")
+    windows.process(START + timedelta(seconds=2), "1", "A", 100, "SUCCESS")
+    windows.process(START + timedelta(seconds=3), "3", "A", 100, "SUCCESS")
+    windows.evict()
+    assert list(windows.cards) == ["1", "3"]
+
+
+def test_evict_by_ttl():
+    windows = CardWindows(max_cards=10)
+    windows.process(START, "1", "A", 100, "SUCCESS")
+    windows.process(START + timedelta(seconds=1), "2", "A", 100, "SUCCESS")
+    windows.process(START + STATE_TTL + timedelta(seconds=1), "3", "A", 100, "SUCCESS")
+    windows.evict()
+    # карта 2 без операций ровно STATE_TTL остается
+    assert list(windows.cards) == ["2", "3"]
+
+
+def test_terminal_city_by_trans_date():
+    versions = ([datetime(2021, 3, 1), datetime(2021, 3, 3)], ["A", "B"])
+    assert terminal_city(versions, datetime(2021, 3, 2, 12)) == "A"
+    # версия дня действует с начала дня, как в insert_city_change
+    assert terminal_city(versions, datetime(2021, 3, 3, 0, 0, 1)) == "B"
+    assert terminal_city(versions, datetime(2021, 2, 28, 23)) is None
+    assert terminal_city(None, START) is None
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+import watcher
+from watcher import DayWatcher, group_by_date, missing_feeds
+
+DAY_FILES = ("transactions_{}.txt", "passport_blacklist_{}.xlsx", "terminals_{}.xlsx")
+
+
+def day_files(fdate: str, skip: str = None) -> list:
+    """Функция для получения названий файлов всех типов за день"""
+    return [
+        name.format(fdate)
+        for name in DAY_FILES
+        if skip is None or not name.startswith(skip)
+    ]
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    """Папки выгрузки, архива и опоздавших файлов"""
+    paths = {name: tmp_path / name for name in ("data", "archive", "late")}
+    paths["data"].mkdir()
+    paths["archive"].mkdir()
+    return paths
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время для проверки ожидания недостающих файлов"""
+    # время не раньше изменения созданных файлов, иначе они считаются недокопированными
+    now = {"value": watcher.time.time() + 1}
+    monkeypatch.setattr(watcher.time, "time", lambda: now["value"])
+    return now
+
+
+def put_files(data_dir, files: list) -> None:
+    """Функция для создания пустых файлов выгрузки"""
+    for file_name in files:
+        (data_dir / file_name).touch()
+
+
+def make_watcher(dirs, late_timeout: float = 60) -> DayWatcher:
+    """Функция для создания наблюдателя без ожидания стабилизации файлов"""
+    return DayWatcher(
+        str(dirs["data"]), str(dirs["archive"]), str(dirs["late"]), 0, late_timeout
+    )
+
+
+def test_group_by_date_orders_days_and_feeds():
+    files = day_files("02042021") + day_files("10032021")
+    days = group_by_date(files)
+    assert [day[0][1] for day in days] == ["10032021", "02042021"]
+    assert [file_name for file_name, _ in days[0]] == [
+        "terminals_10032021.xlsx",
+        "transactions_10032021.txt",
+        "passport_blacklist_10032021.xlsx",
+    ]
+
+
+def test_missing_feeds():
+    day = group_by_date(day_files("01032021", skip="terminals"))[0]
+    assert missing_feeds(day) == ["terminals"]
+
+
+def test_poll_releases_complete_days_in_order(dirs, clock):
+    put_files(dirs["data"], day_files("02032021") + day_files("01032021"))
+    ready = make_watcher(dirs).poll()
+    assert [day[0][1] for day in ready] == ["01032021", "02032021"]
+
+
+def test_poll_holds_following_days_until_timeout(dirs, clock):
+    put_files(
+        dirs["data"],
+        day_files("01032021", skip="passport_blacklist") + day_files("02032021"),
+    )
+    day_watcher = make_watcher(dirs, late_timeout=60)
+    assert day_watcher.poll() == []
+
+    clock["value"] += 59
+    assert day_watcher.poll() == []
+
+    # по истечении ожидания день загружается без недостающего файла
+    clock["value"] += 1
+    ready = day_watcher.poll()
+    assert [day[0][1] for day in ready] == ["01032021", "02032021"]
+    assert missing_feeds(ready[0]) == ["passport_blacklist"]
+
+
+def test_poll_moves_late_file(dirs, clock):
+    (dirs["archive"] / "transactions_02032021.txt.backup").touch()
+    put_files(dirs["data"], ["terminals_01032021.xlsx"] + day_files("03032021"))
+    ready = make_watcher(dirs).poll()
+    assert [day[0][1] for day in ready] == ["03032021"]
+    assert os.listdir(dirs["late"]) == ["terminals_01032021.xlsx"]
+    assert not (dirs["data"] / "terminals_01032021.xlsx").exists()
+
+
+def test_poll_moves_file_for_day_loaded_in_this_run(dirs, clock):
+    put_files(dirs["data"], day_files("01032021"))
+    day_watcher = make_watcher(dirs)
+    (day,) = day_watcher.poll()
+    for file_name, _ in day:
+        os.remove(dirs["data"] / file_name)
+    day_watcher.loaded(day)
+
+    put_files(dirs["data"], ["terminals_01032021.xlsx"])
+    assert day_watcher.poll() == []
+    assert os.listdir(dirs["late"]) == ["terminals_01032021.xlsx"]